@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Punto de entrada ASGI (asyncio) para /webhook, con el mismo contrato que main:app:
+formulario From/Body/To de Twilio -> TwiML, o user_id/message/tienda -> JSON.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app     (Procfile alternativo)
+
+Un solo proceso atiende muchas conexiones a la vez con el bucle de eventos:
+  - process_message (CPU) va a un pool de ASGI_HILOS hilos (4 por defecto).
+    No se usa un pool de procesos porque las sesiones viven en la memoria
+    del proceso (tiendas.py).
+  - Los mensajes de un mismo usuario se procesan en orden, uno detrás de otro.
+  - Con más de ASGI_MAX_PENDIENTES mensajes en curso (200 por defecto) se
+    responde 503 con Retry-After y Twilio reintenta; así la cola no crece sin límite.
+  - El ticket (PDF, impresora, correo a SendGrid) sale del camino de la
+    respuesta: printer.send_to_printer lo deja en un pool de E/S de
+    ASGI_HILOS_ES hilos (8 por defecto) y el cliente recibe la confirmación
+    sin esperar a SendGrid. Al apagar se esperan los envíos pendientes.
+
+El resto de rutas (/buscar, /carrito, /admin) siguen en main:app.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import main  # noqa: F401  misma configuración del worker (logs, memoria) que main:app
+import printer
+from logs import id_peticion
+from main import TWIML_ERROR, TWIML_INCOMPLETO, twiml
+from perfilado import perfilar
+from recordatorios import obtener_recordatorios
+from utils import process_message
+
+MAX_CUERPO = 64 * 1024
+
+_HILOS = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_HILOS", "4")), thread_name_prefix="asgi-mensajes")
+_HILOS_ES = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_HILOS_ES", "8")), thread_name_prefix="asgi-es")
+_MAX_PENDIENTES = int(os.getenv("ASGI_MAX_PENDIENTES", "200"))
+
+_pendientes = 0
+_turnos = {}         # user_id -> [asyncio.Lock, mensajes esperando o en curso]
+_en_segundo_plano = set()
+_bucle = None
+
+
+@contextlib.asynccontextmanager
+async def _turno(user_id: str):
+    """Un mensaje por usuario a la vez, en orden de llegada."""
+    turno = _turnos.setdefault(user_id, [asyncio.Lock(), 0])
+    turno[1] += 1
+    try:
+        async with turno[0]:
+            yield
+    finally:
+        turno[1] -= 1
+        if turno[1] == 0:
+            _turnos.pop(user_id, None)
+
+
+def _despachar(funcion, *args):
+    """printer.send_to_printer desde un hilo del pool: el envío sigue en el pool de E/S."""
+    _bucle.call_soon_threadsafe(_lanzar, contextvars.copy_context(), funcion, args)
+
+
+def _lanzar(contexto, funcion, args):
+    tarea = _bucle.run_in_executor(_HILOS_ES, contexto.run, funcion, *args)
+    _en_segundo_plano.add(tarea)
+    tarea.add_done_callback(_en_segundo_plano.discard)
+
+
+def _procesar(datos: dict, cabecera_perfil: str | None):
+    with perfilar(cabecera_perfil):
+        return process_message(datos)
+
+
+async def _leer_cuerpo(receive) -> bytes | None:
+    cuerpo = bytearray()
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            return None
+        cuerpo += mensaje.get("body", b"")
+        if len(cuerpo) > MAX_CUERPO:
+            return None
+        if not mensaje.get("more_body"):
+            return bytes(cuerpo)
+
+
+async def _responder(send, status: int, cuerpo: str, tipo: str, extra=()):
+    datos = cuerpo.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", tipo.encode()), (b"content-length", str(len(datos)).encode()), *extra],
+    })
+    await send({"type": "http.response.body", "body": datos})
+
+
+async def _webhook(scope, receive, send):
+    global _pendientes
+    cuerpo = await _leer_cuerpo(receive)
+    if cuerpo is None:
+        await _responder(send, 413, json.dumps({"error": "cuerpo demasiado grande"}), "application/json")
+        return
+    form = {k: v[0] for k, v in parse_qs(cuerpo.decode("utf-8", "replace")).items()}
+    cabeceras = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+
+    from_number = form.get("From") or form.get("user_id")
+    body = form.get("Body") or form.get("message")
+    logging.info("📩 Mensaje recibido: %s de %s", body, from_number)
+    if not from_number or not body:
+        logging.warning("⚠️ Datos incompletos recibidos en webhook")
+        await _responder(send, 200, TWIML_INCOMPLETO, "application/xml")
+        return
+
+    if _pendientes >= _MAX_PENDIENTES:
+        logging.warning("Webhook saturado (%d mensajes en curso): 503", _pendientes)
+        await _responder(send, 503, json.dumps({"error": "saturado"}), "application/json", [(b"retry-after", b"1")])
+        return
+
+    es_twilio = bool(form.get("From") and form.get("Body"))
+    datos = {
+        "user_id": from_number,
+        "message": body,
+        "tienda": form.get("To") if es_twilio else (form.get("To") or form.get("tienda")),
+    }
+    _pendientes += 1
+    try:
+        async with _turno(from_number):
+            # copy_context: el id de petición de logs.py llega al hilo del pool
+            contexto = contextvars.copy_context()
+            resultado = await asyncio.get_running_loop().run_in_executor(
+                _HILOS, contexto.run, _procesar, datos, cabeceras.get("x-perfil"))
+    except Exception:
+        logging.exception("❌ Error en webhook")
+        await _responder(send, 200, TWIML_ERROR, "application/xml")
+        return
+    finally:
+        _pendientes -= 1
+
+    if es_twilio:
+        await _responder(send, 200, twiml(resultado), "application/xml")
+    else:
+        await _responder(send, 200, json.dumps(resultado, ensure_ascii=False), "application/json")
+
+
+async def _vida(receive, send):
+    global _bucle
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            _bucle = asyncio.get_running_loop()
+            printer.fijar_despachador(_despachar)
+            obtener_recordatorios()   # idempotente: main ya lo arranca al importarse
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            printer.fijar_despachador(None)
+            if _en_segundo_plano:
+                logging.info("Esperando %d envíos de ticket pendientes", len(_en_segundo_plano))
+                await asyncio.gather(*_en_segundo_plano, return_exceptions=True)
+            _HILOS.shutdown(wait=True)
+            _HILOS_ES.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _vida(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/webhook" and scope["method"] == "POST":
+        cabeceras = dict(scope["headers"])
+        peticion = cabeceras.get(b"x-request-id")
+        with id_peticion(peticion.decode("latin-1") if peticion else None):
+            await _webhook(scope, receive, send)
+    else:
+        await _responder(send, 404, json.dumps({"error": "no encontrado (solo /webhook en ASGI)"}), "application/json")
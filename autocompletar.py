@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Autocompletado por prefijo sobre el catálogo normalizado ("pol" -> "Pollo entero",
+"Alas de pollo", ...), para formularios web y respuestas rápidas.
+
+Índice: un array ordenado de claves normalizadas con el producto al que apunta
+cada una. Claves por producto:
+  - el nombre normalizado completo (INDEX_NORMALIZADO)
+  - cada sufijo por palabras ("alas de pollo" -> "pollo"), salvo los que
+    empiezan por una palabra vacía ("de pollo")
+  - las claves de SYNONYMS
+Una consulta son dos bisect para acotar el rango del prefijo y un top-k sobre
+ese rango, ordenado por frecuencia en pedidos confirmados y tipo de clave.
+
+Un índice por tienda (tiendas.py), con su catálogo, sus sinónimos y las
+frecuencias de sus propios pedidos.
+"""
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+
+from expresiones import STOPWORDS, _normalize
+from pedidos import obtener_libro
+from tiendas import TIENDA_POR_DEFECTO
+
+# Tipo de clave: cuanto menor, mejor coincidencia a igual frecuencia
+NOMBRE, SINONIMO, SUFIJO = 0, 1, 2
+
+K_DEFECTO = 5
+
+
+class Autocompletar:
+    def __init__(self, index_normalizado: dict, synonyms: dict, productos_db: dict):
+        self.productos_db = productos_db
+        entradas = {}
+
+        def _añadir(clave, producto, tipo):
+            previo = entradas.get((clave, producto))
+            if previo is None or tipo < previo:
+                entradas[(clave, producto)] = tipo
+
+        for norm, producto in index_normalizado.items():
+            _añadir(norm, producto, NOMBRE)
+            palabras = norm.split()
+            for i in range(1, len(palabras)):
+                if palabras[i] not in STOPWORDS:
+                    _añadir(" ".join(palabras[i:]), producto, SUFIJO)
+
+        for sinonimo, destino in synonyms.items():
+            producto = index_normalizado.get(_normalize(destino))
+            if producto:
+                _añadir(_normalize(sinonimo), producto, SINONIMO)
+
+        ordenadas = sorted(entradas.items())
+        self.claves = [clave for (clave, _), _ in ordenadas]
+        self.productos = [producto for (_, producto), _ in ordenadas]
+        self.tipos = [tipo for _, tipo in ordenadas]
+        self.frecuencias = {}
+        # prefijos cortos abarcan rangos grandes: se guarda su top-K_DEFECTO ya
+        # calculado. Acotada: solo ese k, y como mucho 3 caracteres de [a-z0-9 ].
+        self._cache_cortos = {}
+
+    def actualizar_frecuencias(self, frecuencias: dict):
+        """{producto: veces pedido}; sube en el ranking lo que más se pide."""
+        self.frecuencias = dict(frecuencias)
+        self._cache_cortos = {}
+
+    def buscar(self, prefijo: str, k: int = K_DEFECTO) -> list[str]:
+        """Hasta k productos cuyo nombre, sinónimo o alguna palabra empieza por prefijo."""
+        q = _normalize(prefijo)
+        if not q:
+            return []
+        corto = len(q) <= 3 and k == K_DEFECTO
+        if corto and q in self._cache_cortos:
+            return self._cache_cortos[q]
+        ini = bisect.bisect_left(self.claves, q)
+        fin = bisect.bisect_left(self.claves, q + "\uffff", ini)
+
+        mejores = {}
+        for i in range(ini, fin):
+            producto = self.productos[i]
+            tipo = self.tipos[i]
+            if producto not in mejores or tipo < mejores[producto]:
+                mejores[producto] = tipo
+
+        frec = self.frecuencias
+        top = heapq.nsmallest(
+            k, mejores,
+            key=lambda p: (-frec.get(p, 0), mejores[p], len(p), p),
+        )
+        if corto:
+            self._cache_cortos[q] = top
+        return top
+
+    def resultados(self, prefijo: str, k: int = K_DEFECTO) -> list[dict]:
+        """Igual que buscar() pero listo para JSON."""
+        return [
+            {"producto": p.capitalize(), "clave": p, "categoria": self.productos_db.get(p)}
+            for p in self.buscar(prefijo, k)
+        ]
+
+
+_INDICES = {}           # clave de tienda -> Autocompletar
+_INDICES_LOCK = threading.Lock()
+_ULTIMO_REFRESCO = {}   # clave de tienda -> time.monotonic()
+
+
+def obtener_autocompletar(tienda=None) -> Autocompletar:
+    """
+    Índice del worker para la tienda (por defecto, la tienda por defecto). Las
+    frecuencias se recargan de los pedidos de esa tienda en el libro como
+    mucho cada AUTOCOMPLETAR_REFRESCO segundos (300 por defecto).
+    """
+    tienda = tienda or TIENDA_POR_DEFECTO
+    indice = _INDICES.get(tienda.clave)
+    if indice is None:
+        with _INDICES_LOCK:
+            indice = _INDICES.get(tienda.clave)
+            if indice is None:
+                indice = Autocompletar(tienda.catalogo.index_normalizado, tienda.synonyms, tienda.productos_db)
+                _INDICES[tienda.clave] = indice
+
+    ahora = time.monotonic()
+    if ahora - _ULTIMO_REFRESCO.get(tienda.clave, 0.0) > float(os.getenv("AUTOCOMPLETAR_REFRESCO", "300")):
+        _ULTIMO_REFRESCO[tienda.clave] = ahora
+        try:
+            indice.actualizar_frecuencias(obtener_libro().frecuencias(tienda.clave))
+        except Exception:
+            logging.exception("No se pudieron cargar las frecuencias de pedidos")
+    return indice
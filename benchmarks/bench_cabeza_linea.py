@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Bloqueo en cabeza de línea: latencia de los mensajes cortos mientras otros
+clientes pegan listas largas, con el análisis en línea y con el pool de
+procesos de ejecutor.py.
+
+    python benchmarks/bench_cabeza_linea.py [--segundos 5] [--pesados 2]
+        [--ligeros 4] [--lineas 40] [--procesos 2] [--hilos 4]
+
+Como en asgi.py, los mensajes se atienden en un pool de --hilos hilos. Los
+clientes pesados mandan sin pausa una lista de --lineas líneas (con nombres
+aproximados, que obligan al fuzzy); los ligeros mandan "1 kg de pollo entero"
+cada 20 ms y se mide cuánto tardan en recibir respuesta.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TMP = tempfile.mkdtemp(prefix="bench-cabeza-linea-")
+os.environ["PEDIDOS_DB"] = os.path.join(_TMP, "pedidos.sqlite3")
+
+import ejecutor  # noqa: E402
+import utils  # noqa: E402
+from data import PRODUCTOS_DB  # noqa: E402
+
+CORTO = "1 kg de pollo entero"
+
+
+def lista_larga(lineas: int, semilla: int = 7) -> str:
+    rnd = random.Random(semilla)
+    productos = list(PRODUCTOS_DB)
+    filas = []
+    for _ in range(lineas):
+        palabras = rnd.choice(productos).split()
+        filas.append(f"{rnd.choice(['1 kg de', '2', 'medio kilo de', '500 g de'])} "
+                     f"{' '.join(palabras[:2])} {rnd.choice(['', 'rico', 'bueno'])}".strip())
+    return "\n".join(filas)
+
+
+def preparar(user_id: str):
+    """Deja al usuario en el paso de productos."""
+    for m in ("iniciar pedido", "Ana", "lunes a las 10:00"):
+        utils.process_message({"user_id": user_id, "message": m})
+
+
+def medir(modo: str, args, lista: str) -> dict:
+    ejecutor._EJECUTOR = ejecutor.Ejecutor(args.procesos) if modo == "pool" else None
+    ejecutor._EJECUTOR_LEIDO = True
+    if ejecutor._EJECUTOR:
+        time.sleep(2)   # procesos arrancados y calientes
+    hilos = ThreadPoolExecutor(args.hilos)
+    fin = time.monotonic() + args.segundos
+    latencias, pesados = [], [0]
+    lock = threading.Lock()
+
+    def pesado(i):
+        uid = f"{modo}-pesado-{i}"
+        preparar(uid)
+        while time.monotonic() < fin:
+            hilos.submit(utils.process_message, {"user_id": uid, "message": lista}).result()
+            utils.SESSIONS[uid]["carrito"] = {}
+            with lock:
+                pesados[0] += 1
+
+    def ligero(i):
+        uid = f"{modo}-ligero-{i}"
+        preparar(uid)
+        while time.monotonic() < fin:
+            t0 = time.perf_counter()
+            hilos.submit(utils.process_message, {"user_id": uid, "message": CORTO}).result()
+            with lock:
+                latencias.append(time.perf_counter() - t0)
+            utils.SESSIONS[uid]["carrito"] = {}
+            time.sleep(0.02)
+
+    clientes = [threading.Thread(target=pesado, args=(i,)) for i in range(args.pesados)]
+    clientes += [threading.Thread(target=ligero, args=(i,)) for i in range(args.ligeros)]
+    for c in clientes:
+        c.start()
+    for c in clientes:
+        c.join()
+    hilos.shutdown()
+    if ejecutor._EJECUTOR:
+        ejecutor._EJECUTOR.cerrar()
+
+    latencias.sort()
+    return {
+        "ligeros": len(latencias),
+        "p50_ms": statistics.median(latencias) * 1e3,
+        "p99_ms": latencias[int(len(latencias) * 0.99) - 1] * 1e3,
+        "max_ms": latencias[-1] * 1e3,
+        "listas_s": pesados[0] / args.segundos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--pesados", type=int, default=2)
+    parser.add_argument("--ligeros", type=int, default=4)
+    parser.add_argument("--lineas", type=int, default=40)
+    parser.add_argument("--procesos", type=int, default=2)
+    parser.add_argument("--hilos", type=int, default=4)
+    args = parser.parse_args()
+
+    lista = lista_larga(args.lineas)
+    t0 = time.perf_counter()
+    ejecutor.analizar_productos(lista, utils.TIENDA_POR_DEFECTO, {})
+    print(f"lista de {args.lineas} líneas: {(time.perf_counter() - t0) * 1e3:.1f} ms de CPU en línea "
+          f"({os.cpu_count()} CPU)")
+    print(f"{'modo':<8}{'cortos':>8}{'p50 ms':>10}{'p99 ms':>10}{'máx ms':>10}{'listas/s':>10}")
+    for modo in ("en línea", "pool"):
+        r = medir(modo, args, lista)
+        print(f"{modo:<8}{r['ligeros']:>8}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}"
+              f"{r['listas_s']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Conversaciones completas a través de utils.process_message.
+
+    python benchmarks/bench_conversacion.py [-n CONVERSACIONES]
+        [--guardar base.json] [--comparar base.json] [--umbral 0.15]
+
+Guion: saludo -> iniciar pedido -> nombre -> fecha -> productos (varios por
+mensaje) -> eliminar -> listo -> confirmar.
+
+Reproducible:
+  - reloj congelado (utils.datetime) en AHORA, así parse_dia_hora siempre
+    resuelve "mañana a las 12:30" al mismo día
+  - impresión, correo, libro de pedidos y perfiles sustituidos por no-ops
+  - agenda sin límite de capacidad (las confirmaciones no llenan franjas)
+  - registro a nivel WARNING: los logging.debug de expresiones no se
+    formatean ni se escriben durante la medida
+
+Informa ops/s, p50 y p99 por paso y por conversación. Con --guardar escribe
+la línea base en JSON; con --comparar marca los pasos cuyo p50 empeora más
+que --umbral (15% por defecto) y sale con código 1.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TMP = tempfile.mkdtemp(prefix="bench-conversacion-")
+os.environ["PEDIDOS_DB"] = os.path.join(_TMP, "pedidos.sqlite3")
+
+import utils  # noqa: E402
+from franjas import Agenda  # noqa: E402
+
+AHORA = datetime(2026, 10, 19, 10, 0)  # lunes
+
+# (paso, mensaje, texto esperado en la respuesta)
+GUION = [
+    ("saludo", "hola buenas", "Bienvenido"),
+    ("iniciar", "iniciar pedido", "nombre"),
+    ("nombre", "me llamo María José", "Perfecto"),
+    ("fecha", "mañana a las 12:30", "martes 20 de octubre - 12:30"),
+    ("productos", "2 kg de pollo entero y 3 alas de pollo", "añadido"),
+    ("productos_2", "medio kilo de costilla de cerdo, 6 hamburguesas de ternera", "añadido"),
+    ("eliminar", "eliminar 1 kg de pollo entero", "eliminado"),
+    ("listo", "listo", "Este es tu pedido"),
+    ("confirmar", "confirmar", "Pedido confirmado"),
+]
+
+
+class _RelojCongelado(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return AHORA if tz is None else AHORA.replace(tzinfo=tz)
+
+
+def _preparar():
+    logging.getLogger().setLevel(logging.WARNING)
+    utils.datetime = _RelojCongelado
+    utils.send_to_printer = lambda *a, **k: None
+    utils.registrar_pedido = lambda *a, **k: None
+    utils.guardar_perfil = lambda *a, **k: None
+    agenda = Agenda(capacidad=10 ** 9)
+    utils.obtener_agenda = lambda *a, **k: agenda
+
+
+def _conversacion(user_id, tiempos=None, comprobar=False):
+    for paso, mensaje, esperado in GUION:
+        t0 = time.perf_counter_ns()
+        respuesta = utils.process_message({"user_id": user_id, "message": mensaje})
+        dt = time.perf_counter_ns() - t0
+        if tiempos is not None:
+            tiempos[paso].append(dt)
+        if comprobar and esperado not in respuesta:
+            raise AssertionError(f"paso {paso!r}: se esperaba {esperado!r} en {respuesta!r}")
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _resumen(tiempos_ns):
+    return {
+        "ops_s": round(1e9 / statistics.fmean(tiempos_ns), 1),
+        "p50_us": round(_percentil(tiempos_ns, 50) / 1e3, 2),
+        "p99_us": round(_percentil(tiempos_ns, 99) / 1e3, 2),
+    }
+
+
+def medir(conversaciones: int, calentamiento: int = 20) -> dict:
+    _preparar()
+    tiempos = {paso: [] for paso, _, _ in GUION}
+    _conversacion("bench:comprobacion", comprobar=True)
+    for i in range(calentamiento):
+        _conversacion(f"bench:calentamiento:{i}")
+    for i in range(conversaciones):
+        _conversacion(f"bench:{i}", tiempos)
+    totales = [sum(t) for t in zip(*tiempos.values())]
+    resultado = {paso: _resumen(t) for paso, t in tiempos.items()}
+    resultado["conversacion"] = _resumen(totales)
+    return resultado
+
+
+def comparar(actual: dict, base: dict, umbral: float) -> list[str]:
+    regresiones = []
+    for paso, datos in actual.items():
+        previo = base.get(paso)
+        if not previo:
+            continue
+        cambio = datos["p50_us"] / previo["p50_us"] - 1
+        if cambio > umbral:
+            regresiones.append(f"{paso}: p50 {previo['p50_us']:.1f} -> {datos['p50_us']:.1f} µs (+{cambio:.0%})")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--conversaciones", type=int, default=300)
+    parser.add_argument("--guardar", help="escribir la línea base en este JSON")
+    parser.add_argument("--comparar", help="comparar con esta línea base")
+    parser.add_argument("--umbral", type=float, default=0.15, help="empeoramiento de p50 tolerado (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    resultado = medir(args.conversaciones)
+    print(f"{'paso':<14} {'ops/s':>10} {'p50 µs':>10} {'p99 µs':>10}")
+    for paso, datos in resultado.items():
+        print(f"{paso:<14} {datos['ops_s']:>10,.0f} {datos['p50_us']:>10.1f} {datos['p99_us']:>10.1f}")
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump({"conversaciones": args.conversaciones, "resultados": resultado}, f, indent=2)
+        print(f"Línea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)["resultados"]
+        regresiones = comparar(resultado, base, args.umbral)
+        if regresiones:
+            print("REGRESIONES:")
+            for r in regresiones:
+                print("  " + r)
+            sys.exit(1)
+        print(f"Sin regresiones (umbral {args.umbral:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
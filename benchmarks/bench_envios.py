@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Coste de entrega por pedido contra el servidor SendGrid falso (sin red).
+
+    python benchmarks/bench_envios.py [pedidos] [retardo_servidor_s]
+
+Compara:
+  - cliente nuevo por pedido (lo que hacía printer.enviar_correo)
+  - cliente persistente con keep-alive
+  - cliente persistente con lotes de 10 tickets
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envios import ClienteCorreo, TransporteHTTP  # noqa: E402
+from falsos import ServidorSendGridFalso  # noqa: E402
+
+
+def _ticket():
+    fd, ruta = tempfile.mkstemp(prefix="ticket_bench_", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("=== CARNICERÍA EL BUEN CORTE ===\nPollo entero 2.00 kg\nTOTAL: 8.90 €\n")
+    return ruta
+
+
+def _medir(nombre, pedidos, enviar, srv):
+    antes_conn, antes_rec = srv.conexiones, len(srv.recibidos)
+    t0 = time.perf_counter()
+    for _ in range(pedidos):
+        enviar()
+    dt = time.perf_counter() - t0
+    print(f"{nombre:<28} {dt / pedidos * 1e3:8.3f} ms/pedido  "
+          f"conexiones={srv.conexiones - antes_conn:<5} correos={len(srv.recibidos) - antes_rec}")
+
+
+def main():
+    pedidos = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    retardo = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    ruta = _ticket()
+    try:
+        with ServidorSendGridFalso(retardo=retardo) as srv:
+            def nuevo_por_pedido():
+                cliente = ClienteCorreo(TransporteHTTP("clave", srv.url), "a@ejemplo.es", "b@ejemplo.es")
+                cliente.enviar_ticket(ruta)
+                cliente.cerrar()
+            _medir("cliente nuevo por pedido", pedidos, nuevo_por_pedido, srv)
+
+            persistente = ClienteCorreo(TransporteHTTP("clave", srv.url), "a@ejemplo.es", "b@ejemplo.es")
+            _medir("keep-alive", pedidos, lambda: persistente.enviar_ticket(ruta), srv)
+            persistente.cerrar()
+
+            lotes = ClienteCorreo(TransporteHTTP("clave", srv.url), "a@ejemplo.es", "b@ejemplo.es",
+                                  lote_max=10, lote_espera=60)
+
+            def en_lote():
+                lotes.enviar_ticket(ruta)
+            antes = len(srv.recibidos)
+            _medir("keep-alive + lotes de 10", pedidos, en_lote, srv)
+            lotes.cerrar()
+            print(f"{'':<28} (tras cerrar: {len(srv.recibidos) - antes} correos resumen)")
+    finally:
+        os.remove(ruta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Ráfaga de pedidos de sábado por la mañana contra una impresora falsa (pseudo-TTY).
+
+    python benchmarks/bench_impresora.py [pedidos]
+
+Mide cuánto tarda encolar() (lo que paga la respuesta de confirmación) y cuánto
+tarda el spooler en vaciar la cola, y comprueba que los tickets salen en orden.
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falsos import ImpresoraFalsaPTY  # noqa: E402
+from impresora import CODIFICACION, DispositivoArchivo, Spooler, codificar_escpos  # noqa: E402
+
+
+def main():
+    pedidos = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    impresora = ImpresoraFalsaPTY()
+    spooler = Spooler(DispositivoArchivo(impresora.ruta), capacidad=pedidos).iniciar()
+    lineas = [("pollo entero", 2.0, "kg", 4.45, 8.9), ("alas de pollo", 6, "u", 1.2, 7.2)]
+
+    tiempos = []
+    t_rafaga = time.perf_counter()
+    for i in range(pedidos):
+        datos = codificar_escpos(f"Cliente {i:05d}", lineas, 16.1, datetime(2026, 10, 24, 10, 0))
+        t0 = time.perf_counter()
+        spooler.encolar(datos)
+        tiempos.append((time.perf_counter() - t0) * 1e6)
+    spooler.esperar(60)
+    t_total = time.perf_counter() - t_rafaga
+    time.sleep(0.2)   # que el lector del PTY recoja los últimos bytes
+    spooler.parar()
+
+    salida = impresora.datos.decode(CODIFICACION, errors="replace")
+    clientes = [linea.split()[-1] for linea in salida.splitlines() if linea.startswith("Cliente:")]
+    en_orden = clientes == [f"{i:05d}" for i in range(pedidos)]
+    impresora.cerrar()
+
+    tiempos.sort()
+    print(f"encolar(): p50={statistics.median(tiempos):.1f} µs  p99={tiempos[int(len(tiempos) * 0.99) - 1]:.1f} µs")
+    print(f"{pedidos} tickets impresos en {t_total:.2f} s ({len(impresora.datos)} bytes), en orden: {en_orden}")
+
+
+if __name__ == "__main__":
+    main()
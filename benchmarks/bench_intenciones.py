@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Clasificación de intención + despacho (paso, intención) -> manejador.
+
+    python benchmarks/bench_intenciones.py [repeticiones]
+
+Compara detectar_intencion + tabla con la cadena de comprobaciones de
+subcadenas que hacía process_message antes.
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+from intenciones import detectar_intencion  # noqa: E402
+
+MENSAJES = [
+    (0, "hola buenas"), (0, "iniciar pedido"), (1, "me llamo María José"),
+    (2, "mañana a las 12:30"), (2, "volver atrás"), (3, "2 kg de pollo entero y 3 alas de pollo"),
+    (3, "eliminar 1 kg de pollo entero"), (3, "ver aves"), (3, "listo"), (3, "Ya está!"),
+    (4, "confirmar"), (4, "no, mejor cancelar"), (3, "medio kilo de lomo cinta, 6 hamburguesas"),
+]
+
+
+def _cadena_antigua(paso, msg):
+    if "volver atras" in msg and paso:
+        return "volver"
+    if "iniciar pedido" in msg:
+        return "iniciar"
+    if paso == 3 and re.match(r"^(eliminar|elimina|quita|borra)\b", msg):
+        return "eliminar"
+    if paso == 4 and "confirmar" in msg:
+        return "confirmar"
+    if paso == 4 and "cancelar" in msg:
+        return "cancelar"
+    return None
+
+
+def _medir(nombre, fn, repeticiones):
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        for paso, msg in MENSAJES:
+            fn(paso, msg.lower())
+    dt = time.perf_counter() - t0
+    n = repeticiones * len(MENSAJES)
+    print(f"{nombre:<34} {n / dt:>12,.0f} msg/s  {dt / n * 1e6:6.2f} µs/msg")
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for paso, msg in MENSAJES:
+        intencion = detectar_intencion(msg)
+        manejador = utils._manejador(paso, intencion) or utils._DESPACHO.get((paso, None))
+        print(f"  paso {paso} {msg!r:<45} -> {intencion!s:<10} {manejador.__name__}")
+    _medir("cadena de subcadenas (antes)", _cadena_antigua, repeticiones)
+    _medir("detectar_intencion", lambda paso, msg: detectar_intencion(msg), repeticiones)
+    _medir("detectar_intencion + despacho",
+           lambda paso, msg: utils._manejador(paso, detectar_intencion(msg)) or utils._DESPACHO.get((paso, None)),
+           repeticiones)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Hoja de producción sobre un mes de historial sintético en un libro temporal.
+
+    python benchmarks/bench_produccion.py [pedidos_por_dia] [dias]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import PRODUCTOS_DB  # noqa: E402
+from pedidos import LibroPedidos  # noqa: E402
+from produccion import cargar_lineas, hoja_produccion, resumen_produccion  # noqa: E402
+
+
+def main():
+    por_dia = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    rnd = random.Random(7)
+    productos = list(PRODUCTOS_DB)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        libro = LibroPedidos(os.path.join(tmp, "pedidos.sqlite3"))
+        inicio = datetime(2026, 9, 1)
+        t0 = time.perf_counter()
+        for d in range(dias):
+            for _ in range(por_dia):
+                hora = inicio + timedelta(days=d, hours=rnd.choice([9, 10, 11, 12, 13, 17, 18, 19]),
+                                          minutes=rnd.choice([0, 30]))
+                carrito = {p: {"kg": rnd.choice([0.0, 0.5, 1.0, 2.5]), "u": rnd.choice([0, 0, 1, 2])}
+                           for p in rnd.sample(productos, rnd.randint(1, 6))}
+                libro.registrar("bench", {"nombre": "Bench", "hora": hora, "carrito": carrito})
+        print(f"libro sintético: {dias * por_dia} pedidos en {time.perf_counter() - t0:.1f} s")
+
+        t0 = time.perf_counter()
+        df = cargar_lineas(inicio, inicio + timedelta(days=dias), libro)
+        t_carga = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        resumen = resumen_produccion(df)
+        hoja = hoja_produccion(resumen, "MES COMPLETO")
+        t_agr = time.perf_counter() - t0
+        print(f"{len(df)} líneas: carga {t_carga * 1e3:.0f} ms, agregación + hoja {t_agr * 1e3:.0f} ms "
+              f"({len(hoja.splitlines())} líneas de hoja)")
+
+        t0 = time.perf_counter()
+        dia = inicio + timedelta(days=dias - 1)
+        df_dia = cargar_lineas(dia, dia + timedelta(days=1), libro)
+        hoja_produccion(resumen_produccion(df_dia), "UN DÍA")
+        print(f"hoja de un día ({len(df_dia)} líneas): {(time.perf_counter() - t0) * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
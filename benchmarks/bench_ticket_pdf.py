@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tiempo de render por ticket PDF (fuentes/logo cacheados tras el primero).
+
+    python benchmarks/bench_ticket_pdf.py [tickets] [lineas_por_ticket]
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import PRODUCTOS_DB  # noqa: E402
+from printer import lineas_ticket  # noqa: E402
+from ticket_pdf import renderizar_ticket_pdf  # noqa: E402
+
+
+def _session(n_lineas):
+    productos = list(PRODUCTOS_DB)[:n_lineas]
+    carrito = {p: {"kg": 1.5, "u": 0} if i % 2 else {"kg": 0.0, "u": 2} for i, p in enumerate(productos)}
+    return {"nombre": "Ana", "hora": datetime.now() + timedelta(days=1), "carrito": carrito}
+
+
+def main():
+    tickets = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_lineas = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    session = _session(n_lineas)
+
+    t0 = time.perf_counter()
+    lineas, total = lineas_ticket(session)
+    renderizar_ticket_pdf(session["nombre"], lineas, total, session["hora"])
+    primero = (time.perf_counter() - t0) * 1e3
+
+    tiempos = []
+    for _ in range(tickets):
+        t0 = time.perf_counter()
+        lineas, total = lineas_ticket(session)
+        pdf = renderizar_ticket_pdf(session["nombre"], lineas, total, session["hora"])
+        tiempos.append((time.perf_counter() - t0) * 1e3)
+    tiempos.sort()
+
+    print(f"primer ticket (construye fuentes/logo): {primero:.2f} ms")
+    print(f"{tickets} tickets de {n_lineas} líneas ({len(pdf)} bytes): "
+          f"p50={statistics.median(tiempos):.2f} ms  p99={tiempos[int(len(tiempos) * 0.99) - 1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de carga para /webhook: N clientes virtuales de WhatsApp a la vez,
+con tiempos de reflexión y una mezcla de conversaciones realista.
+
+    # en el mismo proceso (Flask test client)
+    python benchmarks/carga_webhook.py --niveles 1,5,10,25 --duracion 10
+
+    # por HTTP contra gunicorn lanzado por la herramienta
+    python benchmarks/carga_webhook.py --gunicorn "-w 2 --threads 4" --niveles 1,10,50
+
+    # por HTTP contra el servidor ASGI (asgi.py) lanzado con uvicorn
+    python benchmarks/carga_webhook.py --uvicorn "--workers 1" --niveles 1,10,50
+
+    # Procfile actual frente a ASGI con un SendGrid lento (200 ms por correo)
+    python benchmarks/carga_webhook.py --gunicorn "-w 1" --retardo-correo 0.2 --pensar 0.05 --niveles 1,10,50
+    python benchmarks/carga_webhook.py --uvicorn "" --retardo-correo 0.2 --pensar 0.05 --niveles 1,10,50
+
+    # por HTTP contra un servidor ya arrancado
+    python benchmarks/carga_webhook.py --url http://127.0.0.1:10000
+
+SendGrid se sustituye por el servidor falso de falsos.py y el libro de pedidos
+va a un directorio temporal (con --url, el servidor debe arrancarse con las
+variables que imprime la herramienta). La capacidad de las franjas se fija muy
+alta para que los pedidos confirmados no llenen la agenda.
+
+Por nivel de concurrencia informa: peticiones, throughput, p50/p95/p99 de
+latencia, tasa de errores (HTTP != 200 o respuesta de error del bot),
+pedidos que no llegaron a confirmarse ("rotos") y CPU y RSS del proceso que
+atiende (en Linux, vía /proc; con gunicorn o uvicorn, suma de master y workers).
+
+Las sesiones viven en memoria de cada proceso: con varios workers de gunicorn
+los mensajes de una conversación se reparten entre procesos y los pedidos se
+rompen; la columna "rotos" lo hace visible.
+"""
+import argparse
+import contextlib
+import http.client
+import logging
+import os
+import random
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from falsos import ServidorSendGridFalso  # noqa: E402
+
+# (peso, guion)
+MEZCLA = [
+    (0.55, ["hola", "iniciar pedido", "me llamo Carmen", "lunes a las 10:00",
+            "2 kg de pollo entero y 3 alas de pollo", "medio kilo de costilla de cerdo",
+            "eliminar alas de pollo", "listo", "confirmar"]),
+    (0.25, ["buenas", "ver catálogo", "ver aves", "ver cerdo 2", "gracias"]),
+    (0.20, ["iniciar pedido", "Luis", "lunes a las 17:30", "1 kg de chuleta de ternera gallega", "cancelar"]),
+]
+
+ERRORES_BOT = ("Hubo un error", "Error: datos incompletos")
+
+
+# --- Recursos del proceso servidor (Linux) ---
+
+def _hijos(pid: int) -> list[int]:
+    hijos = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                hijos.extend(int(p) for p in f.read().split())
+    except OSError:
+        pass
+    return hijos
+
+
+def recursos(pid: int, con_hijos: bool = False) -> tuple[float, float] | None:
+    """(segundos de CPU acumulados, RSS en MB) de pid (y sus hijos), o None fuera de Linux."""
+    pids = [pid] + (_hijos(pid) if con_hijos else [])
+    cpu = rss = 0.0
+    try:
+        for p in pids:
+            with open(f"/proc/{p}/stat") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+            with open(f"/proc/{p}/statm") as f:
+                rss += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+    return cpu, rss
+
+
+# --- Clientes: en proceso o por HTTP ---
+
+class ClienteEnProceso:
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def enviar(self, datos: dict) -> tuple[int, str]:
+        r = self._cliente.post("/webhook", data=datos)
+        return r.status_code, r.get_data(as_text=True)
+
+    def cerrar(self):
+        pass
+
+
+class ClienteHTTP:
+    """Una conexión keep-alive por cliente virtual, como haría Twilio por worker."""
+
+    def __init__(self, url: str):
+        partes = urlsplit(url)
+        self._host, self._puerto = partes.hostname, partes.port or 80
+        self._ruta = (partes.path.rstrip("/") or "") + "/webhook"
+        self._conn = None
+
+    def enviar(self, datos: dict) -> tuple[int, str]:
+        cuerpo = urlencode(datos)
+        for intento in (1, 2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self._host, self._puerto, timeout=30)
+            try:
+                self._conn.request("POST", self._ruta, body=cuerpo,
+                                   headers={"Content-Type": "application/x-www-form-urlencoded"})
+                r = self._conn.getresponse()
+                return r.status, r.read().decode("utf-8", "replace")
+            except (OSError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if intento == 2:
+                    raise
+
+    def cerrar(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+# --- Carga ---
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _cliente_virtual(prefijo, n, nuevo_cliente, fin, pensar, rng, latencias, errores, lock):
+    cliente = nuevo_cliente()
+    pesos = [p for p, _ in MEZCLA]
+    guiones = [g for _, g in MEZCLA]
+    iteracion = 0
+    try:
+        while time.monotonic() < fin:
+            guion = rng.choices(guiones, pesos)[0]
+            user_id = f"whatsapp:+34{prefijo}{n:04d}{iteracion:05d}"
+            iteracion += 1
+            for mensaje in guion:
+                if time.monotonic() >= fin:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    status, texto = cliente.enviar({"From": user_id, "Body": mensaje,
+                                                    "To": "whatsapp:+14155238886"})
+                    fallo = status != 200 or any(e in texto for e in ERRORES_BOT)
+                except Exception:
+                    status, texto, fallo = None, "", True
+                dt = time.perf_counter() - t0
+                with lock:
+                    latencias.append(dt)
+                    errores[0] += fallo
+                    if mensaje == "confirmar":
+                        errores[1] += fallo or "Pedido confirmado" not in texto
+                if pensar > 0:
+                    time.sleep(rng.expovariate(1 / pensar))
+    finally:
+        cliente.cerrar()
+
+
+def nivel(concurrencia, duracion, nuevo_cliente, pensar, semilla, pid, con_hijos) -> dict:
+    latencias, errores, lock = [], [0, 0], threading.Lock()  # [errores, pedidos rotos]
+    antes = recursos(pid, con_hijos)
+    t0 = time.monotonic()
+    fin = t0 + duracion
+    hilos = [
+        threading.Thread(target=_cliente_virtual, daemon=True,
+                         args=(concurrencia, i, nuevo_cliente, fin, pensar, random.Random(semilla + i),
+                               latencias, errores, lock))
+        for i in range(concurrencia)
+    ]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    pared = time.monotonic() - t0
+    despues = recursos(pid, con_hijos)
+
+    n = len(latencias)
+    resultado = {
+        "concurrencia": concurrencia,
+        "peticiones": n,
+        "rps": n / pared,
+        "p50_ms": _percentil(latencias, 50) * 1e3,
+        "p95_ms": _percentil(latencias, 95) * 1e3,
+        "p99_ms": _percentil(latencias, 99) * 1e3,
+        "errores": errores[0] / n if n else 0.0,
+        "rotos": errores[1],
+        "cpu": None,
+        "rss_mb": None,
+    }
+    if antes and despues:
+        resultado["cpu"] = (despues[0] - antes[0]) / pared
+        resultado["rss_mb"] = despues[1]
+    return resultado
+
+
+def _entorno(tmp: str, sendgrid_url: str) -> dict:
+    return {
+        "SENDGRID_API_KEY": "clave-falsa",
+        "SENDGRID_URL": sendgrid_url,
+        "EMAIL_DESTINO": "obrador@ejemplo.es",
+        "EMAIL_REMITENTE": "bot@ejemplo.es",
+        "PEDIDOS_DB": os.path.join(tmp, "pedidos.sqlite3"),
+        "FRANJA_CAPACIDAD": "1000000000",
+    }
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_puerto(puerto: int, proceso, limite: float = 30.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("el servidor terminó al arrancar")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", puerto), timeout=0.5):
+            return
+        time.sleep(0.2)
+    raise RuntimeError("el servidor no abrió el puerto a tiempo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--niveles", default="1,5,10,25", help="concurrencias a probar, separadas por comas")
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos por nivel")
+    parser.add_argument("--pensar", type=float, default=0.2, help="tiempo medio de reflexión entre mensajes (s)")
+    parser.add_argument("--semilla", type=int, default=1)
+    destino = parser.add_mutually_exclusive_group()
+    destino.add_argument("--url", help="servidor ya arrancado (http://host:puerto)")
+    destino.add_argument("--gunicorn", metavar="OPCIONES", help="lanzar gunicorn main:app con estas opciones")
+    destino.add_argument("--uvicorn", metavar="OPCIONES", help="lanzar uvicorn asgi:app con estas opciones")
+    parser.add_argument("--retardo-correo", type=float, default=0.0,
+                        help="segundos que tarda el SendGrid falso en contestar (E/S lenta)")
+    args = parser.parse_args()
+    niveles = [int(n) for n in args.niveles.split(",")]
+
+    tmp = tempfile.mkdtemp(prefix="carga-webhook-")
+    proceso = None
+    with ServidorSendGridFalso(retardo=args.retardo_correo) as sendgrid:
+        entorno = _entorno(tmp, sendgrid.url)
+        if args.url:
+            print("El servidor debe arrancarse con:")
+            for k, v in entorno.items():
+                print(f"  {k}={v}")
+            pid, con_hijos = None, False
+            nuevo_cliente = lambda: ClienteHTTP(args.url)  # noqa: E731
+        elif args.gunicorn is not None or args.uvicorn is not None:
+            puerto = _puerto_libre()
+            if args.gunicorn is not None:
+                orden = ["gunicorn", "--bind", f"127.0.0.1:{puerto}", *shlex.split(args.gunicorn), "main:app"]
+            else:
+                orden = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(puerto),
+                         "--no-access-log", *shlex.split(args.uvicorn), "asgi:app"]
+            proceso = subprocess.Popen(
+                orden,
+                cwd=RAIZ, env={**os.environ, **entorno},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            _esperar_puerto(puerto, proceso)
+            pid, con_hijos = proceso.pid, True
+            nuevo_cliente = lambda: ClienteHTTP(f"http://127.0.0.1:{puerto}")  # noqa: E731
+        else:
+            os.environ.update(entorno)
+            from main import app
+            logging.getLogger().setLevel(logging.WARNING)
+            pid, con_hijos = os.getpid(), False
+            nuevo_cliente = lambda: ClienteEnProceso(app)  # noqa: E731
+
+        print(f"{'clientes':>8} {'peticiones':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'errores':>8} {'rotos':>6} {'CPU':>6} {'RSS MB':>7}")
+        try:
+            for concurrencia in niveles:
+                r = nivel(concurrencia, args.duracion, nuevo_cliente, args.pensar,
+                          args.semilla, pid, con_hijos)
+                cpu = f"{r['cpu']:.0%}" if r["cpu"] is not None else "-"
+                rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+                print(f"{r['concurrencia']:>8} {r['peticiones']:>10} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} "
+                      f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errores']:>8.1%} {r['rotos']:>6} {cpu:>6} {rss:>7}",
+                      flush=True)
+        finally:
+            if proceso is not None:
+                proceso.send_signal(signal.SIGTERM)
+                proceso.wait(timeout=30)
+        print(f"Correos recibidos por el SendGrid falso: {len(sendgrid.recibidos)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Reproduce tráfico capturado (captura.py) a través de utils.process_message.
+
+    python benchmarks/replay.py capturas/captura-20261019*.jsonl
+        [--velocidad N] [--diferencias diff.jsonl] [--mostrar 5]
+
+  --velocidad 0  lo más rápido posible (por defecto)
+  --velocidad N  respetando los intervalos originales, N veces más rápido
+
+Cada mensaje se procesa con el reloj congelado en su hora original
+(utils.datetime y franjas.datetime), así "mañana a las 12" y las franjas
+libres se resuelven igual que en producción. Impresión, correo y libro de
+pedidos son no-ops y la agenda empieza vacía (con FRANJA_CAPACIDAD), de modo
+que si en producción ya había pedidos de días anteriores alguna respuesta de
+franja completa puede diferir.
+
+Informa p50/p99 de latencia capturada frente a la reproducida (global y por
+paso) y cuántas respuestas cambian; --diferencias las escribe en JSONL para
+revisar un cambio del motor.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TMP = tempfile.mkdtemp(prefix="replay-")
+os.environ.pop("CAPTURA_DIR", None)  # no capturar la propia reproducción
+os.environ["PEDIDOS_DB"] = os.path.join(_TMP, "pedidos.sqlite3")
+
+import franjas  # noqa: E402
+import utils  # noqa: E402
+from captura import leer_captura  # noqa: E402
+
+
+class _RelojCaptura(datetime):
+    actual = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.actual if tz is None else cls.actual.replace(tzinfo=tz)
+
+
+def _preparar():
+    logging.getLogger().setLevel(logging.WARNING)   # sin el registro de depuración en la medida
+    utils.datetime = _RelojCaptura
+    franjas.datetime = _RelojCaptura
+    utils.send_to_printer = lambda *a, **k: None
+    utils.registrar_pedido = lambda *a, **k: None
+    agenda = franjas.Agenda(capacidad=int(os.getenv("FRANJA_CAPACIDAD", "10")),
+                            minutos=int(os.getenv("FRANJA_MINUTOS", "30")))
+    utils.obtener_agenda = lambda *a, **k: agenda
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def reproducir(registros: list[dict], velocidad: float = 0.0):
+    """Devuelve [(registro, respuesta, ms)] en el orden original."""
+    _preparar()
+    resultados = []
+    if not registros:
+        return resultados
+    t_inicial = datetime.fromisoformat(registros[0]["t"])
+    pared_inicial = time.monotonic()
+    for r in registros:
+        t = datetime.fromisoformat(r["t"])
+        if velocidad > 0:
+            espera = (t - t_inicial).total_seconds() / velocidad - (time.monotonic() - pared_inicial)
+            if espera > 0:
+                time.sleep(espera)
+        _RelojCaptura.actual = _RelojCaptura.fromisoformat(r["t"])
+        t0 = time.perf_counter()
+        respuesta = utils.process_message({"user_id": r["u"], "message": r["m"], "tienda": r.get("ti") or None})
+        resultados.append((r, respuesta, (time.perf_counter() - t0) * 1e3))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rutas", nargs="+", help="ficheros captura-*.jsonl")
+    parser.add_argument("--velocidad", type=float, default=0.0)
+    parser.add_argument("--diferencias", help="escribir aquí las respuestas que cambian (JSONL)")
+    parser.add_argument("--mostrar", type=int, default=3, help="diferencias a imprimir")
+    args = parser.parse_args()
+
+    registros = leer_captura(args.rutas)
+    t0 = time.monotonic()
+    resultados = reproducir(registros, args.velocidad)
+    pared = time.monotonic() - t0
+    if not resultados:
+        print("Captura vacía.")
+        return
+
+    por_paso = defaultdict(lambda: ([], []))
+    for r, _, ms in resultados:
+        capturado, reproducido = por_paso[r.get("p")]
+        capturado.append(r["ms"])
+        reproducido.append(ms)
+    todos_cap = [r["ms"] for r, _, _ in resultados]
+    todos_rep = [ms for _, _, ms in resultados]
+
+    print(f"{len(resultados)} mensajes en {pared:.2f} s ({len(resultados) / pared:,.0f} msg/s)")
+    print(f"{'paso':<8} {'n':>7} {'p50 cap':>9} {'p50 rep':>9} {'p99 cap':>9} {'p99 rep':>9}  (ms)")
+    filas = sorted(por_paso.items(), key=lambda kv: (kv[0] is None, kv[0] or 0))
+    filas.append(("total", (todos_cap, todos_rep)))
+    for paso, (cap, rep) in filas:
+        print(f"{paso!s:<8} {len(cap):>7} {_percentil(cap, 50):>9.2f} {_percentil(rep, 50):>9.2f} "
+              f"{_percentil(cap, 99):>9.2f} {_percentil(rep, 99):>9.2f}")
+    print(f"media capturada {statistics.fmean(todos_cap):.2f} ms, reproducida {statistics.fmean(todos_rep):.2f} ms")
+
+    diferencias = [(r, respuesta) for r, respuesta, _ in resultados if respuesta != r["r"]]
+    print(f"Respuestas distintas: {len(diferencias)} de {len(resultados)}")
+    for r, respuesta in diferencias[:args.mostrar]:
+        print(f"--- {r['t']} usuario {r['u']} paso {r.get('p')}: {r['m']!r}\n"
+              f"  antes: {r['r']!r}\n  ahora: {respuesta!r}")
+    if args.diferencias:
+        with open(args.diferencias, "w", encoding="utf-8") as f:
+            for r, respuesta in diferencias:
+                f.write(json.dumps({**r, "r_nueva": respuesta}, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
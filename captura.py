@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Captura opcional del tráfico real para reproducirlo después
+(benchmarks/replay.py).
+
+Se activa con CAPTURA_DIR y CAPTURA_SAL (sin sal no se captura: el HMAC de un
+número de teléfono sin secreto se invierte probando números). Cada mensaje
+entrante se escribe como una línea JSON compacta:
+
+    {"t": "2026-10-19T10:00:01.123", "u": "3f2a9c...", "ti": "+34911111111",
+     "p": 2, "i": null, "m": "mañana a las 12:30", "r": "Perfecto. Programado...", "ms": 0.41}
+
+  t   hora de llegada (reloj del servidor)
+  u   usuario anonimizado: HMAC-SHA256 con CAPTURA_SAL, 16 hex (estable entre días)
+  ti  tienda (número To) o ""
+  p   paso de la conversación al llegar el mensaje (0 = modo libre)
+  i   intención detectada
+  m   mensaje, r respuesta, ms latencia de process_message
+
+Mensaje y respuesta se guardan sin datos personales: el nombre del cliente
+pasa a ser "Cliente" (también su respuesta en el paso del nombre), correos y
+números de teléfono se sustituyen por "[contacto]" y los mensajes libres fuera
+de un pedido (sin intención) por "[texto libre]". Lo que mueve la conversación
+(productos, cantidades, fechas, comandos) se conserva para reproducirla.
+
+Ficheros: CAPTURA_DIR/captura-AAAAMMDD.jsonl; al pasar de CAPTURA_MAX_MB
+(50 por defecto) se abre captura-AAAAMMDD.1.jsonl, .2, ... y se borran los
+de más de CAPTURA_DIAS días (14 por defecto).
+"""
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+
+NOMBRE_ANONIMO = "Cliente"
+TEXTO_LIBRE = "[texto libre]"
+_CONTACTO_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\+?\d[\d .-]{7,}\d")
+
+
+def _contacto(m: re.Match) -> str:
+    # "1 2 3 4 5" también encaja en el patrón: un teléfono tiene al menos 9 cifras
+    encontrado = m.group()
+    if "@" in encontrado or sum(c.isdigit() for c in encontrado) >= 9:
+        return "[contacto]"
+    return encontrado
+
+
+class Captura:
+    def __init__(self, directorio: str, sal: str, max_bytes: int = 50 * 2 ** 20, dias: int = 14):
+        if not sal:
+            raise ValueError("La captura necesita una sal secreta (CAPTURA_SAL)")
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.dias = dias
+        self._sal = sal.encode("utf-8")
+        self._lock = threading.Lock()
+        self._f = None
+        self._dia = None
+        self._parte = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def anonimizar(self, user_id: str) -> str:
+        return hmac.new(self._sal, str(user_id).encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def redactar(self, texto: str, nombre: str | None = None) -> str:
+        """Texto sin el nombre del cliente ni correos o teléfonos."""
+        if nombre and nombre.strip():
+            texto = re.sub(re.escape(nombre.strip()), NOMBRE_ANONIMO, texto, flags=re.IGNORECASE)
+        return _CONTACTO_RE.sub(_contacto, texto)
+
+    def _ruta(self, dia: str, parte: int) -> str:
+        sufijo = f".{parte}" if parte else ""
+        return os.path.join(self.directorio, f"captura-{dia}{sufijo}.jsonl")
+
+    def _abrir(self, dia: str):
+        if self._f is not None:
+            self._f.close()
+        if dia != self._dia:
+            self._dia, self._parte = dia, 0
+            # continuar tras la última parte existente de ese día (reinicios)
+            while os.path.exists(self._ruta(dia, self._parte + 1)):
+                self._parte += 1
+            self._purgar()
+        self._f = open(self._ruta(dia, self._parte), "a", encoding="utf-8")
+
+    def _purgar(self):
+        limite = (datetime.now() - timedelta(days=self.dias)).strftime("%Y%m%d")
+        for ruta in glob.glob(os.path.join(self.directorio, "captura-*.jsonl")):
+            m = re.search(r"captura-(\d{8})", os.path.basename(ruta))
+            if m and m.group(1) < limite:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    def registrar(self, user_id, tienda, mensaje, respuesta, paso, intencion, segundos: float,
+                  nombre: str | None = None):
+        ahora = datetime.now()
+        if intencion is None and paso == 0:
+            mensaje = TEXTO_LIBRE
+        elif intencion is None and paso == 1:
+            mensaje = NOMBRE_ANONIMO
+        else:
+            mensaje = self.redactar(mensaje, nombre)
+        respuesta = self.redactar(respuesta if isinstance(respuesta, str) else str(respuesta), nombre)
+        linea = json.dumps({
+            "t": ahora.isoformat(timespec="milliseconds"),
+            "u": self.anonimizar(user_id),
+            "ti": tienda or "",
+            "p": paso,
+            "i": intencion,
+            "m": mensaje,
+            "r": respuesta,
+            "ms": round(segundos * 1e3, 3),
+        }, ensure_ascii=False, separators=(",", ":")) + "\n"
+        dia = ahora.strftime("%Y%m%d")
+        with self._lock:
+            try:
+                if self._f is None or dia != self._dia:
+                    self._abrir(dia)
+                elif self._f.tell() >= self.max_bytes:
+                    self._parte += 1
+                    self._abrir(dia)
+                self._f.write(linea)
+                self._f.flush()
+            except OSError:
+                logging.exception("Error escribiendo la captura de tráfico")
+
+    def cerrar(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+def leer_captura(rutas) -> list[dict]:
+    """Registros de uno o varios ficheros de captura, ordenados por hora."""
+    registros = []
+    for ruta in rutas:
+        with open(ruta, encoding="utf-8") as f:
+            registros.extend(json.loads(linea) for linea in f if linea.strip())
+    registros.sort(key=lambda r: r["t"])
+    return registros
+
+
+_CAPTURA = None
+_CAPTURA_LOCK = threading.Lock()
+_CAPTURA_LEIDA = False
+
+
+def obtener_captura() -> Captura | None:
+    """Captura del worker, o None si CAPTURA_DIR o CAPTURA_SAL no están definidos (coste: una comprobación)."""
+    global _CAPTURA, _CAPTURA_LEIDA
+    if _CAPTURA_LEIDA:
+        return _CAPTURA
+    with _CAPTURA_LOCK:
+        if not _CAPTURA_LEIDA:
+            directorio, sal = os.getenv("CAPTURA_DIR"), os.getenv("CAPTURA_SAL")
+            if directorio and not sal:
+                logging.error("Falta CAPTURA_SAL: captura de tráfico desactivada")
+            elif directorio:
+                _CAPTURA = Captura(
+                    directorio,
+                    sal=sal,
+                    max_bytes=int(float(os.getenv("CAPTURA_MAX_MB", "50")) * 2 ** 20),
+                    dias=int(os.getenv("CAPTURA_DIAS", "14")),
+                )
+                logging.info("Captura de tráfico activada en %s", directorio)
+            _CAPTURA_LEIDA = True
+    return _CAPTURA
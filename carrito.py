@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Operaciones estructuradas sobre el carrito, para canales que ya saben qué
+producto quieren (botones, formulario web, TPV): se identifica el producto por
+su ID del Excel y la hora como ISO, sin pasar por las expresiones ni el fuzzy.
+
+Trabajan sobre las mismas sesiones que utils.process_message, así que el
+cliente puede añadir por aquí y seguir el mismo pedido por el chat (o al revés).
+Todas aceptan `tienda` (ver tiendas.py); por defecto, la tienda por defecto.
+
+Acceso: cada usuario tiene su token, HMAC-SHA256 de su user_id con la clave
+CARRITO_CLAVE (token_usuario). El canal que conoce al cliente (la web tras el
+login, el TPV) lo calcula y lo manda en la cabecera X-Carrito-Token; sin
+CARRITO_CLAVE la API no existe (404), como /admin.
+
+Las sesiones nuevas empiezan en el paso de productos; si al decir 'listo'
+faltan el nombre o la hora, el chat los pide entonces.
+
+Errores:
+  - ProductoDesconocido (LookupError) si el ID no está en el catálogo
+  - ValueError con un mensaje para el cliente si los datos no son válidos
+"""
+import hashlib
+import hmac
+import math
+import os
+from datetime import datetime
+
+from franjas import obtener_agenda
+from tiendas import TIENDA_POR_DEFECTO
+from utils import agregar_item_carrito, formatear_fecha, mostrar_carrito
+
+UNIDADES = ("kg", "u")
+
+
+class ProductoDesconocido(LookupError):
+    pass
+
+
+def token_usuario(user_id: str, clave: str | None = None) -> str:
+    """Token de acceso a la API del carrito de `user_id` (hex)."""
+    clave = clave or os.getenv("CARRITO_CLAVE", "")
+    return hmac.new(clave.encode("utf-8"), str(user_id).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def api_activada() -> bool:
+    return bool(os.getenv("CARRITO_CLAVE"))
+
+
+def token_valido(user_id: str, token: str | None) -> bool:
+    return api_activada() and hmac.compare_digest(token or "", token_usuario(user_id))
+
+
+def _sesion_pedido(tienda, user_id: str) -> dict:
+    """
+    Sesión del usuario en modo pedido; la crea o la pasa a modo pedido si hace falta.
+    Una sesión nueva empieza en el paso 3: el siguiente mensaje del chat es un
+    producto o 'listo', no el nombre.
+    """
+    if not user_id:
+        raise ValueError("Usuario no identificado.")
+    session = tienda.sessions.get(user_id)
+    if session is None or session.get("modo") != "pedido":
+        session = {"modo": "pedido", "paso": 3, "carrito": {}, "msg_count": 0}
+        tienda.sessions[user_id] = session
+    return session
+
+
+def _producto(tienda, producto_id) -> str:
+    try:
+        prod = tienda.catalogo.productos_id.get(int(producto_id))
+    except (TypeError, ValueError):
+        prod = None
+    if prod is None:
+        raise ProductoDesconocido(f"No existe el producto con ID {producto_id}.")
+    return prod
+
+
+def _cantidad(valor, nombre: str) -> float:
+    try:
+        cantidad = float(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cantidad inválida en '{nombre}': {valor!r}.")
+    if not math.isfinite(cantidad):
+        raise ValueError(f"Cantidad inválida en '{nombre}': {valor!r}.")
+    if cantidad < 0:
+        raise ValueError(f"La cantidad en '{nombre}' no puede ser negativa.")
+    return cantidad
+
+
+def _carrito_modificado(session: dict):
+    # el resumen del paso 4 (carrito, nombre u hora) ya no vale: el cliente tiene que volver a decir 'listo'
+    if session["paso"] == 4:
+        session["paso"] = 3
+
+
+def estado(user_id: str, tienda=None) -> dict:
+    """Estado del pedido listo para JSON."""
+    tienda = tienda or TIENDA_POR_DEFECTO
+    session = tienda.sessions.get(user_id)
+    if session is None or session.get("modo") != "pedido":
+        return {"user_id": user_id, "en_pedido": False, "carrito": []}
+    lineas = []
+    for prod, cantidades in session["carrito"].items():
+        if not isinstance(cantidades, dict):
+            cantidades = {"kg": float(cantidades), "u": 0}
+        lineas.append({
+            "id": tienda.catalogo.ids_producto.get(prod),
+            "producto": prod.capitalize(),
+            "categoria": tienda.productos_db.get(prod),
+            "kg": float(cantidades.get("kg", 0.0)),
+            "u": int(cantidades.get("u", 0)),
+        })
+    hora = session.get("hora")
+    return {
+        "user_id": user_id,
+        "en_pedido": True,
+        "paso": session["paso"],
+        "nombre": session.get("nombre"),
+        "hora": hora.isoformat(timespec="minutes") if hora else None,
+        "carrito": lineas,
+        "texto": mostrar_carrito(session),
+    }
+
+
+def fijar_nombre(user_id: str, nombre: str, tienda=None) -> dict:
+    tienda = tienda or TIENDA_POR_DEFECTO
+    nombre = (nombre or "").strip()
+    if not nombre:
+        raise ValueError("Falta el nombre.")
+    session = _sesion_pedido(tienda, user_id)
+    session["nombre"] = nombre.title()
+    if session["paso"] == 1:
+        session["paso"] = 3 if session.get("hora") else 2
+    _carrito_modificado(session)
+    return estado(user_id, tienda)
+
+
+def agregar(user_id: str, producto_id, cantidad, unidad: str = "kg", tienda=None) -> dict:
+    """Suma cantidad (en kg o unidades) del producto al carrito."""
+    tienda = tienda or TIENDA_POR_DEFECTO
+    if unidad not in UNIDADES:
+        raise ValueError(f"Unidad inválida: {unidad!r} (usa 'kg' o 'u').")
+    prod = _producto(tienda, producto_id)
+    cantidad = _cantidad(cantidad, "cantidad")
+    if cantidad <= 0:
+        raise ValueError("La cantidad debe ser mayor que cero.")
+    session = _sesion_pedido(tienda, user_id)
+    agregar_item_carrito(session, prod, cantidad, unidad)
+    _carrito_modificado(session)
+    return estado(user_id, tienda)
+
+
+def fijar_cantidad(user_id: str, producto_id, kg=None, u=None, tienda=None) -> dict:
+    """
+    Deja el producto con exactamente kg y/o u (lo que no se indique se conserva).
+    Si ambas quedan a cero, se quita del carrito.
+    """
+    tienda = tienda or TIENDA_POR_DEFECTO
+    if kg is None and u is None:
+        raise ValueError("Indica 'kg' y/o 'u'.")
+    prod = _producto(tienda, producto_id)
+    session = _sesion_pedido(tienda, user_id)
+    entry = session["carrito"].get(prod)
+    if not isinstance(entry, dict):
+        entry = {"kg": float(entry or 0.0), "u": 0}
+    if kg is not None:
+        entry["kg"] = round(_cantidad(kg, "kg"), 3)
+    if u is not None:
+        entry["u"] = int(round(_cantidad(u, "u")))
+    if entry["kg"] <= 0 and entry["u"] <= 0:
+        session["carrito"].pop(prod, None)
+    else:
+        session["carrito"][prod] = entry
+    _carrito_modificado(session)
+    return estado(user_id, tienda)
+
+
+def quitar(user_id: str, producto_id, tienda=None) -> dict:
+    tienda = tienda or TIENDA_POR_DEFECTO
+    prod = _producto(tienda, producto_id)
+    session = _sesion_pedido(tienda, user_id)
+    if session["carrito"].pop(prod, None) is not None:
+        _carrito_modificado(session)
+    return estado(user_id, tienda)
+
+
+def fijar_hora(user_id: str, hora, tienda=None) -> dict:
+    """
+    hora: datetime o texto ISO ('2026-10-24T10:00'). Debe ser futura y caer en
+    una franja libre; si no, el ValueError sugiere los huecos más cercanos.
+    """
+    tienda = tienda or TIENDA_POR_DEFECTO
+    if isinstance(hora, str):
+        try:
+            hora = datetime.fromisoformat(hora.strip())
+        except ValueError:
+            raise ValueError(f"Hora inválida: {hora!r} (formato AAAA-MM-DDTHH:MM).")
+    if not isinstance(hora, datetime):
+        raise ValueError("Falta la hora de recogida.")
+    if hora.tzinfo is not None:
+        # con desplazamiento: a hora local, que es como se guardan y comparan las franjas
+        hora = hora.astimezone().replace(tzinfo=None)
+    hora = hora.replace(second=0, microsecond=0)
+    if hora <= datetime.now():
+        raise ValueError("La fecha y hora deben ser futuras.")
+
+    agenda = obtener_agenda(tienda.clave)
+    if not agenda.disponible(hora):
+        alternativas = ", ".join(formatear_fecha(dt) for dt in agenda.mas_cercanas(hora))
+        raise ValueError(f"La franja de {formatear_fecha(hora)} no está disponible. "
+                         f"Huecos libres más cercanos: {alternativas}.")
+
+    session = _sesion_pedido(tienda, user_id)
+    session.pop("alternativas", None)
+    session["hora"] = hora
+    if session["paso"] == 2:
+        session["paso"] = 3
+    _carrito_modificado(session)
+    return estado(user_id, tienda)
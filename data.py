@@ -1,12 +1,21 @@
 # data.py
+from functools import lru_cache
+
 import pandas as pd
 
+
+@lru_cache(maxsize=None)
+def _leer_excel(ruta_excel: str) -> pd.DataFrame:
+    """Lee el Excel una sola vez por ruta (productos y precios salen de la misma hoja)."""
+    return pd.read_excel(ruta_excel)
+
+
 def cargar_productos(ruta_excel: str = "productos_aranda.xlsx") -> dict[str, str]:
     """
     Carga los productos y sus categorías desde un Excel con columnas 'Nombre' y 'Categorias'
     Devuelve: {"pollo": "aves", "paella": "otro", ...}
     """
-    df = pd.read_excel(ruta_excel)
+    df = _leer_excel(ruta_excel)
 
     productos = {
         str(row["Nombre"]).lower().strip(): str(row["Categorías"]).lower().strip()
@@ -14,5 +23,44 @@ def cargar_productos(ruta_excel: str = "productos_aranda.xlsx") -> dict[str, str
     }
     return productos
 
+
+def _precio(valor) -> float | None:
+    try:
+        precio = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(precio) else precio
+
+
+def cargar_precios(ruta_excel: str = "productos_aranda.xlsx") -> dict[str, dict]:
+    """
+    Carga los precios por producto para los tickets.
+    Usa 'Precio/Kg' y 'Precio unit' si están; si no, el precio de catálogo ('Precio normal (ant)').
+    Devuelve: {"pollo entero": {"kg": 4.45, "u": 4.4}, ...}
+    """
+    df = _leer_excel(ruta_excel)
+
+    precios = {}
+    for _, row in df.iterrows():
+        catalogo = _precio(row.get("Precio normal (ant)"))
+        kg = _precio(row.get("Precio/Kg"))
+        u = _precio(row.get("Precio unit"))
+        precios[str(row["Nombre"]).lower().strip()] = {
+            "kg": kg if kg is not None else (catalogo or 0.0),
+            "u": u if u is not None else (catalogo or 0.0),
+        }
+    return precios
+
+def cargar_ids(ruta_excel: str = "productos_aranda.xlsx") -> dict[int, str]:
+    """
+    ID del Excel -> nombre de producto (la misma clave que PRODUCTOS_DB).
+    Devuelve: {12814: "pollo entero", ...}
+    """
+    df = _leer_excel(ruta_excel)
+    return {int(i): str(n).lower().strip() for i, n in zip(df["ID"], df["Nombre"])}
+
 # Para uso directo
 PRODUCTOS_DB = cargar_productos()
+PRECIOS_DB = cargar_precios()
+PRODUCTOS_ID = cargar_ids()
+IDS_PRODUCTO = {nombre: i for i, nombre in PRODUCTOS_ID.items()}
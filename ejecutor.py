@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Análisis de productos de mensajes largos en un pool de procesos.
+
+Una lista de la compra pegada de golpe (40 líneas) pasa entera por
+extraer_productos_desde_texto y _canonicalizar_producto, y mientras tanto el
+hilo tiene el GIL: el resto de clientes del worker esperan detrás.
+
+Política según el tamaño del mensaje:
+  - Menos de EJECUTOR_UMBRAL líneas (12 por defecto), o pool desactivado:
+    se analiza en el propio hilo, como siempre.
+  - Desde EJECUTOR_UMBRAL líneas: el texto se parte por saltos de línea en
+    trozos consecutivos, cada trozo va a un proceso del pool y los resultados
+    se juntan en el orden original. El hilo que espera suelta el GIL.
+
+Los trozos se cortan solo entre líneas, que ya separan segmentos en
+extraer_productos_desde_texto, y la limpieza de los bordes del mensaje (fillers
+al principio, números sueltos al final) solo se aplica al primer y al último
+trozo, así que el resultado es el mismo que analizando el mensaje entero.
+Las sesiones y el aprendizaje de sinónimos se quedan en el proceso principal:
+a los procesos solo llega el texto, la clave de la tienda y los sinónimos
+aprendidos.
+
+Pool "caliente": los procesos salen de un forkserver que ya ha importado
+expresiones y tiendas (catálogos cargados) y al arrancar construyen los
+índices de cada catálogo, así que la primera tarea no paga la carga.
+
+Variables: EJECUTOR_PROCESOS (0 por defecto: desactivado), EJECUTOR_UMBRAL,
+EJECUTOR_LINEAS_TROZO (mínimo de líneas por trozo, 6).
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from expresiones import _canonicalizar_producto, extraer_productos_desde_texto
+from sinonimos import obtener_sinonimos_aprendidos
+from tiendas import TIENDA_POR_DEFECTO, obtener_tienda, tiendas
+
+
+def analizar_productos(texto: str, tienda, aprendidos: dict, inicio: bool = True, fin: bool = True) -> list[tuple]:
+    """[(prod_crudo, cantidad, unidad, resultado de _canonicalizar_producto), ...] en orden."""
+    resultado = []
+    for prod, cantidad, unidad in extraer_productos_desde_texto(texto, tienda.productos_db, inicio, fin):
+        if isinstance(prod, (list, tuple)):
+            prod = " ".join(str(x) for x in prod)
+        real = _canonicalizar_producto(prod, tienda.productos_db, synonyms=tienda.synonyms, aprendidos=aprendidos)
+        resultado.append((prod, cantidad, unidad, real))
+    return resultado
+
+
+# --- Trabajo en cada proceso ---
+
+
+def _iniciar_trabajador():
+    # índices de cada catálogo (particiones, nombres normalizados) antes de la primera tarea
+    for tienda in {id(t): t for t in (TIENDA_POR_DEFECTO, *tiendas().values())}.values():
+        _canonicalizar_producto("pollo", tienda.productos_db, synonyms=tienda.synonyms, aprendidos={})
+
+
+def _analizar_trozo(clave_tienda: str, texto: str, aprendidos: dict, inicio: bool, fin: bool) -> list[tuple]:
+    return analizar_productos(texto, obtener_tienda(clave_tienda), aprendidos, inicio, fin)
+
+
+def _nada():
+    return None
+
+
+# --- Proceso principal ---
+
+
+class Ejecutor:
+    def __init__(self, procesos: int, umbral: int = 12, lineas_trozo: int = 6):
+        self.procesos = procesos
+        self.umbral = umbral
+        self.lineas_trozo = max(1, lineas_trozo)
+        metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        contexto = multiprocessing.get_context(metodo)
+        if metodo == "forkserver":
+            # no se hace fork del worker (hilos, locks de logging): los procesos salen de un
+            # servidor limpio que ya tiene los catálogos importados
+            contexto.set_forkserver_preload(["expresiones", "tiendas"])
+        self._pool = ProcessPoolExecutor(procesos, mp_context=contexto, initializer=_iniciar_trabajador)
+        for _ in range(procesos):   # arranca los procesos ya, no con el primer mensaje largo
+            self._pool.submit(_nada)
+        self.en_pool = 0
+        self.en_linea = 0
+
+    def trozos(self, texto: str) -> list[str]:
+        """Líneas consecutivas repartidas entre los procesos (una sola si el mensaje es corto)."""
+        lineas = texto.split("\n")
+        if len(lineas) < self.umbral:
+            return [texto]
+        tam = max(self.lineas_trozo, -(-len(lineas) // self.procesos))
+        return ["\n".join(lineas[i:i + tam]) for i in range(0, len(lineas), tam)]
+
+    def analizar(self, texto: str, tienda, aprendidos: dict) -> list[tuple]:
+        trozos = self.trozos(texto)
+        if len(trozos) == 1:
+            self.en_linea += 1
+            return analizar_productos(texto, tienda, aprendidos)
+        self.en_pool += 1
+        ultimo = len(trozos) - 1
+        futuros = [self._pool.submit(_analizar_trozo, tienda.clave, t, aprendidos, i == 0, i == ultimo)
+                   for i, t in enumerate(trozos)]
+        return [item for f in futuros for item in f.result()]
+
+    def cerrar(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+_EJECUTOR = None
+_EJECUTOR_LEIDO = False
+_EJECUTOR_LOCK = threading.Lock()
+
+
+def obtener_ejecutor() -> Ejecutor | None:
+    """Pool del worker, o None si EJECUTOR_PROCESOS no está activado."""
+    global _EJECUTOR, _EJECUTOR_LEIDO
+    if _EJECUTOR_LEIDO:
+        return _EJECUTOR
+    with _EJECUTOR_LOCK:
+        if not _EJECUTOR_LEIDO:
+            _EJECUTOR_LEIDO = True
+            procesos = int(os.getenv("EJECUTOR_PROCESOS", "0"))
+            if procesos <= 0:
+                return None
+            try:
+                ejecutor = Ejecutor(
+                    procesos,
+                    umbral=int(os.getenv("EJECUTOR_UMBRAL", "12")),
+                    lineas_trozo=int(os.getenv("EJECUTOR_LINEAS_TROZO", "6")),
+                )
+            except Exception:
+                logging.exception("No se pudo arrancar el pool de análisis: todo se analiza en línea")
+                return None
+            logging.info("Pool de análisis con %d procesos (mensajes desde %d líneas)", procesos, ejecutor.umbral)
+            atexit.register(ejecutor.cerrar)
+            _EJECUTOR = ejecutor
+    return _EJECUTOR
+
+
+def resolver_productos(texto: str, tienda) -> list[tuple]:
+    """Productos del mensaje ya canonicalizados, en línea o en el pool según su tamaño."""
+    aprendidos = obtener_sinonimos_aprendidos(tienda.clave).promovidos()
+    ejecutor = obtener_ejecutor()
+    if ejecutor is None:
+        return analizar_productos(texto, tienda, aprendidos)
+    try:
+        return ejecutor.analizar(texto, tienda, aprendidos)
+    except Exception:
+        # pool roto (proceso muerto por memoria, etc.): el cliente no lo nota
+        logging.exception("Fallo en el pool de análisis; se analiza en línea")
+        return analizar_productos(texto, tienda, aprendidos)
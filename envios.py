@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Entrega de tickets por correo con un cliente SendGrid de larga duración.
+
+- Un único transporte por worker (ver obtener_cliente_correo) que reutiliza
+  conexiones HTTP keep-alive en lugar de abrir un handshake HTTPS por pedido,
+  y un cliente por dirección de destino (cada tienda puede tener la suya).
+- Agrupación opcional de varios tickets en un solo correo resumen cuando hay
+  mucho movimiento (CORREO_LOTE_MAX > 1).
+- Transporte intercambiable: HTTP real contra la API v3 de SendGrid (o contra
+  el servidor falso de falsos.py) o en memoria para desarrollo.
+"""
+import atexit
+import base64
+import http.client
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from urllib.parse import urlsplit
+
+from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
+
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
+
+ASUNTO = "Ticket de compra - Carnicería El Buen Corte"
+CUERPO = "Adjunto encontrará su ticket de compra. ¡Gracias por confiar en nosotros!"
+
+
+class TransporteHTTP:
+    """
+    POST JSON a la API de SendGrid con un pool de conexiones keep-alive.
+    Una conexión del pool que el servidor ya ha cerrado se descarta antes de
+    usarla. Solo se reintenta (una vez, con otra conexión) si el envío falla
+    antes de mandar la petición; si falla después, el servidor pudo haberla
+    procesado y reintentar duplicaría el correo, así que se propaga el error.
+    """
+
+    def __init__(self, api_key: str, url: str = SENDGRID_URL, tam_pool: int = 4, timeout: float = 10.0):
+        partes = urlsplit(url)
+        self._https = partes.scheme == "https"
+        self._host = partes.hostname
+        self._puerto = partes.port
+        self._ruta = partes.path or "/"
+        self._timeout = timeout
+        self._cabeceras = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+        self._pool = queue.LifoQueue(maxsize=tam_pool)
+        self._lock = threading.Lock()
+        self.conexiones_abiertas = 0
+
+    def _conexion(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if self._viva(conn):
+                return conn
+            conn.close()
+        with self._lock:   # hilos de petición de Flask y el de lotes
+            self.conexiones_abiertas += 1
+        if self._https:
+            return http.client.HTTPSConnection(self._host, self._puerto, timeout=self._timeout)
+        return http.client.HTTPConnection(self._host, self._puerto, timeout=self._timeout)
+
+    @staticmethod
+    def _viva(conn) -> bool:
+        """False si el servidor ya cerró la conexión (en reposo, el socket solo es legible con EOF)."""
+        if conn.sock is None:
+            return True
+        try:
+            legible, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not legible
+
+    def _devolver(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _codificar(self, payload: dict) -> bytes:
+        return json.dumps(payload).encode("utf-8")
+
+    def enviar(self, payload: dict) -> int:
+        cuerpo = self._codificar(payload)
+        for intento in (1, 2):
+            conn = self._conexion()
+            try:
+                conn.request("POST", self._ruta, body=cuerpo, headers=self._cabeceras)
+            except (http.client.HTTPException, OSError):
+                # la petición no llegó a salir: reintentar no puede duplicar el envío
+                conn.close()
+                if intento == 2:
+                    raise
+                continue
+            try:
+                resp = conn.getresponse()
+                resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._devolver(conn)
+            return resp.status
+
+    def cerrar(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class TransporteMemoria:
+    """Guarda los correos en una lista en lugar de enviarlos (desarrollo sin red)."""
+
+    def __init__(self):
+        self.enviados = []
+
+    def enviar(self, payload: dict) -> int:
+        self.enviados.append(payload)
+        return 202
+
+    def cerrar(self):
+        pass
+
+
+def _leer_adjunto(ruta_ticket: str, tipo: str = "text/plain") -> Attachment:
+    with open(ruta_ticket, "rb") as f:
+        encoded_file = base64.b64encode(f.read()).decode()
+    return Attachment(
+        FileContent(encoded_file),
+        FileName(os.path.basename(ruta_ticket)),
+        FileType(tipo),
+        Disposition("attachment")
+    )
+
+
+class ClienteCorreo:
+    """
+    Cliente de correo de larga duración.
+    Con lote_max <= 1 cada ticket sale en su propio correo (comportamiento clásico).
+    Con lote_max > 1 los tickets se acumulan y se envían juntos en un correo
+    resumen al llegar a lote_max o al pasar lote_espera segundos desde el primero.
+    """
+
+    def __init__(self, transporte, remitente: str, destinatario: str,
+                 lote_max: int = 1, lote_espera: float = 30.0):
+        self.transporte = transporte
+        self.remitente = remitente
+        self.destinatario = destinatario
+        self.lote_max = max(1, int(lote_max))
+        self.lote_espera = lote_espera
+        self._pendientes = []
+        self._primero = None
+        self._cond = threading.Condition()
+        self.enviados = 0
+        self.fallidos = 0
+        self._cerrado = False
+        self._hilo = None
+        if self.lote_max > 1:
+            self._hilo = threading.Thread(target=self._bucle_lotes, name="correo-lotes", daemon=True)
+            self._hilo.start()
+
+    def _mail(self, adjuntos: list) -> dict:
+        if len(adjuntos) == 1:
+            asunto, cuerpo = ASUNTO, CUERPO
+        else:
+            asunto = f"Tickets de compra ({len(adjuntos)} pedidos) - Carnicería El Buen Corte"
+            cuerpo = f"Adjuntos encontrará {len(adjuntos)} tickets de compra."
+        message = Mail(
+            from_email=self.remitente,
+            to_emails=self.destinatario,
+            subject=asunto,
+            plain_text_content=cuerpo
+        )
+        message.attachment = adjuntos
+        return message.get()
+
+    def _enviar(self, adjuntos: list):
+        try:
+            status = self.transporte.enviar(self._mail(adjuntos))
+        except Exception:
+            self.fallidos += 1
+            logging.exception("Error enviando correo con SendGrid")
+            return
+        if status >= 300:
+            self.fallidos += 1
+            logging.error("SendGrid rechazó el correo (%d ticket(s)): Status %s", len(adjuntos), status)
+            return
+        self.enviados += 1
+        logging.info("Correo enviado (%d ticket(s)): Status %s", len(adjuntos), status)
+
+    def enviar_ticket(self, ruta_ticket: str, tipo: str = "text/plain"):
+        adjunto = _leer_adjunto(ruta_ticket, tipo)
+        if self.lote_max <= 1:
+            self._enviar([adjunto])
+            return
+        with self._cond:
+            self._pendientes.append(adjunto)
+            if self._primero is None:
+                self._primero = time.monotonic()
+            self._cond.notify()
+
+    def _tomar_lote(self) -> list:
+        lote = self._pendientes[:self.lote_max]
+        del self._pendientes[:self.lote_max]
+        self._primero = time.monotonic() if self._pendientes else None
+        return lote
+
+    def _bucle_lotes(self):
+        while True:
+            with self._cond:
+                while not self._cerrado:
+                    if len(self._pendientes) >= self.lote_max:
+                        break
+                    if self._primero is not None:
+                        restante = self._primero + self.lote_espera - time.monotonic()
+                        if restante <= 0:
+                            break
+                        self._cond.wait(restante)
+                    else:
+                        self._cond.wait()
+                lote = self._tomar_lote()
+                terminar = self._cerrado and not self._pendientes
+            if lote:
+                self._enviar(lote)
+            if terminar:
+                return
+
+    def vaciar(self):
+        """Envía ya todo lo que haya pendiente."""
+        while True:
+            with self._cond:
+                lote = self._tomar_lote()
+            if not lote:
+                return
+            self._enviar(lote)
+
+    def cerrar(self, cerrar_transporte: bool = True):
+        """Envía lo pendiente y para el hilo de lotes; cerrar_transporte=False si el transporte es compartido."""
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify()
+        if self._hilo:
+            self._hilo.join()
+        if cerrar_transporte:
+            self.transporte.cerrar()
+
+
+_TRANSPORTE = None
+_CLIENTES = {}   # destinatario -> ClienteCorreo
+_CLIENTE_LOCK = threading.Lock()
+
+
+def _cerrar_clientes():
+    """Al apagar el worker: vacía los lotes de todos los clientes y luego cierra el transporte común, una vez."""
+    for cliente in list(_CLIENTES.values()):
+        cliente.cerrar(cerrar_transporte=False)
+    if _TRANSPORTE is not None:
+        _TRANSPORTE.cerrar()
+
+
+def obtener_cliente_correo(destinatario: str | None = None):
+    """
+    Devuelve el cliente de correo del worker para `destinatario` (por defecto
+    EMAIL_DESTINO); se crea una sola vez por dirección y todos comparten el
+    mismo transporte.
+    Variables de entorno:
+      SENDGRID_API_KEY, SENDGRID_URL (p.ej. el servidor falso local),
+      EMAIL_DESTINO, EMAIL_REMITENTE, CORREO_LOTE_MAX, CORREO_LOTE_ESPERA,
+      CORREO_TRANSPORTE=memoria para no salir a la red.
+    Devuelve None si no hay configuración suficiente.
+    """
+    global _TRANSPORTE
+    destinatario = destinatario or os.getenv("EMAIL_DESTINO", "vbavierita@gmail.com")
+    cliente = _CLIENTES.get(destinatario)
+    if cliente is not None:
+        return cliente
+    with _CLIENTE_LOCK:
+        cliente = _CLIENTES.get(destinatario)
+        if cliente is not None:
+            return cliente
+
+        if _TRANSPORTE is None:
+            if os.getenv("CORREO_TRANSPORTE") == "memoria":
+                _TRANSPORTE = TransporteMemoria()
+            else:
+                SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
+                if not SENDGRID_API_KEY:
+                    logging.error("Falta la variable de entorno SENDGRID_API_KEY")
+                    return None
+                _TRANSPORTE = TransporteHTTP(SENDGRID_API_KEY, os.getenv("SENDGRID_URL", SENDGRID_URL))
+            # que no se pierdan tickets de los lotes al apagar el worker
+            atexit.register(_cerrar_clientes)
+
+        cliente = ClienteCorreo(
+            _TRANSPORTE,
+            remitente=os.getenv("EMAIL_REMITENTE", "patatavfb6@gmail.com"),
+            destinatario=destinatario,
+            lote_max=int(os.getenv("CORREO_LOTE_MAX", "1")),
+            lote_espera=float(os.getenv("CORREO_LOTE_ESPERA", "30")),
+        )
+        _CLIENTES[destinatario] = cliente
+        return cliente
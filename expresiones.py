@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import logging
 import re
 from thefuzz import process, fuzz
 import unicodedata
@@ -302,7 +303,24 @@ def _normalize(text) -> str:
 # 1. Índice normalizado
 INDEX_NORMALIZADO = { _normalize(k): k for k in PRODUCTOS_DB }
 
-SYNONYMS = {
+def resolver_sinonimos(synonyms: dict, index_normalizado: dict) -> dict:
+    """
+    {sinónimo: clave del catálogo}. Los destinos se escriben como el nombre
+    visible ("Filetes de pechuga entera") y aquí se traducen a la clave del
+    catálogo a través de su índice normalizado; los que no están en el
+    catálogo se descartan con un aviso.
+    """
+    resueltos = {}
+    for sinonimo, destino in synonyms.items():
+        producto = index_normalizado.get(_normalize(destino))
+        if producto is None:
+            logging.warning("Sinónimo %r descartado: %r no está en el catálogo", sinonimo, destino)
+            continue
+        resueltos[sinonimo] = producto
+    return resueltos
+
+
+SYNONYMS = resolver_sinonimos({
     "pollos enteros": "Pollo entero",
     "pollo al horno": "Pollo entero",
     "alita de pollo": "Alas de pollo",
@@ -322,8 +340,81 @@ SYNONYMS = {
     "cordero medio": "Cordero lechal medio",
     "muslitos de pollo": "Muslitos de pollo rellenos sin cocinar",
     # puedes ir ampliando con lo que digan tus clientes
+}, INDEX_NORMALIZADO)
+
+# --- Particiones del catálogo por categoría ---
+# Si el texto nombra una categoría ("alitas de pollo", "costilla de cerdo"), el
+# fuzzy y las sugerencias solo puntúan los productos de esa categoría.
+PALABRAS_CATEGORIA = {
+    "pollo": "aves de corral", "pollos": "aves de corral", "gallina": "aves de corral",
+    "pavo": "aves de corral", "aves": "aves de corral", "ave": "aves de corral",
+    "cerdo": "cerdo", "cerdos": "cerdo", "porcino": "cerdo", "cochinillo": "cerdo",
+    "ternera": "ternera", "vacuno": "ternera", "vaca": "ternera", "buey": "ternera",
+    "cordero": "cordero", "corderos": "cordero", "lechal": "cordero",
 }
 
+_PARTICIONES = {}  # id(productos_db) -> (productos_db, {categoria: [productos]}, [productos])
+
+
+def particiones_catalogo(productos_db) -> tuple[dict, list]:
+    """({categoria: [productos]}, [todos los productos]) del catálogo, calculado una vez por catálogo."""
+    entrada = _PARTICIONES.get(id(productos_db))
+    if entrada is None or entrada[0] is not productos_db or len(entrada[2]) != len(productos_db):
+        por_categoria = {}
+        for prod, categoria in productos_db.items():
+            por_categoria.setdefault(categoria, []).append(prod)
+        entrada = _PARTICIONES[id(productos_db)] = (productos_db, por_categoria, list(productos_db))
+    return entrada[1], entrada[2]
+
+
+_NORMALIZADOS_CATALOGO = {}  # id(productos_db) -> (productos_db, [(producto, normalizado)], {normalizado: producto})
+_SINONIMOS_NORM = {}         # id(synonyms) -> (synonyms, len, {sinónimo normalizado: producto})
+
+
+def normalizados_catalogo(productos_db) -> tuple[list, dict]:
+    """
+    ([(producto, nombre normalizado)], {normalizado: primer producto con esa forma}),
+    calculado una vez por catálogo en lugar de normalizar el catálogo en cada búsqueda.
+    """
+    entrada = _NORMALIZADOS_CATALOGO.get(id(productos_db))
+    if entrada is None or entrada[0] is not productos_db or len(entrada[1]) != len(productos_db):
+        pares = [(p, _normalize(p)) for p in productos_db]
+        exactos = {}
+        for p, norm in pares:
+            exactos.setdefault(norm, p)
+        entrada = _NORMALIZADOS_CATALOGO[id(productos_db)] = (productos_db, pares, exactos)
+    return entrada[1], entrada[2]
+
+
+def _sinonimos_normalizados(synonyms) -> dict:
+    entrada = _SINONIMOS_NORM.get(id(synonyms))
+    if entrada is None or entrada[0] is not synonyms or entrada[1] != len(synonyms):
+        entrada = _SINONIMOS_NORM[id(synonyms)] = (
+            synonyms, len(synonyms), {_normalize(k): v for k, v in synonyms.items()})
+    return entrada[2]
+
+
+def detectar_categoria(texto_norm: str, productos_db) -> str | None:
+    """Categoría nombrada en el texto (ya normalizado), si es una sola y existe en el catálogo."""
+    categorias = {PALABRAS_CATEGORIA[w] for w in texto_norm.split() if w in PALABRAS_CATEGORIA}
+    if len(categorias) != 1:
+        return None
+    categoria = categorias.pop()
+    return categoria if categoria in particiones_catalogo(productos_db)[0] else None
+
+
+def candidatos_fuzzy(texto_norm: str, productos_db) -> list[str]:
+    """Nombres de producto a puntuar: la partición de la categoría detectada o el catálogo entero."""
+    por_categoria, todos = particiones_catalogo(productos_db)
+    categoria = detectar_categoria(texto_norm, productos_db)
+    return por_categoria[categoria] if categoria else todos
+
+
+def sugerencias_producto(texto: str, productos_db, limit: int = 3, minimo: float = 0) -> list[str]:
+    """Hasta `limit` productos parecidos a texto (dentro de su categoría si la nombra)."""
+    candidatos = candidatos_fuzzy(_normalize(texto), productos_db)
+    return [p for p, s, _ in process.extract(texto, candidatos, limit=limit) if s >= minimo]
+
 # --- Función de búsqueda ligera
 def _buscar_producto_fuzzy(texto: str, catalogo=None) -> str | None:
     """Devuelve el producto más parecido o None (sin mensajes ni sugerencias)."""
@@ -338,8 +429,9 @@ def _buscar_producto_fuzzy(texto: str, catalogo=None) -> str | None:
             return p
 
     # 2) Sinónimos
-    if norm_input in SYNONYMS:
-        return SYNONYMS[norm_input]
+    sinonimo = _sinonimos_normalizados(SYNONYMS).get(norm_input)
+    if sinonimo in (catalogo or PRODUCTOS_DB):
+        return sinonimo
 
     # 3) Fuzzy
     best, score, _ = process.extractOne(texto, catalogo or PRODUCTOS_DB)
@@ -372,7 +464,8 @@ def buscar_producto_conversacional(pedido: str, catalogo=None) -> str:
 # ----------------------------
 
 # --- _canonicalizar_producto (sin cambios lógicos, robusta) ---
-def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85) -> str | list[str] | None:
+def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85, synonyms=None,
+                            aprendidos=None) -> str | list[str] | None:
     """
     Canonicaliza uno o varios productos en la misma frase.
     Devuelve:
@@ -381,13 +474,16 @@ def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85) -
       - None: nada encontrado
     Si prod_raw es una lista/tuple, intenta canonicalizar cada elemento.
     Si prod_raw es un str con separadores devuelve lista de resultados (o un único resultado si sólo había uno).
+    synonyms: sinónimos de la tienda (por defecto SYNONYMS).
+    aprendidos: {texto normalizado: producto} elegidos por los clientes (ver sinonimos.py);
+      se consultan justo después de la coincidencia exacta.
     """
     if not prod_raw:
         return None
 
     # Si nos pasan repetidos/colección -> canonicalizar cada uno recursivamente
     if isinstance(prod_raw, (list, tuple)):
-        resultados = [ _canonicalizar_producto(x, productos_db, fuzzy_threshold) for x in prod_raw ]
+        resultados = [ _canonicalizar_producto(x, productos_db, fuzzy_threshold, synonyms, aprendidos) for x in prod_raw ]
         # mantener la estructura: devolver lista si hay varios elementos
         return resultados if len(resultados) > 1 else resultados[0]
 
@@ -397,27 +493,32 @@ def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85) -
     else:
         segmentos = [str(prod_raw)]
 
-    # normalizar mapa de sinónimos para lookup por clave normalizada
-    syn_map = { _normalize(k): v for k, v in SYNONYMS.items() }
+    # mapas normalizados (calculados una vez por catálogo / tabla de sinónimos)
+    syn_map = _sinonimos_normalizados(SYNONYMS if synonyms is None else synonyms)
+    normalizados, exactos = normalizados_catalogo(productos_db)
 
     resultados = []
     for seg in segmentos:
         seg_norm = _normalize(seg)
 
         # 1) Exact match
-        exact_matches = [p for p in productos_db if _normalize(p) == seg_norm]
-        if exact_matches:
-            resultados.append(exact_matches[0])
+        if seg_norm in exactos:
+            resultados.append(exactos[seg_norm])
+            continue
+
+        # 1b) Aprendidos (solo si el producto existe en este catálogo)
+        if aprendidos and aprendidos.get(seg_norm) in productos_db:
+            resultados.append(aprendidos[seg_norm])
             continue
 
-        # 2) Sinónimos (buscamos en el mapa normalizado)
-        if seg_norm in syn_map:
+        # 2) Sinónimos (buscamos en el mapa normalizado; solo si el producto existe en este catálogo)
+        if syn_map.get(seg_norm) in productos_db:
             resultados.append(syn_map[seg_norm])
             continue
 
         # 3) Coincidencia por keywords (todas las palabras deben aparecer)
         palabras = set(seg_norm.split())
-        candidatos = [p for p in productos_db if palabras and all(w in _normalize(p) for w in palabras)]
+        candidatos = [p for p, norm in normalizados if palabras and all(w in norm for w in palabras)]
         if candidatos:
             if len(candidatos) == 1:
                 resultados.append(candidatos[0])
@@ -425,8 +526,9 @@ def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85) -
                 resultados.append(candidatos)  # ambigüedad (lista)
             continue
 
-        # 4) Fuzzy (fallback)
-        maybe = process.extractOne(seg, productos_db)
+        # 4) Fuzzy (fallback), solo sobre la partición de la categoría si se nombra
+        candidatos = candidatos_fuzzy(seg_norm, productos_db)
+        maybe = process.extractOne(seg, candidatos)
         if maybe:
             best_match, score, _ = maybe
             if score >= fuzzy_threshold:
@@ -434,7 +536,7 @@ def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85) -
                 continue
 
         # 5) Top-N sugerencias (si ninguna supera el threshold)
-        sugerencias = [p for p, s, _ in process.extract(seg, productos_db, limit=3) if s >= 60]
+        sugerencias = [p for p, s, _ in process.extract(seg, candidatos, limit=3) if s >= 60]
         if sugerencias:
             resultados.append(sugerencias)
         else:
@@ -450,11 +552,14 @@ def _canonicalizar_producto(prod_raw, productos_db, fuzzy_threshold: int = 85) -
 
 
 # --- extraer_productos_desde_texto (DEVUELVE el producto CRUDO, no canonicaliza) ---
-def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, float, str]]:
+def extraer_productos_desde_texto(texto: str, productos_db, inicio: bool = True,
+                                  fin: bool = True) -> list[tuple[str, float, str]]:
     """
     Extrae [(producto_crudo, cantidad, unidad), ...] desde un mensaje libre.
     - unidad: "kg" si el cliente dijo kg/g (se convierte a kg), "u" si habló de piezas.
     - Soporta varios productos en la misma frase separados por ',', ';', '+', '/', 'y' o '\n'.
+    - inicio / fin: el texto es el principio / el final del mensaje. Con un trozo
+      intermedio (ejecutor.py) no se quitan fillers ni ruido numérico de los bordes.
     - IMPORTANTE: aquí NO canonicalizamos el producto — devolvemos la cadena tal cual;
       la canonicalización la hará el flujo principal (utils) para decidir añadir/sugerir.
     """
@@ -462,19 +567,20 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
         return []
 
     raw = texto.strip().lower()
-    print(f"Texto original: '{raw}'")
+    logging.debug("Texto original: '%s'", raw)
 
     # 0) Quitar fillers al INICIO (repetidos)
-    while True:
+    while inicio:
         nuevo = _FILLER_INICIO.sub("", raw).strip()
         if nuevo == raw:
             break
         raw = nuevo
-    print(f"Después de quitar fillers: '{raw}'")
+    logging.debug("Después de quitar fillers: '%s'", raw)
 
     # 0.1) Limpiar posible ruido numérico al final
-    raw = re.sub(r"\s+\d{3,}\b$", "", raw)
-    print(f"Después de quitar números largos al final: '{raw}'")
+    if fin:
+        raw = re.sub(r"\s+\d{3,}\b$", "", raw)
+    logging.debug("Después de quitar números largos al final: '%s'", raw)
 
     # 1) Normalización de cantidades coloquiales
     reemplazos_qty = [
@@ -489,11 +595,11 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
     ]
     for pat, rep in reemplazos_qty:
         raw = re.sub(pat, rep, raw)
-    print(f"Después de normalizar cantidades: '{raw}'")
+    logging.debug("Después de normalizar cantidades: '%s'", raw)
 
     # 2) Trocear en segmentos por separadores (incluimos 'y' como separador)
     segmentos = [s.strip() for s in re.split(r"\s*(?:,|;|\+|/|y|\n)\s*", raw) if s.strip()]
-    print(f"Segmentos detectados: {segmentos}")
+    logging.debug("Segmentos detectados: %s", segmentos)
 
     items: list[tuple[str, float, str]] = []
 
@@ -511,7 +617,7 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
             return 0.0
 
     for seg in segmentos:
-        print(f"Procesando segmento: '{seg}'")
+        logging.debug("Procesando segmento: '%s'", seg)
         seg = _FILLER_INICIO.sub("", seg).strip()
         if not seg:
             continue
@@ -522,7 +628,7 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
             qty_raw = m.group("qty")
             unit_raw = (m.group("unit") or "").lower()
             prod = m.group("prod").strip()   # <-- devolvemos PRODUCTO CRUDO
-            print(f"Matched _PAT_QTY_DE_PROD: prod='{prod}', qty='{qty_raw}', unit='{unit_raw}'")
+            logging.debug("Matched _PAT_QTY_DE_PROD: prod='%s', qty='%s', unit='%s'", prod, qty_raw, unit_raw)
             if unit_raw in _KG_TOKENS or unit_raw in _G_TOKENS:
                 qty = _parse_qty(qty_raw, unit_raw)
                 unit = "kg"
@@ -539,7 +645,7 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
             qty_raw = m.group("qty")
             unit_raw = (m.group("unit") or "").lower()
             prod = m.group("prod").strip()
-            print(f"Matched _PAT_PROD_QTY: prod='{prod}', qty='{qty_raw}', unit='{unit_raw}'")
+            logging.debug("Matched _PAT_PROD_QTY: prod='%s', qty='%s', unit='%s'", prod, qty_raw, unit_raw)
             if unit_raw in _KG_TOKENS or unit_raw in _G_TOKENS:
                 qty = _parse_qty(qty_raw, unit_raw)
                 unit = "kg"
@@ -556,7 +662,7 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
             num_raw = m.group("num")
             unit_raw = (m.group("unit") or "").lower()
             prod = m.group("prod").strip()
-            print(f"Matched _PAT_NUM_TXT: prod='{prod}', num='{num_raw}', unit='{unit_raw}'")
+            logging.debug("Matched _PAT_NUM_TXT: prod='%s', num='%s', unit='%s'", prod, num_raw, unit_raw)
             if unit_raw in _KG_TOKENS or unit_raw in _G_TOKENS:
                 qty = _parse_qty(num_raw, unit_raw)
                 unit = "kg"
@@ -575,7 +681,7 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
         if m:
             qty = _parse_qty(m.group("num"), "kg")
             prod = m.group("prod").strip()
-            print(f"Matched 'producto medio': prod='{prod}', qty={qty}")
+            logging.debug("Matched 'producto medio': prod='%s', qty=%s", prod, qty)
             if prod and qty > 0:
                 items.append((prod, qty, "kg"))
             continue
@@ -586,12 +692,12 @@ def extraer_productos_desde_texto(texto: str, productos_db) -> list[tuple[str, f
             num_raw = m.group("num").lower()
             qty = float(_NUM_TXT.get(num_raw, num_raw)) if num_raw in _NUM_TXT else float(num_raw)
             prod = m.group("prod").strip()
-            print(f"Matched _PAT_UNIDADES_PIEZAS: prod='{prod}', qty={qty}")
+            logging.debug("Matched _PAT_UNIDADES_PIEZAS: prod='%s', qty=%s", prod, qty)
             if prod and qty > 0:
                 items.append((prod, qty, "u"))
             continue
 
-        print(f"No match para segmento: '{seg}'")
+        logging.debug("No match para segmento: '%s'", seg)
 
-    print(f"Items extraídos: {items}")
+    logging.debug("Items extraídos: %s", items)
     return items
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Servidores HTTP locales y dispositivos que imitan a los servicios externos
+(SendGrid, impresora térmica...) para probar y medir el bot sin salir a la red.
+
+Uso:
+    with ServidorSendGridFalso() as srv:
+        os.environ["SENDGRID_URL"] = srv.url
+        ...
+        print(len(srv.recibidos), srv.conexiones)
+"""
+import json
+import os
+from urllib.parse import parse_qs
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _ManejadorFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive como el servicio real
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexiones += 1
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length", 0))
+        cuerpo = self.rfile.read(largo)
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            payload = {k: v[0] for k, v in parse_qs(cuerpo.decode("utf-8", "replace")).items()}
+        else:
+            try:
+                payload = json.loads(cuerpo or b"{}")
+            except ValueError:
+                payload = cuerpo.decode("utf-8", "replace")
+        with self.server.lock:
+            self.server.recibidos.append({"ruta": self.path, "cabeceras": dict(self.headers), "payload": payload})
+        if self.server.retardo:
+            time.sleep(self.server.retardo)
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServidorFalso:
+    """Servidor HTTP en un hilo que guarda cada POST recibido y responde `status`."""
+
+    ruta = "/"
+    status = 200
+
+    def __init__(self, puerto: int = 0, retardo: float = 0.0):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", puerto), _ManejadorFalso)
+        self._httpd.daemon_threads = True
+        self._httpd.lock = threading.Lock()
+        self._httpd.recibidos = []
+        self._httpd.conexiones = 0
+        self._httpd.retardo = retardo
+        self._httpd.status = self.status
+        self._hilo = None
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._httpd.server_address[:2]
+        return f"http://{host}:{puerto}{self.ruta}"
+
+    @property
+    def recibidos(self) -> list:
+        return self._httpd.recibidos
+
+    @property
+    def conexiones(self) -> int:
+        return self._httpd.conexiones
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def parar(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+class ServidorSendGridFalso(ServidorFalso):
+    """Imita POST /v3/mail/send de SendGrid (responde 202 Accepted)."""
+
+    ruta = "/v3/mail/send"
+    status = 202
+
+
+class ServidorTwilioFalso(ServidorFalso):
+    """Imita POST .../Messages.json de la API de Twilio (formulario From/To/Body, responde 201)."""
+
+    ruta = "/2010-04-01/Accounts/ACfalso/Messages.json"
+    status = 201
+
+
+class ImpresoraFalsaPTY:
+    """
+    Pseudo-TTY que hace de impresora térmica: el spooler escribe en `ruta`
+    (el lado esclavo, como si fuera /dev/ttyUSB0) y aquí se acumulan los bytes
+    recibidos por el lado maestro.
+    """
+
+    def __init__(self):
+        import pty
+        import tty
+        self._maestro, self._esclavo = pty.openpty()
+        tty.setraw(self._esclavo)          # sin traducir \n -> \r\n
+        self.ruta = os.ttyname(self._esclavo)
+        self._datos = bytearray()
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._leer, daemon=True)
+        self._hilo.start()
+
+    def _leer(self):
+        while True:
+            try:
+                bloque = os.read(self._maestro, 4096)
+            except OSError:
+                return
+            if not bloque:
+                return
+            with self._lock:
+                self._datos += bloque
+
+    @property
+    def datos(self) -> bytes:
+        with self._lock:
+            return bytes(self._datos)
+
+    def cerrar(self):
+        for fd in (self._esclavo, self._maestro):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
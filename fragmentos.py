@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Caché de fragmentos de respuesta: textos fijos (bienvenida, horario, ayuda de
+formatos) y páginas del catálogo por categoría ya troceadas al tamaño de un
+mensaje de WhatsApp. Se construye una vez por objeto de catálogo (FRAGMENTOS
+para el de data.py; tiendas.Catalogo para los de cada tienda) y no se recarga:
+un catálogo nuevo es un objeto Catalogo nuevo con sus propios fragmentos. Así
+"ver catálogo" / "ver aves 2" cuestan un lookup de diccionario por mensaje.
+"""
+import re
+
+from unidecode import unidecode
+
+from data import PRODUCTOS_DB
+
+# Twilio corta los mensajes de WhatsApp a 1600 caracteres; dejamos margen
+LIMITE_MENSAJE = 1500
+
+HORARIO = "⏰ *Horario*: Lunes a Sábado de 9:00 a 14:00 y de 17:00 a 20:00."
+
+TEXTOS = {
+    "bienvenida": (
+        "Hola 😊. Bienvenido a la carnicería.\n"
+        f"{HORARIO}\n"
+        "Puedes escribirme lo que quieras y te atenderemos lo antes posible.\n"
+        "Cuando quieras encargar algo, simplemente escribe *'iniciar pedido'*.\n"
+        "Para ver lo que tenemos escribe *'ver catálogo'*."
+    ),
+    "recordatorio": "Recuerda que para encargar algo debes escribir *'iniciar pedido'*.",
+    "aviso_recogida": ("⏰ ¡Hola{nombre}! Te recordamos que tu pedido estará listo para recoger "
+                       "el *{hora}*. ¡Te esperamos!"),
+    "horario": HORARIO,
+    "inicio_pedido": "Genial 👍. Vamos a empezar tu pedido.\n¿Cuál es tu nombre?",
+    "repetir_sin_pedidos": ("Todavía no tengo ningún pedido tuyo confirmado 🤔. "
+                            "Escribe *'iniciar pedido'* para hacer el primero."),
+    "repetir_retirados": ("Los productos de tu pedido anterior ya no están en el catálogo 😕. "
+                          "Escribe *'iniciar pedido'* para hacer uno nuevo."),
+    "repetir_siguiente": "Añade o quita lo que quieras, o escribe 'listo' para terminar.",
+    "pedir_fecha": ("Por favor, indícanos el *día* y la *hora*.\n"
+                    "Ejemplos: 'martes a las 18:00', '13/08 18:00', 'mañana a las 12:30', "
+                    "'este viernes a las 13', 'el 20 por la tarde', 'pasado mañana 10:00'."),
+    "ayuda_fecha": ("Por favor, indica *día y hora* con uno de estos formatos:\n"
+                    "• martes a las 18:00\n"
+                    "• 13/08 18:00\n"
+                    "• mañana a las 12:30\n"
+                    "• este viernes por la tarde\n"),
+    "instrucciones_productos": ("Dime qué quieres y la cantidad.\n"
+                                "Para eliminar un producto: 'eliminar pollo'.\n"
+                                "Para ver productos: 'ver catálogo' o 'ver aves'.\n"
+                                "Cuando termines, escribe 'listo'."),
+}
+
+# Palabras que el cliente usa para cada categoría del Excel
+ALIAS_CATEGORIAS = {
+    "aves": "aves de corral",
+    "pollo": "aves de corral",
+    "aves de corral": "aves de corral",
+    "cerdo": "cerdo",
+    "ternera": "ternera",
+    "vacuno": "ternera",
+    "vaca": "ternera",
+    "cordero": "cordero",
+    "otros": "otros",
+}
+
+
+def _norm(texto: str) -> str:
+    return re.sub(r"\s+", " ", unidecode(texto.lower())).strip()
+
+
+def _paginar(titulo: str, lineas: list[str], comando: str, limite: int) -> list[str]:
+    """Trocea lineas en mensajes de como mucho `limite` caracteres con cabecera y pie."""
+    reserva = len(titulo) + len(comando) + 60
+
+    def _trocear(maximo):
+        paginas, actual, largo = [], [], 0
+        for linea in lineas:
+            if actual and largo + len(linea) + 1 > maximo:
+                paginas.append(actual)
+                actual, largo = [], 0
+            actual.append(linea)
+            largo += len(linea) + 1
+        if actual or not paginas:
+            paginas.append(actual)
+        return paginas
+
+    paginas = _trocear(limite - reserva)
+    if len(paginas) > 1:
+        # repartir parejo entre el mismo número de páginas (sin una última casi vacía)
+        total_chars = sum(len(linea) + 1 for linea in lineas)
+        equilibradas = _trocear(-(-total_chars // len(paginas)) + max(len(linea) for linea in lineas))
+        if len(equilibradas) == len(paginas):
+            paginas = equilibradas
+
+    total = len(paginas)
+    textos = []
+    for i, pagina in enumerate(paginas, 1):
+        cabecera = f"📋 *{titulo}*" + (f" ({i}/{total})" if total > 1 else "")
+        pie = f"\nEscribe '{comando} {i + 1}' para ver más." if i < total else ""
+        textos.append(cabecera + "\n" + "\n".join(pagina) + pie)
+    return textos
+
+
+def construir_fragmentos(productos_db: dict, limite: int = LIMITE_MENSAJE) -> dict:
+    """
+    Devuelve {"textos": {...}, "catalogo": {categoria: [paginas]}, "indice": [paginas],
+              "alias": {alias_normalizado: categoria}}
+    """
+    por_categoria = {}
+    for prod, categoria in productos_db.items():
+        por_categoria.setdefault(categoria, []).append(prod)
+
+    alias = {_norm(k): v for k, v in ALIAS_CATEGORIAS.items() if v in por_categoria}
+    alias.update({_norm(c): c for c in por_categoria})
+    # comando sugerido: el primer alias declarado para la categoría, o su nombre
+    comando_de = {}
+    for a, c in alias.items():
+        comando_de.setdefault(c, f"ver {a}")
+
+    catalogo = {}
+    for categoria, productos in por_categoria.items():
+        lineas = [f"- {p.capitalize()}" for p in sorted(productos)]
+        catalogo[categoria] = _paginar(categoria.capitalize(), lineas, comando_de[categoria], limite)
+
+    resumen = [f"• {c.capitalize()} ({len(p)}): escribe '{comando_de[c]}'"
+               for c, p in sorted(por_categoria.items())]
+    indice = _paginar("Catálogo", resumen, "ver catalogo", limite)
+
+    return {"textos": dict(TEXTOS), "catalogo": catalogo, "indice": indice, "alias": alias}
+
+
+FRAGMENTOS = construir_fragmentos(PRODUCTOS_DB)
+
+_VER_RE = re.compile(r"^(?:ver|mostrar|ensename)\s+(?P<que>[a-z ]+?)(?:\s+(?P<pagina>\d+))?$")
+
+
+def texto(clave: str, fragmentos: dict | None = None) -> str:
+    return (fragmentos or FRAGMENTOS)["textos"][clave]
+
+
+def respuesta_catalogo(msg: str, fragmentos: dict | None = None) -> str | None:
+    """
+    Si msg es un comando de catálogo ('ver catálogo', 'ver aves', 'ver cerdo 2'...)
+    devuelve la página ya renderizada; si no, None.
+    """
+    fragmentos = fragmentos or FRAGMENTOS
+    m = _VER_RE.match(_norm(msg))
+    if not m:
+        return None
+    que = m.group("que")
+    pagina = int(m.group("pagina") or 1)
+    if que in ("catalogo", "carta", "productos", "todo"):
+        paginas = fragmentos["indice"]
+    elif que in fragmentos["alias"]:
+        paginas = fragmentos["catalogo"][fragmentos["alias"][que]]
+    else:
+        return None
+    return paginas[min(max(pagina, 1), len(paginas)) - 1]
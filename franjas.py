@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Franjas de recogida con capacidad (horario de la tienda del saludo:
+Lunes a Sábado de 9:00 a 14:00 y de 17:00 a 20:00).
+
+Cada franja abierta tiene un número de orden consecutivo (ordinal) que se
+calcula aritméticamente, sin tablas: lunes 9:00 de una semana va justo después
+de sábado 19:30 de la anterior. Sobre esos ordinales se guardan:
+  - _ocupacion: {ordinal: pedidos reservados}
+  - _llenas_ini / _llenas_fin: tramos [ini, fin) de franjas llenas consecutivas,
+    ordenados, como índice de intervalos.
+Comprobar, reservar y buscar la franja libre más cercana son búsquedas
+binarias (bisect) sobre los tramos.
+
+Con un libro de pedidos (obtener_agenda) la ocupación que manda es la de la
+tabla `ocupacion` del libro, común a todos los workers: reservar es una
+transacción SQLite (LibroPedidos.reservar_franja) y disponible() consulta la
+franja en el libro. La memoria es solo una copia para buscar alternativas
+(mas_cercanas), que se refresca cada FRANJA_REFRESCO segundos (5). Sin libro
+(benchmarks) todo queda en memoria.
+
+Cada tienda (tiendas.py) tiene su agenda y su capacidad: obtener_agenda(clave)
+cuenta solo los pedidos y reservas de esa tienda en el libro.
+
+Variables de entorno: FRANJA_MINUTOS (30), FRANJA_CAPACIDAD (10), FRANJA_REFRESCO (5).
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from pedidos import obtener_libro
+
+HORARIO = ((9 * 60, 14 * 60), (17 * 60, 20 * 60))   # minutos desde medianoche
+DIAS_ABIERTO = 6                                    # lunes (0) a sábado (5)
+_ORIGEN = date(2024, 1, 1)                          # un lunes
+
+
+class Agenda:
+    def __init__(self, capacidad: int = 10, minutos: int = 30, horario=HORARIO, libro=None,
+                 refresco: float = 5.0, tienda: str = ""):
+        self.capacidad = capacidad
+        self.minutos = minutos
+        self.libro = libro
+        self.tienda = tienda
+        self.refresco = refresco
+        self._refrescado = 0.0
+        self._inicios_dia = [m for a, b in horario for m in range(a, b, minutos)]
+        self.por_dia = len(self._inicios_dia)
+        self._ocupacion = {}
+        self._llenas_ini = []
+        self._llenas_fin = []
+        self._lock = threading.Lock()
+
+    # --- ordinales ---
+
+    def _ordinal_dia(self, d: date) -> int | None:
+        dias = (d - _ORIGEN).days
+        semana, dow = divmod(dias, 7)
+        if dow >= DIAS_ABIERTO:
+            return None
+        return (semana * DIAS_ABIERTO + dow) * self.por_dia
+
+    def ordinal(self, dt: datetime) -> int | None:
+        """Ordinal de la franja que contiene dt, o None si la tienda está cerrada."""
+        base = self._ordinal_dia(dt.date())
+        if base is None:
+            return None
+        minuto = dt.hour * 60 + dt.minute
+        i = bisect.bisect_right(self._inicios_dia, minuto) - 1
+        if i < 0 or minuto >= self._inicios_dia[i] + self.minutos:
+            return None
+        return base + i
+
+    def siguiente_ordinal(self, dt: datetime) -> int:
+        """Ordinal de la primera franja que empieza en dt o después."""
+        d = dt.date()
+        minuto = dt.hour * 60 + dt.minute + (1 if dt.second or dt.microsecond else 0)
+        while True:
+            base = self._ordinal_dia(d)
+            if base is not None:
+                i = bisect.bisect_left(self._inicios_dia, minuto)
+                if i < self.por_dia:
+                    return base + i
+            d += timedelta(days=1)
+            minuto = 0
+
+    def inicio(self, ordinal: int) -> datetime:
+        dia_abierto, i = divmod(ordinal, self.por_dia)
+        semana, dow = divmod(dia_abierto, DIAS_ABIERTO)
+        d = _ORIGEN + timedelta(days=semana * 7 + dow)
+        minuto = self._inicios_dia[i]
+        return datetime(d.year, d.month, d.day, minuto // 60, minuto % 60)
+
+    # --- índice de franjas llenas ---
+
+    def _tramo(self, o: int) -> int:
+        """Índice del tramo lleno que contiene o, o -1."""
+        i = bisect.bisect_right(self._llenas_ini, o) - 1
+        if i >= 0 and o < self._llenas_fin[i]:
+            return i
+        return -1
+
+    def _marcar_llena(self, o: int):
+        i = bisect.bisect_right(self._llenas_ini, o) - 1
+        pega_izq = i >= 0 and self._llenas_fin[i] == o
+        pega_der = i + 1 < len(self._llenas_ini) and self._llenas_ini[i + 1] == o + 1
+        if pega_izq and pega_der:
+            self._llenas_fin[i] = self._llenas_fin[i + 1]
+            del self._llenas_ini[i + 1], self._llenas_fin[i + 1]
+        elif pega_izq:
+            self._llenas_fin[i] = o + 1
+        elif pega_der:
+            self._llenas_ini[i + 1] = o
+        else:
+            self._llenas_ini.insert(i + 1, o)
+            self._llenas_fin.insert(i + 1, o + 1)
+
+    def _fijar(self, o: int, n: int):
+        """Apunta la ocupación leída del libro (con el lock tomado); nunca baja."""
+        if n > self._ocupacion.get(o, 0):
+            self._ocupacion[o] = n
+        if n >= self.capacidad and self._tramo(o) < 0:
+            self._marcar_llena(o)
+
+    def _franja(self, o: int) -> tuple[datetime, datetime]:
+        inicio = self.inicio(o)
+        return inicio, inicio + timedelta(minutes=self.minutos)
+
+    def _refrescar(self):
+        """Copia en memoria la ocupación del libro (otros workers también reservan)."""
+        if self.libro is None or time.monotonic() - self._refrescado < self.refresco:
+            return
+        self._refrescado = time.monotonic()
+        ahora = datetime.now()
+        ocupacion = self.libro.ocupacion_entre(self.tienda, ahora - timedelta(minutes=self.minutos), ahora + timedelta(days=366))
+        with self._lock:
+            for inicio, n in ocupacion.items():
+                o = self.ordinal(datetime.fromisoformat(inicio))
+                if o is not None:
+                    self._fijar(o, n)
+
+    def _libre_desde(self, o: int, paso: int) -> int:
+        """Primera franja libre desde o hacia delante (paso=1) o hacia atrás (paso=-1)."""
+        i = self._tramo(o)
+        if i < 0:
+            return o
+        return self._llenas_fin[i] if paso > 0 else self._llenas_ini[i] - 1
+
+    # --- API ---
+
+    def disponible(self, dt: datetime) -> bool:
+        o = self.ordinal(dt)
+        if o is None:
+            return False
+        n = self.libro.ocupacion_franja(self.tienda, *self._franja(o)) if self.libro is not None else 0
+        with self._lock:
+            self._fijar(o, n)
+            return self._tramo(o) < 0
+
+    def reservar(self, dt: datetime) -> bool:
+        """Ocupa un hueco en la franja de dt. False si está cerrada o llena."""
+        o = self.ordinal(dt)
+        if o is None:
+            return False
+        if self.libro is not None:
+            n = self.libro.reservar_franja(self.tienda, *self._franja(o), self.capacidad)
+            with self._lock:
+                self._fijar(o, self.capacidad if n is None else n)
+            return n is not None
+        with self._lock:
+            if self._tramo(o) >= 0:
+                return False
+            n = self._ocupacion.get(o, 0) + 1
+            self._ocupacion[o] = n
+            if n >= self.capacidad:
+                self._marcar_llena(o)
+            return True
+
+    def ocupacion(self, dt: datetime) -> int:
+        o = self.ordinal(dt)
+        return self._ocupacion.get(o, 0) if o is not None else 0
+
+    def mas_cercanas(self, dt: datetime, n: int = 3, ahora: datetime | None = None) -> list[datetime]:
+        """
+        Las n franjas libres más cercanas a dt (antes o después), nunca en el pasado.
+        Devuelve el inicio de cada franja, ordenado por cercanía.
+        """
+        self._refrescar()
+        ahora = ahora or datetime.now()
+        minimo = self.siguiente_ordinal(ahora)
+        o = self.ordinal(dt)
+        if o is None:
+            o = self.siguiente_ordinal(dt)
+        objetivo = dt.timestamp()
+
+        with self._lock:
+            despues = self._libre_desde(max(o, minimo), 1)
+            antes = self._libre_desde(o - 1, -1) if o - 1 >= minimo else None
+            resultado = []
+            while len(resultado) < n:
+                if antes is not None and antes < minimo:
+                    antes = None
+                if antes is None:
+                    elegido = despues
+                else:
+                    d_antes = objetivo - self.inicio(antes).timestamp()
+                    d_despues = self.inicio(despues).timestamp() - objetivo
+                    elegido = antes if d_antes < d_despues else despues
+                resultado.append(elegido)
+                if elegido == despues:
+                    despues = self._libre_desde(despues + 1, 1)
+                else:
+                    antes = self._libre_desde(antes - 1, -1) if antes - 1 >= minimo else None
+        return [self.inicio(x) for x in resultado]
+
+    def cargar_desde_libro(self, libro, desde: datetime | None = None, hasta: datetime | None = None):
+        """Reconstruye la ocupación con los pedidos ya confirmados y las reservas del libro."""
+        desde = desde or datetime.now()
+        hasta = hasta or desde + timedelta(days=366)
+        conteo = {}
+        for pedido in libro.pedidos_entre(desde, hasta, self.tienda):
+            try:
+                o = self.ordinal(datetime.fromisoformat(pedido["recogida"]))
+            except ValueError:
+                continue
+            if o is not None:
+                conteo[o] = conteo.get(o, 0) + 1
+        for inicio, n in libro.ocupacion_entre(self.tienda, desde, hasta).items():
+            o = self.ordinal(datetime.fromisoformat(inicio))
+            if o is not None:
+                conteo[o] = max(conteo.get(o, 0), n)
+        with self._lock:
+            for o in sorted(conteo):
+                self._fijar(o, conteo[o])
+
+
+_AGENDAS = {}   # clave de tienda -> Agenda
+_AGENDAS_LOCK = threading.Lock()
+
+
+def obtener_agenda(tienda: str = "") -> Agenda:
+    """
+    Agenda del worker para la tienda con esa clave, sobre la ocupación del libro
+    de pedidos (común a todos los workers); la primera vez se rellena con los
+    pedidos pendientes de la tienda.
+    """
+    agenda = _AGENDAS.get(tienda)
+    if agenda is None:
+        with _AGENDAS_LOCK:
+            agenda = _AGENDAS.get(tienda)
+            if agenda is None:
+                libro = obtener_libro()
+                agenda = Agenda(
+                    capacidad=int(os.getenv("FRANJA_CAPACIDAD", "10")),
+                    minutos=int(os.getenv("FRANJA_MINUTOS", "30")),
+                    libro=libro,
+                    refresco=float(os.getenv("FRANJA_REFRESCO", "5")),
+                    tienda=tienda,
+                )
+                try:
+                    agenda.cargar_desde_libro(libro)
+                except Exception:
+                    logging.exception("No se pudo cargar la ocupación desde el libro de pedidos")
+                _AGENDAS[tienda] = agenda
+    return agenda
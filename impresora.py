@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Impresión real de tickets en impresora térmica ESC/POS.
+
+- codificar_escpos: convierte el ticket en la secuencia de bytes ESC/POS.
+- Spooler: cola asyncio acotada en su propio hilo; un único consumidor imprime
+  los trabajos en orden de llegada, reconectando y reintentando con espera
+  creciente si la impresora se cae. encolar() nunca bloquea al que confirma.
+- Dispositivos: archivo/dispositivo de caracteres (/dev/usb/lp0, un pseudo-TTY
+  o un archivo normal para pruebas) o red (tcp://host:9100).
+
+Variables de entorno:
+  IMPRESORA_DISPOSITIVO: ruta o tcp://host:puerto (sin definir -> no se imprime)
+  IMPRESORA_COLA: trabajos máximos en cola (por defecto 200)
+  IMPRESORA_ANCHO: caracteres por línea (42 para papel de 80 mm)
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# --- Comandos ESC/POS ---
+ESC = b"\x1b"
+GS = b"\x1d"
+INICIAR = ESC + b"@"
+PAGINA_PC858 = ESC + b"t\x13"      # tabla de caracteres con tildes, ñ y €
+NEGRITA_SI = ESC + b"E\x01"
+NEGRITA_NO = ESC + b"E\x00"
+CENTRADO = ESC + b"a\x01"
+IZQUIERDA = ESC + b"a\x00"
+DOBLE = GS + b"!\x11"
+NORMAL = GS + b"!\x00"
+CORTE = GS + b"V\x41\x03"          # avanzar 3 líneas y corte parcial
+
+CODIFICACION = "cp858"
+
+
+def _txt(texto: str) -> bytes:
+    return texto.encode(CODIFICACION, errors="replace") + b"\n"
+
+
+def _columnas(izq: str, der: str, ancho: int) -> str:
+    hueco = ancho - len(der) - 1
+    if len(izq) > hueco:
+        izq = izq[:max(0, hueco - 1)] + "."
+    return f"{izq:<{hueco}} {der}"
+
+
+def codificar_escpos(nombre: str, lineas: list, total: float, hora=None, ancho: int = 42,
+                     cabecera=None) -> bytes:
+    """
+    Devuelve el ticket como bytes ESC/POS.
+    lineas = [(producto, cantidad, unidad, precio, subtotal), ...] como printer.lineas_ticket
+    (precio None: la línea sale "sin precio").
+    cabecera: (nombre de la tienda, otras líneas...); por defecto "EL BUEN CORTE" / "Carnicería".
+    """
+    if isinstance(hora, datetime):
+        hora_str = hora.strftime("%d/%m/%Y %H:%M")
+    else:
+        hora_str = str(hora) if hora else "No indicada"
+
+    cabecera = cabecera or ("EL BUEN CORTE", "Carnicería")
+    partes = [INICIAR, PAGINA_PC858, CENTRADO, DOBLE, NEGRITA_SI,
+              _txt(cabecera[0]), NORMAL, NEGRITA_NO,
+              *(_txt(linea) for linea in cabecera[1:]), IZQUIERDA, _txt("-" * ancho),
+              _txt(f"Cliente: {nombre}"),
+              NEGRITA_SI, _txt(f"Recogida: {hora_str}"), NEGRITA_NO,
+              _txt("-" * ancho)]
+
+    for producto, cantidad, unidad, precio, subtotal in lineas:
+        partes.append(_txt(producto.capitalize()[:ancho]))
+        if unidad == "kg":
+            detalle = "  " + f"{cantidad:.3f}".rstrip("0").rstrip(".") + " kg"
+        else:
+            detalle = f"  {int(cantidad)} u"
+        if precio is None:
+            partes.append(_txt(_columnas(detalle, "sin precio", ancho)))
+            continue
+        partes.append(_txt(_columnas(f"{detalle} x {precio:.2f}", f"{subtotal:.2f} €", ancho)))
+
+    partes += [_txt("-" * ancho), NEGRITA_SI, DOBLE,
+               _txt(_columnas("TOTAL", f"{total:.2f} €", ancho // 2)),
+               NORMAL, NEGRITA_NO, CENTRADO, _txt("¡Gracias por su compra!"),
+               IZQUIERDA, CORTE]
+    return b"".join(partes)
+
+
+# --- Dispositivos ---
+
+class DispositivoArchivo:
+    """Escribe en una ruta: /dev/usb/lp0, el esclavo de un pseudo-TTY o un archivo normal."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._f = None
+
+    async def abrir(self):
+        loop = asyncio.get_running_loop()
+        self._f = await loop.run_in_executor(None, lambda: open(self.ruta, "ab", buffering=0))
+
+    async def escribir(self, datos: bytes):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._escribir_todo, datos)
+
+    def _escribir_todo(self, datos: bytes):
+        # sin búfer, write() puede escribir solo una parte (p. ej. un pseudo-TTY con el búfer lleno)
+        pendiente = memoryview(datos)
+        while pendiente:
+            n = self._f.write(pendiente)
+            if not n:
+                raise OSError(f"La impresora {self.ruta} no acepta más datos")
+            pendiente = pendiente[n:]
+
+    async def cerrar(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+
+    @property
+    def abierto(self) -> bool:
+        return self._f is not None
+
+
+class DispositivoTCP:
+    """Impresora de red en modo RAW (puerto 9100)."""
+
+    def __init__(self, host: str, puerto: int = 9100, timeout: float = 5.0):
+        self.host = host
+        self.puerto = puerto
+        self.timeout = timeout
+        self._writer = None
+
+    async def abrir(self):
+        _, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.puerto), self.timeout
+        )
+
+    async def escribir(self, datos: bytes):
+        self._writer.write(datos)
+        await asyncio.wait_for(self._writer.drain(), self.timeout)
+
+    async def cerrar(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+
+    @property
+    def abierto(self) -> bool:
+        return self._writer is not None
+
+
+def dispositivo_desde_url(destino: str):
+    if destino.startswith("tcp://"):
+        partes = urlsplit(destino)
+        return DispositivoTCP(partes.hostname, partes.port or 9100)
+    return DispositivoArchivo(destino)
+
+
+# --- Spooler ---
+
+class Spooler:
+    """
+    Cola de impresión acotada servida por un bucle asyncio en un hilo propio.
+    Los trabajos salen en el mismo orden en que se encolan. Si el dispositivo
+    falla se cierra, se espera (0.5 s, 1 s, 2 s... hasta espera_max) y se
+    reintenta el mismo trabajo, de modo que nada se reordena ni se pierde
+    mientras quepa en la cola.
+    """
+
+    def __init__(self, dispositivo, capacidad: int = 200, espera_base: float = 0.5, espera_max: float = 30.0):
+        self.dispositivo = dispositivo
+        self.capacidad = capacidad
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.impresos = 0
+        self.descartados = 0
+        self.reintentos = 0
+        self._pendientes = 0
+        self._lock = threading.Lock()
+        self._vacia = threading.Event()
+        self._vacia.set()
+        self._loop = asyncio.new_event_loop()
+        self._cola = None
+        self._listo = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, name="spooler-impresora", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        self._listo.wait()
+        return self
+
+    def _correr(self):
+        asyncio.set_event_loop(self._loop)
+        self._cola = asyncio.Queue()
+        self._listo.set()
+        try:
+            self._loop.run_until_complete(self._consumidor())
+        finally:
+            self._loop.close()
+
+    def encolar(self, datos: bytes) -> bool:
+        """Añade un trabajo sin bloquear. Devuelve False si la cola está llena."""
+        with self._lock:
+            if self._pendientes >= self.capacidad:
+                self.descartados += 1
+                logging.error("Cola de impresión llena, ticket no impreso")
+                return False
+            self._pendientes += 1
+            self._vacia.clear()
+        self._loop.call_soon_threadsafe(self._cola.put_nowait, datos)
+        return True
+
+    async def _consumidor(self):
+        while True:
+            datos = await self._cola.get()
+            if datos is None:
+                await self.dispositivo.cerrar()
+                return
+            await self._imprimir(datos)
+            with self._lock:
+                self._pendientes -= 1
+                self.impresos += 1
+                if self._pendientes == 0:
+                    self._vacia.set()
+
+    async def _imprimir(self, datos: bytes):
+        intento = 0
+        while True:
+            try:
+                if not self.dispositivo.abierto:
+                    await self.dispositivo.abrir()
+                await self.dispositivo.escribir(datos)
+                return
+            except (OSError, asyncio.TimeoutError):
+                await self.dispositivo.cerrar()
+                espera = min(self.espera_max, self.espera_base * (2 ** intento))
+                intento += 1
+                self.reintentos += 1
+                logging.warning("Impresora no disponible (intento %d), reintento en %.1fs", intento, espera)
+                await asyncio.sleep(espera)
+
+    def esperar(self, timeout: float | None = None) -> bool:
+        """Bloquea hasta que la cola se vacíe (pruebas, apagado ordenado)."""
+        return self._vacia.wait(timeout)
+
+    def parar(self, timeout: float | None = 10.0):
+        if not self._hilo.is_alive():
+            return
+        self.esperar(timeout)
+        self._loop.call_soon_threadsafe(self._cola.put_nowait, None)
+        self._hilo.join(timeout)
+
+
+_SPOOLERS = {}   # destino -> Spooler
+_SPOOLER_LOCK = threading.Lock()
+
+
+def obtener_spooler(destino: str | None = None):
+    """
+    Spooler del worker para la impresora `destino` (por defecto IMPRESORA_DISPOSITIVO);
+    uno por impresora. None si no hay impresora configurada.
+    """
+    destino = destino or os.getenv("IMPRESORA_DISPOSITIVO")
+    if not destino:
+        return None
+    spooler = _SPOOLERS.get(destino)
+    if spooler is not None:
+        return spooler
+    with _SPOOLER_LOCK:
+        spooler = _SPOOLERS.get(destino)
+        if spooler is None:
+            spooler = Spooler(
+                dispositivo_desde_url(destino),
+                capacidad=int(os.getenv("IMPRESORA_COLA", "200")),
+            ).iniciar()
+            atexit.register(spooler.parar)
+            _SPOOLERS[destino] = spooler
+    return spooler
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Ingesta masiva de pedidos tomados por teléfono o en mostrador.
+
+Cada línea de entrada es un pedido: cliente, hora de recogida y productos en
+texto libre, pasados por el mismo análisis que el chat (parse_dia_hora,
+extraer_productos_desde_texto, _canonicalizar_producto) en un pool de procesos.
+
+Entrada:
+  .csv       columnas cliente, hora, productos (con cabecera; separador , o ;)
+  otro       texto, un pedido por línea:  Carmen | sábado a las 10 | 2 kg de pollo entero y 3 alas
+             (también separado por tabuladores; las líneas vacías o con # se saltan)
+
+Salida (JSONL, en el orden de entrada, según se va procesando):
+  {"linea": 12, "cliente": "Carmen", "hora": "2026-10-24T10:00",
+   "productos": [{"producto": "pollo entero", "cantidad": 2.0, "unidad": "kg"}],
+   "sin_resolver": [{"texto": "alitas", "opciones": ["alas de pollo", ...], "opciones_omitidas": 0}],
+   "errores": []}
+  Como en el chat, cada producto sin resolver lleva como mucho OPCIONES_MAX
+  opciones (8); opciones_omitidas cuenta las que se han quedado fuera.
+
+--sin-resolver RUTA escribe además un CSV (linea, cliente, texto, opciones)
+con lo que hay que revisar a mano.
+
+    python ingesta.py pedidos.txt -o resultado.jsonl [--sin-resolver revisar.csv]
+        [--procesos N] [--lote 500] [--tienda +34911111111]
+
+El progreso (líneas, líneas/s, % del fichero) sale por stderr.
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from ejecutor import analizar_productos
+from expresiones import sugerencias_producto
+from sinonimos import obtener_sinonimos_aprendidos
+from tiendas import obtener_tienda
+from utils import OPCIONES_MAX, _cantidad_num, _opciones_planas, parse_dia_hora
+
+# --- Lectura ---
+
+
+def _campos_texto(linea: str) -> list[str]:
+    separador = "\t" if "\t" in linea and "|" not in linea else "|"
+    return [c.strip() for c in linea.split(separador, 2)]
+
+
+def leer_lotes(f, es_csv: bool, tam_lote: int):
+    """Genera (lote, caracteres leídos) con lote = [(nº de línea, cliente, hora, productos)]."""
+    lote, leidos = [], 0
+    if es_csv:
+        muestra = f.read(4096)
+        leidos += len(muestra)
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t") if muestra else csv.excel
+        # la muestra puede acabar a media línea: se completa hasta el final de esa línea
+        resto = f.readline()
+        leidos += len(resto)
+        filas = csv.reader(_encadenar(muestra + resto, f), dialecto)
+        cabecera = [c.strip().lower() for c in next(filas, [])]
+        indices = [cabecera.index(c) if c in cabecera else i for i, c in enumerate(("cliente", "hora", "productos"))]
+        for n, fila in enumerate(filas, start=2):
+            leidos += sum(len(c) for c in fila) + len(fila)
+            if not any(c.strip() for c in fila):
+                continue
+            lote.append((n, *(fila[i].strip() if i < len(fila) else "" for i in indices)))
+            if len(lote) >= tam_lote:
+                yield lote, leidos
+                lote = []
+    else:
+        for n, linea in enumerate(f, start=1):
+            leidos += len(linea)
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            campos = _campos_texto(linea) + ["", ""]
+            lote.append((n, campos[0], campos[1], campos[2]))
+            if len(lote) >= tam_lote:
+                yield lote, leidos
+                lote = []
+    if lote:
+        yield lote, leidos
+
+
+def _encadenar(inicio: str, f):
+    yield from io.StringIO(inicio)
+    yield from f
+
+
+# --- Trabajo en cada proceso ---
+
+_TIENDA = None
+_APRENDIDOS = None
+
+
+def _iniciar_trabajador(tienda: str | None):
+    global _TIENDA, _APRENDIDOS
+    _TIENDA = obtener_tienda(tienda)
+    _APRENDIDOS = obtener_sinonimos_aprendidos(_TIENDA.clave).promovidos()
+
+
+def analizar_pedido(cliente: str, hora: str, productos: str, tienda=None, aprendidos=None) -> dict:
+    tienda = tienda or _TIENDA or obtener_tienda()
+    res = {"cliente": cliente, "hora": None, "productos": [], "sin_resolver": [], "errores": []}
+    if hora:
+        try:
+            res["hora"] = parse_dia_hora(hora).strftime("%Y-%m-%dT%H:%M")
+        except ValueError as e:
+            res["errores"].append(f"hora {hora!r}: {e}")
+    else:
+        res["errores"].append("sin hora")
+
+    aprendidos = aprendidos if aprendidos is not None else _APRENDIDOS
+    for prod, cantidad, unidad, real in analizar_productos(productos, tienda, aprendidos):
+        if isinstance(real, str) and real in tienda.productos_db:
+            res["productos"].append({"producto": real, "cantidad": _cantidad_num(cantidad), "unidad": unidad})
+            continue
+        # un nombre que no es clave del catálogo no se da por resuelto: va a revisión con sugerencias
+        opciones = [o for o in _opciones_planas(real) if o] if isinstance(real, list) else []
+        opciones = list(dict.fromkeys(opciones)) or sugerencias_producto(prod, tienda.productos_db)
+        res["sin_resolver"].append({
+            "texto": prod,
+            "cantidad": _cantidad_num(cantidad),
+            "unidad": unidad,
+            # como en el chat: como mucho OPCIONES_MAX, y cuántas se han quedado fuera
+            "opciones": opciones[:OPCIONES_MAX],
+            "opciones_omitidas": max(0, len(opciones) - OPCIONES_MAX),
+        })
+    if not res["productos"] and not res["sin_resolver"]:
+        res["errores"].append("sin productos")
+    return res
+
+
+def _procesar_lote(lote: list) -> tuple[str, list, int]:
+    """
+    (JSONL ya serializado, filas para revisar a mano, pedidos con errores):
+    el proceso principal solo escribe.
+    """
+    lineas, revisar, con_errores = [], [], 0
+    for n, cliente, hora, productos in lote:
+        try:
+            res = analizar_pedido(cliente, hora, productos)
+        except Exception as e:
+            res = {"cliente": cliente, "hora": None, "productos": [], "sin_resolver": [],
+                   "errores": [f"{type(e).__name__}: {e}"]}
+        lineas.append(json.dumps({"linea": n, **res}, ensure_ascii=False))
+        revisar.extend((n, cliente, s["texto"], " | ".join(s["opciones"])) for s in res["sin_resolver"])
+        con_errores += bool(res["errores"])
+    return "\n".join(lineas) + "\n", revisar, con_errores
+
+
+# --- Proceso principal ---
+
+
+class _Progreso:
+    def __init__(self, total_caracteres: int, salida=sys.stderr):
+        self.total = max(1, total_caracteres)
+        self.salida = salida
+        self.inicio = time.monotonic()
+        self._ultimo = 0.0
+
+    def mostrar(self, lineas: int, sin_resolver: int, leidos: int, final: bool = False):
+        ahora = time.monotonic()
+        if not final and ahora - self._ultimo < 0.5:
+            return
+        self._ultimo = ahora
+        segundos = max(ahora - self.inicio, 1e-9)
+        print(f"\r{lineas:,} pedidos  {lineas / segundos:,.0f}/s  {min(leidos / self.total, 1):.0%}  "
+              f"{sin_resolver:,} sin resolver", end="\n" if final else "", file=self.salida, flush=True)
+
+
+def ingerir(entrada: str, salida, procesos: int, tam_lote: int = 500, tienda: str | None = None,
+            sin_resolver=None, progreso: bool = True) -> dict:
+    """Procesa el fichero `entrada` y escribe JSONL en `salida` (fichero abierto). Devuelve totales."""
+    # el catálogo se carga antes del pool: con fork los procesos lo heredan ya construido
+    _iniciar_trabajador(tienda)
+    ventana = max(2, 2 * procesos)    # lotes en vuelo: la memoria no depende del tamaño del fichero
+    totales = {"pedidos": 0, "sin_resolver": 0, "con_errores": 0}
+    barra = _Progreso(os.path.getsize(entrada)) if progreso else None
+    escritor = csv.writer(sin_resolver) if sin_resolver is not None else None
+    if escritor:
+        escritor.writerow(["linea", "cliente", "texto", "opciones"])
+
+    def escribir(resultado):
+        texto, revisar, con_errores = resultado
+        salida.write(texto)
+        totales["pedidos"] += texto.count("\n")
+        totales["sin_resolver"] += len(revisar)
+        totales["con_errores"] += con_errores
+        if escritor:
+            escritor.writerows(revisar)
+
+    with open(entrada, encoding="utf-8-sig", newline="" if entrada.lower().endswith(".csv") else None) as f, \
+            multiprocessing.Pool(procesos, initializer=_iniciar_trabajador, initargs=(tienda,)) as pool:
+        en_vuelo = deque()
+        leidos = 0
+        for lote, leidos in leer_lotes(f, entrada.lower().endswith(".csv"), tam_lote):
+            en_vuelo.append(pool.apply_async(_procesar_lote, (lote,)))
+            while len(en_vuelo) >= ventana or (en_vuelo and en_vuelo[0].ready()):
+                escribir(en_vuelo.popleft().get())
+                if barra:
+                    barra.mostrar(totales["pedidos"], totales["sin_resolver"], leidos)
+        while en_vuelo:
+            escribir(en_vuelo.popleft().get())
+            if barra:
+                barra.mostrar(totales["pedidos"], totales["sin_resolver"], leidos)
+    if barra:
+        barra.mostrar(totales["pedidos"], totales["sin_resolver"], barra.total, final=True)
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada")
+    parser.add_argument("-o", "--salida", help="JSONL de resultados (por defecto stdout)")
+    parser.add_argument("--sin-resolver", help="CSV con los productos a revisar a mano")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lote", type=int, default=500, help="pedidos por tarea del pool")
+    parser.add_argument("--tienda", help="número de la tienda (ver tiendas.py); por defecto la principal")
+    parser.add_argument("--sin-progreso", action="store_true")
+    args = parser.parse_args()
+
+    salida = open(args.salida, "w", encoding="utf-8") if args.salida else sys.stdout
+    revisar = open(args.sin_resolver, "w", encoding="utf-8", newline="") if args.sin_resolver else None
+    try:
+        t0 = time.monotonic()
+        totales = ingerir(args.entrada, salida, args.procesos, args.lote, args.tienda, revisar,
+                          progreso=not args.sin_progreso)
+        segundos = time.monotonic() - t0
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+        if revisar:
+            revisar.close()
+    print(f"{totales['pedidos']:,} pedidos en {segundos:.1f} s ({totales['pedidos'] / max(segundos, 1e-9):,.0f}/s); "
+          f"{totales['sin_resolver']:,} productos sin resolver, {totales['con_errores']:,} pedidos con errores",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
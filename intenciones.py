@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Detección de la intención de un mensaje en una sola pasada.
+
+Todas las palabras clave de comandos van en una única expresión regular con un
+grupo por intención, aplicada sobre el texto normalizado (minúsculas, sin
+tildes ni signos), así "Volver atrás", "volver atras!" o "YA ESTÁ" caen en la
+misma intención. Si aparecen varias, gana la de mayor prioridad (orden de
+INTENCIONES).
+"""
+import re
+
+# (intención, patrón) en orden de prioridad
+INTENCIONES = (
+    ("iniciar", r"\biniciar pedido\b"),
+    ("volver", r"\bvolver atras\b"),
+    ("repetir", r"\b(?:repetir|repite|repiteme) (?:el |mi )?(?:ultimo )?pedido\b|\blo (?:mismo )?de siempre\b"),
+    ("carrito", r"^(?:ver|mostrar|ensename) (?:el |mi )?(?:carrito|cesta|pedido)\b"),
+    ("ver", r"^(?:ver|mostrar|ensename)\b"),
+    ("eliminar", r"^(?:eliminar|elimina|quita|quitar|borra|borrar)\b"),
+    ("confirmar", r"\bconfirmar\b"),
+    ("cancelar", r"\bcancelar\b"),
+    ("listo", r"^(?:listo|ya|ya esta|eso es todo|nada mas|terminado|termine|he terminado)$"),
+)
+
+# Normalización barata (una tabla de traducción y una regex) en lugar de
+# expresiones._normalize, que recorre el texto carácter a carácter.
+_SIN_TILDES = str.maketrans("áéíóúüàèìòùâêîôû", "aeiouuaeiouaeiou")
+_NO_ALFANUM_RE = re.compile(r"[^a-z0-9ñ]+")
+
+
+def _normalizar(msg: str) -> str:
+    return _NO_ALFANUM_RE.sub(" ", msg.lower().translate(_SIN_TILDES)).strip()
+
+
+_PRIORIDAD = {nombre: i for i, (nombre, _) in enumerate(INTENCIONES)}
+_INTENCIONES_RE = re.compile("|".join(f"(?P<{nombre}>{patron})" for nombre, patron in INTENCIONES))
+
+
+def detectar_intencion(msg: str) -> str | None:
+    """Devuelve la intención de mayor prioridad presente en msg, o None si no es un comando."""
+    mejor = None
+    for m in _INTENCIONES_RE.finditer(_normalizar(msg)):
+        nombre = m.lastgroup
+        if mejor is None or _PRIORIDAD[nombre] < _PRIORIDAD[mejor]:
+            mejor = nombre
+            if _PRIORIDAD[nombre] == 0:
+                break
+    return mejor
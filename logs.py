@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Registro (logging) sin bloquear las peticiones.
+
+Los hilos de las peticiones solo meten el registro en una cola acotada
+(LOG_COLA, 10000 por defecto); un QueueListener en un hilo aparte lo
+serializa y escribe en stderr. Si la salida se atasca y la cola se llena,
+los registros nuevos se descartan y se cuentan por nivel (descartados()),
+en lugar de parar al hilo que atiende el mensaje. Al reanudarse la salida
+se escribe un aviso con cuántos se perdieron.
+
+  LOG_NIVEL    INFO por defecto
+  LOG_FORMATO  "json" (por defecto): una línea JSON por registro
+                 {"t": ..., "nivel": "INFO", "logger": "root", "msg": ..., "peticion": "a1b2c3d4e5f6"}
+               "texto": formato clásico legible en consola
+
+Los mensajes se escriben con formato perezoso de logging
+(logging.info("Mensaje de %s", usuario)): si el nivel está desactivado
+no se formatea nada. "peticion" es el id de la petición en curso
+(cabecera X-Request-Id o uno nuevo, ver id_peticion()).
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+
+_PETICION = contextvars.ContextVar("peticion", default=None)
+
+
+@contextlib.contextmanager
+def id_peticion(valor: str | None = None):
+    """Asocia un id a los registros emitidos dentro del bloque (uno nuevo si no se da)."""
+    marca = _PETICION.set(valor or uuid.uuid4().hex[:12])
+    try:
+        yield _PETICION.get()
+    finally:
+        _PETICION.reset(marca)
+
+
+class FormateadorJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            "t": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        peticion = getattr(record, "peticion", None)
+        if peticion:
+            datos["peticion"] = peticion
+        if record.exc_text:
+            datos["exc"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False)
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """QueueHandler que nunca espera: con la cola llena descarta y cuenta."""
+
+    def __init__(self, cola: queue.Queue):
+        super().__init__(cola)
+        self._descartados = Counter()
+        self._sin_avisar = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Solo lo barato en el hilo de la petición: el mensaje final (los args
+        # pueden cambiar después, p. ej. la sesión) y la traza de la excepción,
+        # que ya no existe cuando el listener la lee. El JSON se hace en el listener.
+        record.peticion = _PETICION.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._sin_avisar:
+            with self._lock:
+                perdidos, self._sin_avisar = self._sin_avisar, 0
+            if perdidos:
+                aviso = logging.LogRecord("logs", logging.WARNING, __file__, 0,
+                                          "%d registros de log descartados (cola llena)", (perdidos,), None)
+                try:
+                    self.queue.put_nowait(self.prepare(aviso))
+                except queue.Full:
+                    with self._lock:
+                        self._sin_avisar += perdidos
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._descartados[record.levelname] += 1
+                self._sin_avisar += 1
+
+    def descartados(self) -> dict:
+        with self._lock:
+            return dict(self._descartados)
+
+
+_MANEJADOR = None
+_ESCUCHA = None
+_LOCK = threading.Lock()
+
+
+def configurar_logs():
+    """Instala la cola en el logger raíz (idempotente); main.py la llama al arrancar."""
+    global _MANEJADOR, _ESCUCHA
+    if _MANEJADOR is not None:
+        return _MANEJADOR
+    with _LOCK:
+        if _MANEJADOR is None:
+            salida = logging.StreamHandler(sys.stderr)
+            if os.getenv("LOG_FORMATO", "json") == "texto":
+                salida.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(peticion)s] %(message)s"))
+            else:
+                salida.setFormatter(FormateadorJSON())
+            cola = queue.Queue(maxsize=int(os.getenv("LOG_COLA", "10000")))
+            manejador = ManejadorCola(cola)
+            raiz = logging.getLogger()
+            for h in list(raiz.handlers):
+                raiz.removeHandler(h)
+            raiz.addHandler(manejador)
+            raiz.setLevel(os.getenv("LOG_NIVEL", "INFO").upper())
+            _ESCUCHA = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+            _ESCUCHA.start()
+            atexit.register(detener_logs)
+            _MANEJADOR = manejador
+    return _MANEJADOR
+
+
+def detener_logs():
+    """Vacía la cola y para el hilo de escritura."""
+    global _ESCUCHA
+    with _LOCK:
+        escucha, _ESCUCHA = _ESCUCHA, None
+    if escucha is not None:
+        escucha.stop()
+
+
+def descartados() -> dict:
+    """{nivel: registros descartados} desde el arranque ({} si la cola no está instalada)."""
+    return _MANEJADOR.descartados() if _MANEJADOR is not None else {}
+
+
+def pendientes() -> int:
+    return _MANEJADOR.queue.qsize() if _MANEJADOR is not None else 0
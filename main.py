@@ -1,63 +1,161 @@
+import memoria  # primero: con MEMORIA_TRACEMALLOC traza también la carga del catálogo
 from flask import Flask, request, Response, jsonify
 from utils import process_message
+from autocompletar import obtener_autocompletar
+from tiendas import obtener_tienda
+from perfilado import perfilar
+from logs import configurar_logs, id_peticion
+from recordatorios import obtener_recordatorios
+import carrito
 import logging
 import os
+import hmac
 import html
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
+configurar_logs()  # cola + hilo escritor: loguear no bloquea la petición (ver logs.py)
+obtener_recordatorios()  # avisos pendientes del libro desde el arranque, no desde el primer pedido
+
+# Respuestas a Twilio (también las usa asgi.py)
+TWIML_INCOMPLETO = '<?xml version="1.0" encoding="UTF-8"?><Response><Message>Error: datos incompletos</Message></Response>'
+TWIML_ERROR = '<?xml version="1.0" encoding="UTF-8"?><Response><Message>Hubo un error en el servidor.</Message></Response>'
+
+def twiml(resultado) -> str:
+    """Resultado de process_message -> TwiML con un mensaje de WhatsApp."""
+    # Determinar texto final
+    if isinstance(resultado, dict) and "respuesta" in resultado:
+        final_text = resultado["respuesta"]
+    else:
+        final_text = str(resultado)
+
+    # Quitar "Reply:" si aparece al inicio
+    if final_text.strip().lower().startswith("reply:"):
+        final_text = final_text.split(":", 1)[1].strip()
+
+    safe_text = html.escape(final_text)
+    return f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{safe_text}</Message></Response>'
 
 @app.route("/webhook", methods=["POST"])
 def webhook():
+    # perfilado opcional (PERFIL_DIR): 1 de cada N peticiones o con cabecera X-Perfil
+    with id_peticion(request.headers.get("X-Request-Id")), perfilar(request.headers.get("X-Perfil")):
+        return _webhook()
+
+def _webhook():
     try:
         from_number = request.form.get("From") or request.form.get("user_id")
         body = request.form.get("Body") or request.form.get("message")
 
-        logging.info(f"📩 Mensaje recibido: {body} de {from_number}")
+        logging.info("📩 Mensaje recibido: %s de %s", body, from_number)
 
         if not from_number or not body:
             logging.warning("⚠️ Datos incompletos recibidos en webhook")
-            return Response(
-                '<?xml version="1.0" encoding="UTF-8"?><Response><Message>Error: datos incompletos</Message></Response>',
-                mimetype="application/xml"
-            )
+            return Response(TWIML_INCOMPLETO, mimetype="application/xml")
 
         # Si viene de Twilio (WhatsApp), contestar directamente con TwiML
         if request.form.get("From") and request.form.get("Body"):
             resultado = process_message({
                 "user_id": from_number,
-                "message": body
+                "message": body,
+                "tienda": request.form.get("To"),
             })
 
-            # Determinar texto final
-            if isinstance(resultado, dict) and "respuesta" in resultado:
-                final_text = resultado["respuesta"]
-            else:
-                final_text = str(resultado)
-
-            # Quitar "Reply:" si aparece al inicio
-            if final_text.strip().lower().startswith("reply:"):
-                final_text = final_text.split(":", 1)[1].strip()
-
-            safe_text = html.escape(final_text)
-            twiml = f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{safe_text}</Message></Response>'
-            return Response(twiml, mimetype="application/xml")
+            return Response(twiml(resultado), mimetype="application/xml")
 
         # Si viene de curl, procesar normalmente y devolver JSON
         result = process_message({
             "user_id": from_number,
-            "message": body
+            "message": body,
+            "tienda": request.form.get("To") or request.form.get("tienda"),
         })
         return jsonify(result)
 
     except Exception:
         logging.exception("❌ Error en webhook")
-        return Response(
-            '<?xml version="1.0" encoding="UTF-8"?><Response><Message>Hubo un error en el servidor.</Message></Response>',
-            mimetype="application/xml"
-        )
+        return Response(TWIML_ERROR, mimetype="application/xml")
+
+@app.route("/buscar", methods=["GET"])
+def buscar():
+    """Autocompletado de productos: /buscar?q=pol&k=5[&tienda=<número de Twilio>]"""
+    q = request.args.get("q", "")
+    try:
+        k = max(1, min(int(request.args.get("k", 5)), 50))
+    except ValueError:
+        k = 5
+    return jsonify({"q": q, "resultados": obtener_autocompletar(obtener_tienda(request.args.get("tienda"))).resultados(q, k)})
+
+# --- API estructurada del carrito (botones, web, TPV): mismas sesiones que el chat ---
+# ?tienda=<número de Twilio> elige la tienda (ver tiendas.py)
+# Cabecera X-Carrito-Token = carrito.token_usuario(user_id); sin CARRITO_CLAVE la API no existe
+
+def _carrito_denegado(user_id):
+    if not carrito.api_activada():
+        return jsonify({"error": "no encontrado"}), 404
+    if not carrito.token_valido(user_id, request.headers.get("X-Carrito-Token")):
+        return jsonify({"error": "token inválido"}), 403
+    return None
+
+def _api_carrito(operacion, user_id, *args, **kwargs):
+    denegado = _carrito_denegado(user_id)
+    if denegado is not None:
+        return denegado
+    try:
+        return jsonify(operacion(user_id, *args, tienda=obtener_tienda(request.args.get("tienda")), **kwargs))
+    except carrito.ProductoDesconocido as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/carrito/<user_id>", methods=["GET"])
+def carrito_estado(user_id):
+    return _api_carrito(carrito.estado, user_id)
+
+@app.route("/carrito/<user_id>/productos", methods=["POST"])
+def carrito_agregar(user_id):
+    """{"id": 12814, "cantidad": 1.5, "unidad": "kg"|"u"}"""
+    datos = request.get_json(silent=True) or {}
+    return _api_carrito(carrito.agregar, user_id, datos.get("id"),
+                        datos.get("cantidad"), datos.get("unidad", "kg"))
+
+@app.route("/carrito/<user_id>/productos/<producto_id>", methods=["PUT"])
+def carrito_fijar(user_id, producto_id):
+    """{"kg": 2, "u": 0}: cantidades exactas; a cero se quita."""
+    datos = request.get_json(silent=True) or {}
+    return _api_carrito(carrito.fijar_cantidad, user_id, producto_id, datos.get("kg"), datos.get("u"))
+
+@app.route("/carrito/<user_id>/productos/<producto_id>", methods=["DELETE"])
+def carrito_quitar(user_id, producto_id):
+    return _api_carrito(carrito.quitar, user_id, producto_id)
+
+@app.route("/carrito/<user_id>/hora", methods=["PUT"])
+def carrito_hora(user_id):
+    """{"hora": "2026-10-24T10:00"}"""
+    datos = request.get_json(silent=True) or {}
+    return _api_carrito(carrito.fijar_hora, user_id, datos.get("hora"))
+
+@app.route("/carrito/<user_id>/nombre", methods=["PUT"])
+def carrito_nombre(user_id):
+    """{"nombre": "Ana"}"""
+    datos = request.get_json(silent=True) or {}
+    return _api_carrito(carrito.fijar_nombre, user_id, datos.get("nombre"))
+
+# --- administración: ADMIN_TOKEN en el entorno y cabecera X-Admin-Token; sin token no existe ---
+
+def _admin_autorizado() -> bool:
+    token = os.getenv("ADMIN_TOKEN")
+    return bool(token) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token)
+
+@app.route("/admin/memoria", methods=["GET"])
+def admin_memoria():
+    """Informe de memoria del worker que atiende (ver memoria.py); ?top=15&formato=texto"""
+    if not _admin_autorizado():
+        return jsonify({"error": "no encontrado"}), 404
+    datos = memoria.informe(top=request.args.get("top", 15, type=int))
+    if request.args.get("formato") == "texto":
+        return Response(memoria.informe_texto(datos), mimetype="text/plain; charset=utf-8")
+    return jsonify(datos)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
-    logging.info(f"🚀 Servidor iniciando en 0.0.0.0:{port}")
+    logging.info("🚀 Servidor iniciando en 0.0.0.0:%s", port)
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Informe de memoria del worker: qué ocupa cada estructura en memoria (sesiones,
+catálogos, índices, cachés, colas) y, si tracemalloc está activo, qué líneas
+han crecido desde el informe anterior y desde el arranque.
+
+  - tamano_profundo(): suma de sys.getsizeof recorriendo dicts, listas, tuplas,
+    conjuntos y atributos de objetos; cada objeto cuenta una vez por estructura.
+    Las estructuras comparten objetos (p. ej. los nombres de producto), así que
+    sus tamaños no se pueden sumar; "total_sin_duplicar" los cuenta una sola vez.
+  - tracemalloc: se activa al importar con MEMORIA_TRACEMALLOC=<nº de marcos>
+    (tiene coste: solo para investigar). Cada informe compara con la foto
+    anterior y con la del arranque.
+
+Acceso:
+    GET /admin/memoria?top=15[&formato=texto]   cabecera X-Admin-Token: <ADMIN_TOKEN>
+    python memoria.py [--url http://127.0.0.1:10000 --token T] [--top 15] [--json]
+(sin --url, informa del propio proceso tras cargar los módulos)
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from collections import deque
+
+_TIPOS_OMITIDOS = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def tamano_profundo(obj, vistos: set | None = None) -> int:
+    """Bytes aproximados de obj y todo lo que alcanza (sin contar módulos, clases ni funciones)."""
+    vistos = set() if vistos is None else vistos
+    total = 0
+    pila = [obj]
+    while pila:
+        o = pila.pop()
+        if id(o) in vistos or isinstance(o, _TIPOS_OMITIDOS):
+            continue
+        vistos.add(id(o))
+        memory_usage = getattr(o, "memory_usage", None)
+        if callable(memory_usage) and hasattr(o, "columns"):
+            # DataFrame de pandas: getsizeof no ve los bloques
+            total += int(memory_usage(deep=True).sum())
+            continue
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            pila.extend(o.keys())
+            pila.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            pila.extend(o)
+        else:
+            atributos = getattr(o, "__dict__", None)
+            if atributos is not None:
+                pila.append(atributos)
+            for slot in getattr(type(o), "__slots__", ()):
+                if hasattr(o, slot):
+                    pila.append(getattr(o, slot))
+    return total
+
+
+def _len(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def estructuras() -> dict:
+    """{nombre: objeto} de lo que puede crecer o pesa en el worker."""
+    import autocompletar
+    import data
+    import envios
+    import expresiones
+    import franjas
+    import impresora
+    import recordatorios
+    import sinonimos
+    import tiendas
+
+    res = {}
+    todas = {"": tiendas.TIENDA_POR_DEFECTO, **(tiendas._TIENDAS or {})}
+    for clave, tienda in todas.items():
+        sufijo = f"[{clave}]" if clave else ""
+        res[f"sesiones{sufijo}"] = tienda.sessions
+    catalogos = {id(t.catalogo): t.catalogo for t in todas.values()}
+    for i, catalogo in enumerate(catalogos.values()):
+        sufijo = f"[{i}]" if i else ""
+        res[f"catalogo{sufijo}.productos_db"] = catalogo.productos_db
+        res[f"catalogo{sufijo}.precios_db"] = catalogo.precios_db
+        res[f"catalogo{sufijo}.index_normalizado"] = catalogo.index_normalizado
+        res[f"catalogo{sufijo}.fragmentos"] = catalogo.fragmentos
+    res["catalogo.productos_id"] = data.PRODUCTOS_ID
+    res["expresiones.SYNONYMS"] = expresiones.SYNONYMS
+    res["expresiones._PARTICIONES"] = expresiones._PARTICIONES
+    res["expresiones._NORMALIZADOS_CATALOGO"] = expresiones._NORMALIZADOS_CATALOGO
+    res["tiendas._NORMALIZADOS"] = tiendas._NORMALIZADOS
+    if data._leer_excel.cache_info().currsize:
+        res["data.excel (DataFrame)"] = data._leer_excel("productos_aranda.xlsx")
+    for clave, indice in list(autocompletar._INDICES.items()):
+        sufijo = f"[{clave}]" if clave else ""
+        res[f"autocompletar{sufijo}"] = indice
+        res[f"autocompletar{sufijo}._cache_cortos"] = indice._cache_cortos
+    for clave, aprendidos in list(sinonimos._APRENDIDOS.items()):
+        res["sinonimos_aprendidos" + (f"[{clave}]" if clave else "")] = aprendidos._conteos
+    for clave, agenda in list(franjas._AGENDAS.items()):
+        res["agenda.ocupacion" + (f"[{clave}]" if clave else "")] = agenda._ocupacion
+    for destino, cliente in list(envios._CLIENTES.items()):
+        res[f"correo.pendientes[{destino}]"] = cliente._pendientes
+    if recordatorios._RECORDATORIOS is not None:
+        res["recordatorios"] = [recordatorios._RECORDATORIOS._monticulo, recordatorios._RECORDATORIOS._datos]
+    return res
+
+
+def _colas() -> dict:
+    """Trabajo pendiente en segundo plano (si crece sin parar, algo no drena)."""
+    import data
+    import impresora
+    import logs
+    import ticket_pdf
+
+    res = {
+        "logs_pendientes": logs.pendientes(),
+        "logs_descartados": sum(logs.descartados().values()),
+        "excel_leidos": data._leer_excel.cache_info().currsize,
+        "ticket_pdf_recursos": ticket_pdf._recursos.cache_info().currsize,
+    }
+    for destino, spooler in list(impresora._SPOOLERS.items()):
+        res[f"impresora_pendientes[{destino}]"] = spooler._pendientes
+    return res
+
+
+def _rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+# --- tracemalloc ---
+_FOTO_INICIAL = None
+_FOTO_ANTERIOR = None
+_FOTO_LOCK = threading.Lock()
+
+
+def iniciar_trazado(marcos: int = 1):
+    global _FOTO_INICIAL, _FOTO_ANTERIOR
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(marcos)
+    _FOTO_INICIAL = _FOTO_ANTERIOR = tracemalloc.take_snapshot()
+
+
+def _diferencias(foto, base, top: int) -> list[dict]:
+    filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+               tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    stats = foto.filter_traces(filtros).compare_to(base.filter_traces(filtros), "lineno")
+    return [
+        {"donde": str(s.traceback), "kb": round(s.size / 1024, 1), "kb_delta": round(s.size_diff / 1024, 1),
+         "bloques_delta": s.count_diff}
+        for s in stats[:top]
+    ]
+
+
+def _trazado(top: int) -> dict | None:
+    global _FOTO_ANTERIOR
+    if not tracemalloc.is_tracing() or _FOTO_INICIAL is None:
+        return None
+    with _FOTO_LOCK:
+        foto = tracemalloc.take_snapshot()
+        anterior, _FOTO_ANTERIOR = _FOTO_ANTERIOR, foto
+    actual, pico = tracemalloc.get_traced_memory()
+    return {
+        "actual_mb": round(actual / 2 ** 20, 2),
+        "pico_mb": round(pico / 2 ** 20, 2),
+        "desde_anterior": _diferencias(foto, anterior, top),
+        "desde_arranque": _diferencias(foto, _FOTO_INICIAL, top),
+    }
+
+
+def informe(top: int = 15) -> dict:
+    """Informe del proceso listo para JSON."""
+    tamanos = {}
+    vistos = set()
+    total = 0
+    for nombre, obj in estructuras().items():
+        n = _len(obj)
+        entrada = {"bytes": tamano_profundo(obj), "elementos": n}
+        if nombre.startswith("sesiones") and n:
+            entrada["bytes_por_elemento"] = entrada["bytes"] // n
+        tamanos[nombre] = entrada
+        total += tamano_profundo(obj, vistos)
+    try:
+        import resource
+        pico_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pico_rss = None
+    return {
+        "pid": os.getpid(),
+        "rss_mb": _rss_mb(),
+        "pico_rss_mb": pico_rss,
+        "objetos_gc": len(gc.get_objects()),
+        "estructuras": dict(sorted(tamanos.items(), key=lambda kv: -kv[1]["bytes"])),
+        "total_sin_duplicar": total,
+        "colas": _colas(),
+        "tracemalloc": _trazado(top),
+    }
+
+
+def _kb(n: int) -> str:
+    return f"{n / 1024:,.1f} KB" if n < 2 ** 20 else f"{n / 2 ** 20:,.2f} MB"
+
+
+def informe_texto(datos: dict) -> str:
+    lineas = [f"pid {datos['pid']}  RSS {datos['rss_mb'] or 0:.1f} MB  pico {datos['pico_rss_mb'] or 0:.1f} MB  "
+              f"objetos gc {datos['objetos_gc']:,}", ""]
+    lineas.append(f"{'estructura':<40} {'tamaño':>12} {'elementos':>10} {'por elem.':>10}")
+    for nombre, e in datos["estructuras"].items():
+        por = e.get("bytes_por_elemento")
+        lineas.append(f"{nombre:<40} {_kb(e['bytes']):>12} {e['elementos'] if e['elementos'] is not None else '-':>10} "
+                      f"{_kb(por) if por else '':>10}")
+    lineas.append(f"{'total (objetos compartidos una vez)':<40} {_kb(datos['total_sin_duplicar']):>12}")
+    lineas.append("")
+    lineas.append("colas: " + ", ".join(f"{k}={v}" for k, v in datos["colas"].items()))
+    traza = datos.get("tracemalloc")
+    if traza is None:
+        lineas.append("tracemalloc inactivo (MEMORIA_TRACEMALLOC=<marcos> para activarlo)")
+    else:
+        lineas.append(f"tracemalloc: {traza['actual_mb']} MB ahora, pico {traza['pico_mb']} MB")
+        for titulo, clave in (("desde el informe anterior", "desde_anterior"), ("desde el arranque", "desde_arranque")):
+            lineas.append(f"  {titulo}:")
+            for d in traza[clave]:
+                lineas.append(f"    {d['kb_delta']:+10.1f} KB {d['bloques_delta']:+7d} bloques  {d['donde']}")
+    return "\n".join(lineas)
+
+
+_marcos = os.getenv("MEMORIA_TRACEMALLOC")
+if _marcos:
+    iniciar_trazado(int(_marcos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="worker en marcha, p. ej. http://127.0.0.1:10000")
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN", ""))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="salida JSON en lugar de tabla")
+    args = parser.parse_args()
+
+    if args.url:
+        import urllib.request
+        peticion = urllib.request.Request(f"{args.url.rstrip('/')}/admin/memoria?top={args.top}",
+                                          headers={"X-Admin-Token": args.token})
+        with urllib.request.urlopen(peticion, timeout=30) as r:
+            datos = json.load(r)
+    else:
+        import utils  # noqa: F401  carga catálogo, índices y sesiones como un worker
+        import autocompletar
+        autocompletar.obtener_autocompletar()
+        datos = informe(args.top)
+    print(json.dumps(datos, ensure_ascii=False, indent=2) if args.json else informe_texto(datos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Libro de pedidos confirmados: SQLite de solo inserción.
+
+Cada confirmación añade una fila en `pedidos` y una por producto en `lineas`,
+con la hora de recogida copiada en las líneas para que las consultas por
+franja y por producto se resuelvan con un rango sobre índice:
+
+    ix_pedidos_recogida          -> "todos los pedidos del sábado de 10 a 11"
+    ix_lineas_producto_recogida  -> "kg de pollo entero para mañana"
+
+Las filas no se modifican ni se borran (lo impiden triggers); una corrección
+se registra como un pedido nuevo. `ocupacion` lleva los pedidos reservados en
+cada franja de recogida ((tienda, inicio de la franja) -> nº), compartida por todos los
+workers (ver franjas.py). `recordatorios` apunta a qué pedidos ya se
+les ha enviado (o reclamado) el aviso de recogida (ver recordatorios.py).
+
+Ruta por defecto: PEDIDOS_DB (o pedidos.sqlite3).
+
+Cada fila lleva la clave de su tienda (tiendas.py; '' para la tienda por
+defecto). Las consultas aceptan `tienda`: None (todas) o una clave.
+
+CLI:
+    python pedidos.py 2026-10-24T10:00 2026-10-24T11:00 [producto]
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from data import PRODUCTOS_DB
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS pedidos (
+    id        INTEGER PRIMARY KEY,
+    creado    TEXT NOT NULL,
+    user_id   TEXT NOT NULL,
+    nombre    TEXT,
+    recogida  TEXT NOT NULL,
+    carrito   TEXT NOT NULL,
+    tienda    TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS lineas (
+    pedido_id INTEGER NOT NULL REFERENCES pedidos(id),
+    producto  TEXT NOT NULL,
+    categoria TEXT,
+    kg        REAL NOT NULL DEFAULT 0,
+    u         INTEGER NOT NULL DEFAULT 0,
+    recogida  TEXT NOT NULL,
+    tienda    TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ix_pedidos_recogida ON pedidos(recogida);
+CREATE INDEX IF NOT EXISTS ix_lineas_producto_recogida ON lineas(producto, recogida);
+CREATE INDEX IF NOT EXISTS ix_lineas_recogida ON lineas(recogida);
+CREATE INDEX IF NOT EXISTS ix_pedidos_tienda_recogida ON pedidos(tienda, recogida);
+CREATE INDEX IF NOT EXISTS ix_lineas_tienda_recogida ON lineas(tienda, recogida);
+CREATE TABLE IF NOT EXISTS ocupacion (
+    tienda    TEXT NOT NULL,
+    franja    TEXT NOT NULL,
+    pedidos   INTEGER NOT NULL,
+    PRIMARY KEY (tienda, franja)
+);
+CREATE TABLE IF NOT EXISTS recordatorios (
+    pedido_id INTEGER PRIMARY KEY REFERENCES pedidos(id),
+    enviado   TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS pedidos_sin_update BEFORE UPDATE ON pedidos
+    BEGIN SELECT RAISE(ABORT, 'libro de pedidos de solo inserción'); END;
+CREATE TRIGGER IF NOT EXISTS pedidos_sin_delete BEFORE DELETE ON pedidos
+    BEGIN SELECT RAISE(ABORT, 'libro de pedidos de solo inserción'); END;
+CREATE TRIGGER IF NOT EXISTS lineas_sin_update BEFORE UPDATE ON lineas
+    BEGIN SELECT RAISE(ABORT, 'libro de pedidos de solo inserción'); END;
+CREATE TRIGGER IF NOT EXISTS lineas_sin_delete BEFORE DELETE ON lineas
+    BEGIN SELECT RAISE(ABORT, 'libro de pedidos de solo inserción'); END;
+"""
+
+# ISO con minutos: ordena igual como texto que como fecha
+_FMT = "%Y-%m-%dT%H:%M"
+
+
+def _iso(dt) -> str:
+    if isinstance(dt, datetime):
+        return dt.strftime(_FMT)
+    return str(dt)
+
+
+def _filtro_tienda(columna: str, tienda: str | None) -> tuple[str, tuple]:
+    """Condición SQL extra para una tienda; tienda=None no filtra (todas)."""
+    if tienda is None:
+        return "", ()
+    return f" AND {columna} = ?", (tienda,)
+
+
+class LibroPedidos:
+    """Acceso al libro; una conexión SQLite por hilo."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._local = threading.local()
+        with self._conexion() as conn:
+            conn.executescript(_ESQUEMA)
+
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def registrar(self, user_id: str, session: dict, productos_db=None, tienda: str = "") -> int:
+        """
+        Añade el pedido confirmado de la sesión (de la tienda con esa clave) y devuelve su id.
+        ValueError, sin escribir nada, si el carrito tiene un producto que no es clave del catálogo.
+        """
+        productos_db = productos_db if productos_db is not None else PRODUCTOS_DB
+        recogida = _iso(session.get("hora"))
+        carrito = {}
+        for prod, cantidades in session.get("carrito", {}).items():
+            if prod not in productos_db:
+                raise ValueError(f"Producto fuera del catálogo en el carrito de {user_id}: {prod!r}")
+            if not isinstance(cantidades, dict):
+                cantidades = {"kg": float(cantidades), "u": 0}
+            carrito[prod] = {"kg": float(cantidades.get("kg", 0.0)), "u": int(cantidades.get("u", 0))}
+
+        conn = self._conexion()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO pedidos (creado, user_id, nombre, recogida, carrito, tienda) VALUES (?, ?, ?, ?, ?, ?)",
+                (_iso(datetime.now()), user_id, session.get("nombre"), recogida,
+                 json.dumps(carrito, ensure_ascii=False), tienda),
+            )
+            pedido_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO lineas (pedido_id, producto, categoria, kg, u, recogida, tienda) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(pedido_id, prod, productos_db[prod], c["kg"], c["u"], recogida, tienda)
+                 for prod, c in carrito.items()],
+            )
+        return pedido_id
+
+    def pedidos_entre(self, desde, hasta, tienda: str | None = None) -> list[dict]:
+        """Pedidos con recogida en [desde, hasta); de una tienda o de todas (tienda=None)."""
+        filtro, params = _filtro_tienda("tienda", tienda)
+        filas = self._conexion().execute(
+            f"SELECT * FROM pedidos WHERE recogida >= ? AND recogida < ?{filtro} ORDER BY recogida, id",
+            (_iso(desde), _iso(hasta), *params),
+        ).fetchall()
+        return [dict(f, carrito=json.loads(f["carrito"])) for f in filas]
+
+    def lineas_entre(self, desde, hasta, tienda: str | None = None) -> list[dict]:
+        """Líneas de producto con recogida en [desde, hasta)."""
+        filtro, params = _filtro_tienda("p.tienda", tienda)
+        filas = self._conexion().execute(
+            "SELECT l.*, p.user_id FROM pedidos p JOIN lineas l ON l.pedido_id = p.id "
+            f"WHERE p.recogida >= ? AND p.recogida < ?{filtro} ORDER BY p.recogida, p.id",
+            (_iso(desde), _iso(hasta), *params),
+        ).fetchall()
+        return [dict(f) for f in filas]
+
+    def lineas_df(self, desde, hasta, tienda: str | None = None):
+        """Líneas con recogida en [desde, hasta) como DataFrame columnar (para informes)."""
+        filtro, params = _filtro_tienda("tienda", tienda)
+        df = pd.read_sql_query(
+            "SELECT pedido_id, producto, categoria, kg, u, recogida FROM lineas "
+            f"WHERE recogida >= ? AND recogida < ?{filtro}",
+            self._conexion(), params=(_iso(desde), _iso(hasta), *params),
+        )
+        df["recogida"] = pd.to_datetime(df["recogida"], format=_FMT)
+        return df
+
+    def reservar_franja(self, tienda: str, inicio, fin, capacidad: int) -> int | None:
+        """
+        Suma un pedido a la franja [inicio, fin) si no está llena y devuelve su
+        ocupación nueva; None si está llena. Todo en una transacción BEGIN
+        IMMEDIATE: dos workers no pueden vender el último hueco a la vez.
+        Una franja sin fila empieza con los pedidos de la tienda que ya tenga el libro.
+        """
+        conn = self._conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO ocupacion (tienda, franja, pedidos) "
+                "SELECT ?, ?, COUNT(*) FROM pedidos WHERE tienda = ? AND recogida >= ? AND recogida < ?",
+                (tienda, _iso(inicio), tienda, _iso(inicio), _iso(fin)),
+            )
+            cur = conn.execute(
+                "UPDATE ocupacion SET pedidos = pedidos + 1 WHERE tienda = ? AND franja = ? AND pedidos < ?",
+                (tienda, _iso(inicio), capacidad),
+            )
+            reservado = cur.rowcount == 1
+            n = conn.execute("SELECT pedidos FROM ocupacion WHERE tienda = ? AND franja = ?",
+                             (tienda, _iso(inicio))).fetchone()[0]
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return n if reservado else None
+
+    def ocupacion_franja(self, tienda: str, inicio, fin) -> int:
+        """Pedidos reservados en la franja [inicio, fin) de la tienda."""
+        conn = self._conexion()
+        fila = conn.execute("SELECT pedidos FROM ocupacion WHERE tienda = ? AND franja = ?",
+                            (tienda, _iso(inicio))).fetchone()
+        if fila is not None:
+            return fila[0]
+        return conn.execute("SELECT COUNT(*) FROM pedidos WHERE tienda = ? AND recogida >= ? AND recogida < ?",
+                            (tienda, _iso(inicio), _iso(fin))).fetchone()[0]
+
+    def ocupacion_entre(self, tienda: str, desde, hasta) -> dict:
+        """{inicio de franja (ISO): pedidos reservados} para franjas de la tienda que empiezan en [desde, hasta)."""
+        filas = self._conexion().execute(
+            "SELECT franja, pedidos FROM ocupacion WHERE tienda = ? AND franja >= ? AND franja < ?",
+            (tienda, _iso(desde), _iso(hasta)),
+        ).fetchall()
+        return {franja: n for franja, n in filas}
+
+    def sin_recordar(self, desde, hasta) -> list[dict]:
+        """Pedidos con recogida en [desde, hasta) cuyo recordatorio no se ha reclamado."""
+        filas = self._conexion().execute(
+            "SELECT p.id, p.user_id, p.nombre, p.recogida, p.tienda FROM pedidos p "
+            "LEFT JOIN recordatorios r ON r.pedido_id = p.id "
+            "WHERE r.pedido_id IS NULL AND p.recogida >= ? AND p.recogida < ? ORDER BY p.recogida",
+            (_iso(desde), _iso(hasta)),
+        ).fetchall()
+        return [dict(f) for f in filas]
+
+    def reclamar_recordatorio(self, pedido_id: int) -> bool:
+        """
+        Marca el recordatorio del pedido como enviado. Devuelve False si ya lo
+        estaba: con varios workers solo el que lo reclama primero lo envía.
+        """
+        conn = self._conexion()
+        with conn:
+            cur = conn.execute("INSERT OR IGNORE INTO recordatorios (pedido_id, enviado) VALUES (?, ?)",
+                               (pedido_id, _iso(datetime.now())))
+        return cur.rowcount == 1
+
+    def frecuencias(self, tienda: str | None = None) -> dict:
+        """{producto: nº de pedidos en que aparece}, para ordenar sugerencias."""
+        filtro, params = _filtro_tienda("tienda", tienda)
+        filas = self._conexion().execute(
+            f"SELECT producto, COUNT(*) FROM lineas WHERE 1 = 1{filtro} GROUP BY producto", params,
+        ).fetchall()
+        return {producto: n for producto, n in filas}
+
+    def total_producto(self, producto: str, desde, hasta, tienda: str | None = None) -> dict:
+        """{'kg': float, 'u': int, 'pedidos': int} de un producto con recogida en [desde, hasta)."""
+        filtro, params = _filtro_tienda("tienda", tienda)
+        fila = self._conexion().execute(
+            "SELECT COALESCE(SUM(kg), 0), COALESCE(SUM(u), 0), COUNT(DISTINCT pedido_id) FROM lineas "
+            f"WHERE producto = ? AND recogida >= ? AND recogida < ?{filtro}",
+            (producto, _iso(desde), _iso(hasta), *params),
+        ).fetchone()
+        return {"kg": round(fila[0], 3), "u": int(fila[1]), "pedidos": int(fila[2])}
+
+
+_LIBRO = None
+_LIBRO_LOCK = threading.Lock()
+
+
+def obtener_libro() -> LibroPedidos:
+    global _LIBRO
+    if _LIBRO is None:
+        with _LIBRO_LOCK:
+            if _LIBRO is None:
+                _LIBRO = LibroPedidos(os.getenv("PEDIDOS_DB", "pedidos.sqlite3"))
+    return _LIBRO
+
+
+def registrar_pedido(user_id, session, productos_db=None, tienda: str = ""):
+    """Apunta el pedido confirmado en el libro. Nunca rompe la confirmación."""
+    try:
+        return obtener_libro().registrar(user_id, session, productos_db, tienda)
+    except Exception:
+        logging.exception("Error registrando el pedido en el libro")
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    desde, hasta = datetime.fromisoformat(sys.argv[1]), datetime.fromisoformat(sys.argv[2])
+    libro = obtener_libro()
+    if len(sys.argv) > 3:
+        print(libro.total_producto(" ".join(sys.argv[3:]).lower(), desde, hasta))
+    else:
+        for p in libro.pedidos_entre(desde, hasta):
+            print(f"{p['recogida']}  #{p['id']:<5} {p['nombre'] or p['user_id']}: {p['carrito']}")
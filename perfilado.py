@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Perfilado bajo demanda de las peticiones al webhook.
+
+Se activa con PERFIL_DIR. Se perfila:
+  - una de cada PERFIL_MUESTREO peticiones (0 = ninguna por muestreo), y
+  - toda petición con la cabecera `X-Perfil: <PERFIL_TOKEN>` (si hay token).
+
+Modos (PERFIL_MODO):
+  pila      (por defecto) muestreo de la pila del hilo de la petición cada
+            PERFIL_INTERVALO segundos desde un hilo aparte. Mientras dura, el
+            intervalo de cambio de hilo del intérprete baja a PERFIL_INTERVALO
+            para que el muestreador consiga el GIL a tiempo. Escribe
+            peticiones/<...>.folded y suma en agregado-<pid>.folded, en formato
+            "a;b;c N" listo para flamegraph.pl o speedscope.
+  cprofile  cProfile de la petición: peticiones/<...>.prof y agregado-<pid>.prof
+            (pstats acumulado; ver con `python -m pstats` o snakeviz).
+
+Sin PERFIL_DIR el coste por petición es una comprobación de un global.
+Como mucho se guardan PERFIL_MAX ficheros por proceso (1000 por defecto);
+el agregado se sigue actualizando.
+"""
+import contextlib
+import cProfile
+import hmac
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+
+# sys.setswitchinterval es global: se restaura cuando acaba el último muestreo activo
+_CAMBIO_LOCK = threading.Lock()
+_CAMBIO_ACTIVOS = 0
+_CAMBIO_ORIGINAL = None
+
+
+def _bajar_intervalo_cambio(intervalo: float):
+    global _CAMBIO_ACTIVOS, _CAMBIO_ORIGINAL
+    with _CAMBIO_LOCK:
+        if _CAMBIO_ACTIVOS == 0:
+            _CAMBIO_ORIGINAL = sys.getswitchinterval()
+            sys.setswitchinterval(min(intervalo, _CAMBIO_ORIGINAL))
+        _CAMBIO_ACTIVOS += 1
+
+
+def _restaurar_intervalo_cambio():
+    global _CAMBIO_ACTIVOS
+    with _CAMBIO_LOCK:
+        _CAMBIO_ACTIVOS -= 1
+        if _CAMBIO_ACTIVOS == 0:
+            sys.setswitchinterval(_CAMBIO_ORIGINAL)
+
+
+class MuestreadorPila:
+    """Muestrea la pila de un hilo mientras está activo (ver perfilar)."""
+
+    def __init__(self, hilo_id: int, intervalo: float):
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.muestras = Counter()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name="perfil-pila", daemon=True)
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while frame is not None:
+                code = frame.f_code
+                pila.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if pila:
+                self.muestras[";".join(reversed(pila))] += 1
+
+    def __enter__(self):
+        _bajar_intervalo_cambio(self.intervalo)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        _restaurar_intervalo_cambio()
+
+
+class Perfilador:
+    def __init__(self, directorio: str, muestreo: int = 100, token: str = "", modo: str = "pila",
+                 intervalo: float = 0.001, max_ficheros: int = 1000):
+        if modo not in ("pila", "cprofile"):
+            raise ValueError(f"PERFIL_MODO desconocido: {modo!r}")
+        self.directorio = directorio
+        self.muestreo = muestreo
+        self.token = token
+        self.modo = modo
+        self.intervalo = intervalo
+        self.max_ficheros = max_ficheros
+        self._contador = itertools.count(1)
+        self._escritos = 0
+        self._lock = threading.Lock()
+        self._agregado_pila = Counter()
+        self._agregado_prof = None
+        os.makedirs(os.path.join(directorio, "peticiones"), exist_ok=True)
+
+    def debe_perfilar(self, cabecera: str | None = None) -> bool:
+        if self.token and cabecera and hmac.compare_digest(cabecera, self.token):
+            return True
+        return self.muestreo > 0 and next(self._contador) % self.muestreo == 0
+
+    def _ruta_peticion(self, nombre: str, extension: str) -> str | None:
+        with self._lock:
+            if self._escritos >= self.max_ficheros:
+                return None
+            self._escritos += 1
+            n = self._escritos
+        marca = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.directorio, "peticiones", f"{marca}-{os.getpid()}-{n}-{nombre}.{extension}")
+
+    def _escribir_atomico(self, ruta: str, escribir):
+        tmp = f"{ruta}.tmp"
+        escribir(tmp)
+        os.replace(tmp, ruta)
+
+    @contextlib.contextmanager
+    def perfilar(self, nombre: str = "peticion"):
+        t0 = time.perf_counter()
+        if self.modo == "cprofile":
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                yield
+            finally:
+                perfil.disable()
+                self._guardar_cprofile(perfil, nombre, time.perf_counter() - t0)
+        else:
+            with MuestreadorPila(threading.get_ident(), self.intervalo) as muestreador:
+                yield
+            self._guardar_pila(muestreador.muestras, nombre, time.perf_counter() - t0)
+
+    def _guardar_pila(self, muestras: Counter, nombre: str, segundos: float):
+        try:
+            ruta = self._ruta_peticion(nombre, "folded")
+            if ruta:
+                with open(ruta, "w", encoding="utf-8") as f:
+                    f.write(f"# {segundos * 1e3:.2f} ms\n")
+                    f.writelines(f"{pila} {n}\n" for pila, n in muestras.items())
+            with self._lock:
+                self._agregado_pila.update(muestras)
+                agregado = sorted(self._agregado_pila.items())
+
+            def escribir(tmp):
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.writelines(f"{pila} {n}\n" for pila, n in agregado)
+            self._escribir_atomico(os.path.join(self.directorio, f"agregado-{os.getpid()}.folded"), escribir)
+        except OSError:
+            logging.exception("Error guardando el perfil de la petición")
+
+    def _guardar_cprofile(self, perfil, nombre: str, segundos: float):
+        try:
+            ruta = self._ruta_peticion(nombre, "prof")
+            if ruta:
+                perfil.dump_stats(ruta)
+            with self._lock:
+                if self._agregado_prof is None:
+                    self._agregado_prof = pstats.Stats(perfil)
+                else:
+                    self._agregado_prof.add(perfil)
+                self._escribir_atomico(os.path.join(self.directorio, f"agregado-{os.getpid()}.prof"),
+                                       self._agregado_prof.dump_stats)
+        except OSError:
+            logging.exception("Error guardando el perfil de la petición")
+
+
+_PERFILADOR = None
+_PERFILADOR_LEIDO = False
+_PERFILADOR_LOCK = threading.Lock()
+
+
+def obtener_perfilador() -> Perfilador | None:
+    global _PERFILADOR, _PERFILADOR_LEIDO
+    if _PERFILADOR_LEIDO:
+        return _PERFILADOR
+    with _PERFILADOR_LOCK:
+        if not _PERFILADOR_LEIDO:
+            directorio = os.getenv("PERFIL_DIR")
+            if directorio:
+                _PERFILADOR = Perfilador(
+                    directorio,
+                    muestreo=int(os.getenv("PERFIL_MUESTREO", "100")),
+                    token=os.getenv("PERFIL_TOKEN", ""),
+                    modo=os.getenv("PERFIL_MODO", "pila"),
+                    intervalo=float(os.getenv("PERFIL_INTERVALO", "0.001")),
+                    max_ficheros=int(os.getenv("PERFIL_MAX", "1000")),
+                )
+                logging.info("Perfilado activado en %s (modo %s, 1 de cada %s)",
+                             directorio, _PERFILADOR.modo, _PERFILADOR.muestreo)
+            _PERFILADOR_LEIDO = True
+    return _PERFILADOR
+
+
+def perfilar(cabecera: str | None = None, nombre: str = "webhook"):
+    """Contexto para envolver una petición: perfila si toca, si no no hace nada."""
+    perfilador = obtener_perfilador()
+    if perfilador is None or not perfilador.debe_perfilar(cabecera):
+        return contextlib.nullcontext()
+    return perfilador.perfilar(nombre)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Perfiles de cliente: nombre y últimos carritos confirmados por número.
+
+Al confirmar un pedido se guarda el carrito como IDs de producto del catálogo
+de la tienda (no como texto), así "repetir último pedido" lo reconstruye con
+una búsqueda por clave, sin extracción ni fuzzy. Se conservan los
+PERFIL_CARRITOS últimos (3 por defecto) por cliente y tienda.
+
+Tablas `perfiles` y `perfil_carritos` en PERFILES_DB (por defecto la misma
+base de datos que el libro de pedidos, PEDIDOS_DB). A diferencia del libro,
+los perfiles sí se actualizan y los carritos antiguos se borran.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS perfiles (
+    user_id     TEXT PRIMARY KEY,
+    nombre      TEXT,
+    actualizado TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS perfil_carritos (
+    id       INTEGER PRIMARY KEY,
+    user_id  TEXT NOT NULL,
+    tienda   TEXT NOT NULL,
+    creado   TEXT NOT NULL,
+    lineas   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_perfil_carritos_usuario ON perfil_carritos(user_id, tienda, id);
+"""
+
+_FMT = "%Y-%m-%dT%H:%M"
+
+
+class Perfiles:
+    """Acceso a los perfiles; una conexión SQLite por hilo."""
+
+    def __init__(self, ruta: str, recientes: int = 3):
+        self.ruta = ruta
+        self.recientes = max(1, recientes)
+        self._local = threading.local()
+        with self._conexion() as conn:
+            conn.executescript(_ESQUEMA)
+
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def guardar(self, user_id: str, tienda: str, nombre: str | None, lineas: list):
+        """Apunta un carrito confirmado: lineas = [(id_producto, kg, u), ...]."""
+        ahora = datetime.now().strftime(_FMT)
+        conn = self._conexion()
+        with conn:
+            conn.execute(
+                "INSERT INTO perfiles (user_id, nombre, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET nombre = COALESCE(excluded.nombre, nombre), "
+                "actualizado = excluded.actualizado",
+                (user_id, nombre, ahora),
+            )
+            conn.execute("INSERT INTO perfil_carritos (user_id, tienda, creado, lineas) VALUES (?, ?, ?, ?)",
+                         (user_id, tienda, ahora, json.dumps(lineas)))
+            conn.execute(
+                "DELETE FROM perfil_carritos WHERE user_id = ? AND tienda = ? AND id NOT IN "
+                "(SELECT id FROM perfil_carritos WHERE user_id = ? AND tienda = ? ORDER BY id DESC LIMIT ?)",
+                (user_id, tienda, user_id, tienda, self.recientes),
+            )
+
+    def perfil(self, user_id: str, tienda: str) -> dict | None:
+        """{'nombre', 'carritos': [{'creado', 'lineas'}, ...]} del más reciente al más antiguo, o None."""
+        conn = self._conexion()
+        fila = conn.execute("SELECT nombre FROM perfiles WHERE user_id = ?", (user_id,)).fetchone()
+        if fila is None:
+            return None
+        carritos = conn.execute(
+            "SELECT creado, lineas FROM perfil_carritos WHERE user_id = ? AND tienda = ? ORDER BY id DESC",
+            (user_id, tienda),
+        ).fetchall()
+        return {
+            "nombre": fila["nombre"],
+            "carritos": [{"creado": c["creado"], "lineas": json.loads(c["lineas"])} for c in carritos],
+        }
+
+
+_PERFILES = None
+_PERFILES_LOCK = threading.Lock()
+
+
+def obtener_perfiles() -> Perfiles:
+    global _PERFILES
+    if _PERFILES is None:
+        with _PERFILES_LOCK:
+            if _PERFILES is None:
+                _PERFILES = Perfiles(
+                    os.getenv("PERFILES_DB") or os.getenv("PEDIDOS_DB", "pedidos.sqlite3"),
+                    recientes=int(os.getenv("PERFIL_CARRITOS", "3")),
+                )
+    return _PERFILES
+
+
+def lineas_carrito_ids(carrito: dict, ids_producto: dict) -> list:
+    """Carrito de la sesión -> [(id_producto, kg, u), ...]; lo que no tiene ID se omite."""
+    lineas = []
+    for prod, cantidades in carrito.items():
+        id_producto = ids_producto.get(prod)
+        if id_producto is None:
+            logging.warning("Producto sin ID en el catálogo, no se guarda en el perfil: %s", prod)
+            continue
+        lineas.append((id_producto, float(cantidades.get("kg", 0.0)), int(cantidades.get("u", 0))))
+    return lineas
+
+
+def carrito_desde_ids(lineas: list, productos_id: dict) -> tuple[dict, int]:
+    """[(id_producto, kg, u), ...] -> (carrito de sesión, nº de productos que ya no están en el catálogo)."""
+    carrito, retirados = {}, 0
+    for id_producto, kg, u in lineas:
+        prod = productos_id.get(id_producto)
+        if prod is None:
+            retirados += 1
+            continue
+        carrito[prod] = {"kg": kg, "u": u}
+    return carrito, retirados
+
+
+def guardar_perfil(user_id, tienda, session):
+    """Apunta el pedido confirmado en el perfil del cliente. Nunca rompe la confirmación."""
+    try:
+        lineas = lineas_carrito_ids(session.get("carrito", {}), tienda.catalogo.ids_producto)
+        if lineas:
+            obtener_perfiles().guardar(user_id, tienda.clave, session.get("nombre"), lineas)
+    except Exception:
+        logging.exception("Error guardando el perfil del cliente")
@@ -1,10 +1,10 @@
 import os
 import logging
-import base64
 from datetime import datetime
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
-from data import PRODUCTOS_DB
+from data import PRODUCTOS_DB, PRECIOS_DB
+from envios import obtener_cliente_correo
+from impresora import codificar_escpos, obtener_spooler
+from ticket_pdf import renderizar_ticket_pdf
 
 
 def imprimir_pedido(session):
@@ -40,35 +40,117 @@ def imprimir_pedido(session):
     )
 
 
-def send_to_printer(user_id, session):
+# Si se fija (asgi.py), send_to_printer le pasa el trabajo en lugar de hacerlo
+# en el hilo que atiende el mensaje: despachador(funcion, *args).
+_DESPACHADOR = None
+
+
+def fijar_despachador(despachador):
+    global _DESPACHADOR
+    _DESPACHADOR = despachador
+
+
+def send_to_printer(user_id, session, precios_db=None, tienda=None):
     """
     Envía el ticket a la impresora y por correo.
+    La impresión solo encola el trabajo en el spooler (ver impresora.py), nunca espera a la impresora.
+    El formato del adjunto se elige con TICKET_FORMATO ("pdf" por defecto, o "txt").
+    precios_db: precios de la tienda del pedido (por defecto los de data.py).
+    tienda: su impresora, su correo y su cabecera del ticket (por defecto, los de la configuración global).
     """
+    if _DESPACHADOR is not None:
+        _DESPACHADOR(_enviar_ticket, user_id, session, precios_db, tienda)
+    else:
+        _enviar_ticket(user_id, session, precios_db, tienda)
+
+
+def _enviar_ticket(user_id, session, precios_db=None, tienda=None):
+    impresora = getattr(tienda, "impresora", None)
+    email = getattr(tienda, "email", None)
+    cabecera = getattr(tienda, "cabecera", None)
     try:
-        ticket_path = generar_ticket(user_id, session)
-        enviar_correo(ticket_path, session)
+        imprimir_ticket(user_id, session, precios_db, impresora, cabecera)
+    except Exception:
+        logging.exception("Error enviando el ticket a la impresora")
+
+    try:
+        if os.getenv("TICKET_FORMATO", "pdf") == "pdf":
+            ticket_path = generar_ticket_pdf(user_id, session, precios_db, cabecera)
+            enviar_correo(ticket_path, session, tipo="application/pdf", destinatario=email)
+        else:
+            ticket_path = generar_ticket(user_id, session, precios_db, cabecera)
+            enviar_correo(ticket_path, session, destinatario=email)
     except Exception:
         logging.exception("Error en send_to_printer")
 
 
-def generar_ticket(user_id, session):
+def lineas_ticket(session, precios_db=None):
+    """
+    Calcula las líneas del ticket a partir del carrito {'prod': {'kg': float, 'u': int}}.
+    Devuelve (lineas, total) con lineas = [(producto, cantidad, unidad, precio, subtotal), ...]
+    Un producto sin precio en precios_db para esa unidad se registra como error y
+    va con precio y subtotal None (el ticket lo marca "sin precio"); no suma al total.
+    """
+    precios_db = precios_db if precios_db is not None else PRECIOS_DB
+    lineas = []
+    total = 0.0
+    carrito = session.get("carrito", {})
+    for producto, cantidades in carrito.items():
+        # Retrocompatibilidad: un número suelto se trata como kg
+        if not isinstance(cantidades, dict):
+            cantidades = {"kg": float(cantidades), "u": 0}
+        precios = precios_db.get(producto, {})
+        for unidad in ("kg", "u"):
+            cantidad = cantidades.get(unidad, 0)
+            if not cantidad:
+                continue
+            if precios.get(unidad) is None:
+                logging.error("Sin precio por %s para %r en el ticket", unidad, producto)
+                lineas.append((producto, cantidad, unidad, None, None))
+                continue
+            precio = float(precios[unidad])
+            subtotal = precio * cantidad
+            total += subtotal
+            lineas.append((producto, cantidad, unidad, precio, subtotal))
+    return lineas, total
+
+
+def imprimir_ticket(user_id, session, precios_db=None, impresora=None, cabecera=None):
+    """
+    Codifica el ticket en ESC/POS y lo encola en la impresora térmica
+    (`impresora`, o IMPRESORA_DISPOSITIVO).
+    Devuelve False si no hay impresora configurada o la cola está llena.
+    """
+    spooler = obtener_spooler(impresora)
+    if spooler is None:
+        return False
+    lineas, total = lineas_ticket(session, precios_db)
+    datos = codificar_escpos(session.get("nombre", user_id), lineas, total, session.get("hora"),
+                             ancho=int(os.getenv("IMPRESORA_ANCHO", "42")), cabecera=cabecera)
+    return spooler.encolar(datos)
+
+
+def generar_ticket(user_id, session, precios_db=None, cabecera=None):
     """
     Genera un ticket en archivo de texto y devuelve su ruta.
     """
     ticket_text = []
-    ticket_text.append("=== CARNICERÍA EL BUEN CORTE ===")
+    ticket_text.append(f"=== {cabecera[0] if cabecera else 'CARNICERÍA EL BUEN CORTE'} ===")
     ticket_text.append(f"Cliente: {session.get('nombre', user_id)}")
     ticket_text.append("")
 
-    total = 0
-    carrito = session.get("carrito", {})
-    for producto, kilos in carrito.items():
-        precio_unitario = PRODUCTOS_DB.get(producto, 0)
-        subtotal = precio_unitario * kilos
-        total += subtotal
-        ticket_text.append(
-            f"{producto.capitalize():<10} {kilos:.2f} kg  {precio_unitario:.2f} €/kg  -> {subtotal:.2f} €"
-        )
+    lineas, total = lineas_ticket(session, precios_db)
+    for producto, cantidad, unidad, precio_unitario, subtotal in lineas:
+        if precio_unitario is None:
+            ticket_text.append(f"{producto.capitalize():<10} {cantidad:g} {unidad}  -> sin precio")
+        elif unidad == "kg":
+            ticket_text.append(
+                f"{producto.capitalize():<10} {cantidad:.2f} kg  {precio_unitario:.2f} €/kg  -> {subtotal:.2f} €"
+            )
+        else:
+            ticket_text.append(
+                f"{producto.capitalize():<10} {int(cantidad)} u  {precio_unitario:.2f} €/u  -> {subtotal:.2f} €"
+            )
 
     ticket_text.append("")
     ticket_text.append(f"TOTAL: {total:.2f} €")
@@ -83,45 +165,29 @@ def generar_ticket(user_id, session):
     return ruta_ticket
 
 
-def enviar_correo(ruta_ticket, session):
+def generar_ticket_pdf(user_id, session, precios_db=None, cabecera=None):
     """
-    Envía el ticket por correo usando SendGrid.
+    Genera el ticket en PDF (ver ticket_pdf.py) y devuelve su ruta.
     """
-    try:
-        SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
-        DESTINATARIO = os.getenv("EMAIL_DESTINO", "vbavierita@gmail.com")
-        REMITENTE = os.getenv("EMAIL_REMITENTE", "patatavfb6@gmail.com")
-
-        if not SENDGRID_API_KEY:
-            logging.error("Falta la variable de entorno SENDGRID_API_KEY")
-            return
-
-        asunto = "Ticket de compra - Carnicería El Buen Corte"
-        cuerpo = "Adjunto encontrará su ticket de compra. ¡Gracias por confiar en nosotros!"
-
-        message = Mail(
-            from_email=REMITENTE,
-            to_emails=DESTINATARIO,
-            subject=asunto,
-            plain_text_content=cuerpo
-        )
-
-        with open(ruta_ticket, "rb") as f:
-            data = f.read()
-            encoded_file = base64.b64encode(data).decode()
-
-        attached_file = Attachment(
-            FileContent(encoded_file),
-            FileName(os.path.basename(ruta_ticket)),
-            FileType("text/plain"),
-            Disposition("attachment")
-        )
+    lineas, total = lineas_ticket(session, precios_db)
+    pdf = renderizar_ticket_pdf(session.get("nombre", user_id), lineas, total, session.get("hora"), cabecera)
+    ruta_ticket = f"/tmp/ticket_{user_id}.pdf"
+    with open(ruta_ticket, "wb") as f:
+        f.write(pdf)
+    return ruta_ticket
 
-        message.attachment = attached_file
 
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        logging.info(f"Correo enviado: Status {response.status_code}")
+def enviar_correo(ruta_ticket, session, tipo="text/plain", destinatario=None):
+    """
+    Envía el ticket por correo (a `destinatario`, o a EMAIL_DESTINO) usando el
+    cliente SendGrid compartido del worker (conexiones keep-alive y agrupación
+    opcional en lotes, ver envios.py).
+    """
+    try:
+        cliente = obtener_cliente_correo(destinatario)
+        if cliente is None:
+            return
+        cliente.enviar_ticket(ruta_ticket, tipo)
 
     except Exception:
         logging.exception("Error enviando correo con SendGrid")
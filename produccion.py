@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Hoja de producción diaria para el obrador: kg y unidades por producto,
+agrupados por categoría y por franja de recogida.
+
+Las líneas de los pedidos confirmados se leen del libro (pedidos.py) directamente
+como DataFrame y se agregan con group-by de pandas, sin bucles en Python.
+
+Cada tienda (tiendas.py) tiene su hoja: solo sus pedidos, con las categorías
+de su catálogo.
+
+CLI:
+    python produccion.py [AAAA-MM-DD] [--franja MINUTOS] [--csv RUTA] [--tienda NÚMERO]
+    (por defecto: mañana, franjas de 60 minutos, la tienda por defecto)
+"""
+import argparse
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from pedidos import obtener_libro
+from tiendas import TIENDA_POR_DEFECTO, obtener_tienda
+
+
+def cargar_lineas(desde: datetime, hasta: datetime, libro=None, tienda=None) -> pd.DataFrame:
+    """
+    Líneas de la tienda (por defecto, la tienda por defecto) con recogida en
+    [desde, hasta): pedido_id, producto, categoria, kg, u, recogida.
+    """
+    tienda = tienda or TIENDA_POR_DEFECTO
+    df = (libro or obtener_libro()).lineas_df(desde, hasta, tienda.clave)
+    # pedidos antiguos sin categoría: se completa con el catálogo actual
+    df["categoria"] = df["categoria"].fillna(df["producto"].map(tienda.productos_db)).fillna("otros")
+    return df
+
+
+def resumen_produccion(df: pd.DataFrame, minutos_franja: int = 60) -> dict[str, pd.DataFrame]:
+    """
+    Devuelve:
+      - "por_producto": categoria, producto, kg, u, pedidos (ordenado por categoría y kg)
+      - "por_franja":  producto x franja de recogida con kg y unidades
+    """
+    por_producto = (
+        df.groupby(["categoria", "producto"], sort=False)
+          .agg(kg=("kg", "sum"), u=("u", "sum"), pedidos=("pedido_id", "nunique"))
+          .reset_index()
+          .sort_values(["categoria", "kg", "u"], ascending=[True, False, False], kind="stable")
+          .reset_index(drop=True)
+    )
+
+    franja = df["recogida"].dt.floor(f"{minutos_franja}min")
+    por_franja = (
+        df.assign(franja=franja)
+          .pivot_table(index=["categoria", "producto"], columns="franja",
+                       values=["kg", "u"], aggfunc="sum", fill_value=0)
+    )
+    return {"por_producto": por_producto, "por_franja": por_franja}
+
+
+def _cantidad(kg: float, u: int) -> str:
+    partes = []
+    if kg > 0:
+        partes.append(f"{kg:.3f}".rstrip("0").rstrip(".") + " kg")
+    if u > 0:
+        partes.append(f"{int(u)} u")
+    return " + ".join(partes) or "-"
+
+
+def hoja_produccion(resumen: dict[str, pd.DataFrame], titulo: str, ancho: int = 60) -> str:
+    """Texto listo para imprimir a partir de resumen_produccion."""
+    por_producto = resumen["por_producto"]
+    por_franja = resumen["por_franja"]
+    lineas = ["=" * ancho, titulo.center(ancho), "=" * ancho]
+    if por_producto.empty:
+        lineas.append("Sin pedidos.")
+        return "\n".join(lineas)
+
+    # Totales por producto, por categoría
+    for categoria, grupo in por_producto.groupby("categoria", sort=False):
+        lineas.append("")
+        lineas.append(f"[{categoria.upper()}]")
+        for prod, kg, u, n in zip(grupo["producto"], grupo["kg"], grupo["u"], grupo["pedidos"]):
+            lineas.append(f"  {prod.capitalize()[:ancho - 26]:<{ancho - 26}} {_cantidad(kg, u):>16} ({n} ped.)")
+
+    # Reparto por franja de recogida
+    lineas.append("")
+    lineas.append("-" * ancho)
+    lineas.append("POR FRANJA DE RECOGIDA")
+    franjas = por_franja["kg"].columns
+    for f in franjas:
+        kg_f = por_franja[("kg", f)]
+        u_f = por_franja[("u", f)]
+        activos = (kg_f > 0) | (u_f > 0)
+        if not activos.any():
+            continue
+        lineas.append(f"{f:%d/%m %H:%M}")
+        for (categoria, prod), kg, u in zip(kg_f.index[activos], kg_f[activos], u_f[activos]):
+            lineas.append(f"  {prod.capitalize()[:ancho - 20]:<{ancho - 20}} {_cantidad(kg, u):>16}")
+    lineas.append("=" * ancho)
+    return "\n".join(lineas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hoja de producción del día")
+    parser.add_argument("dia", nargs="?", help="AAAA-MM-DD (por defecto mañana)")
+    parser.add_argument("--franja", type=int, default=60, help="minutos por franja de recogida")
+    parser.add_argument("--csv", help="guardar también los totales por producto en CSV")
+    parser.add_argument("--tienda", help="número de Twilio de la tienda (ver tiendas.py)")
+    args = parser.parse_args()
+
+    dia = date.fromisoformat(args.dia) if args.dia else date.today() + timedelta(days=1)
+    desde = datetime(dia.year, dia.month, dia.day)
+    tienda = obtener_tienda(args.tienda)
+    df = cargar_lineas(desde, desde + timedelta(days=1), tienda=tienda)
+    resumen = resumen_produccion(df, args.franja)
+    titulo = f"PRODUCCIÓN {dia:%d/%m/%Y}" + (f" - {tienda.nombre.upper()}" if tienda.clave else "")
+    print(hoja_produccion(resumen, titulo))
+    if args.csv:
+        resumen["por_producto"].to_csv(args.csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Recordatorios de recogida por WhatsApp.
+
+Al confirmar un pedido se programa un aviso RECORDATORIO_ANTELACION minutos
+antes de la recogida (120 por defecto). Si faltan menos de RECORDATORIO_MINIMO
+minutos (30) no se avisa: el cliente acaba de hacer el pedido.
+
+  - Planificador: un montículo (heapq) de (instante, pedido_id) y un solo hilo
+    que duerme hasta el primero. Programar y cancelar son O(log n) y O(1)
+    (la cancelación es perezosa: la entrada se descarta al salir del montículo).
+    Cada recordatorio pendiente ocupa una tupla y una entrada de dict (~300 B):
+    decenas de miles caben sin problema.
+  - Arranque: el planificador se crea al arrancar el worker (main.py, y el
+    lifespan de asgi.py) y carga del libro de pedidos (pedidos.py) los pedidos
+    con recogida futura cuyo recordatorio no se ha enviado, sin esperar al
+    primer pedido nuevo.
+  - Remitente: el aviso sale del número de la tienda del pedido (columna
+    `tienda` del libro); los de la tienda por defecto, de TWILIO_FROM.
+  - Varios workers: todos cargan los mismos pendientes, pero antes de enviar
+    cada uno reclama el pedido en el libro (INSERT OR IGNORE) y solo envía el
+    que lo consigue. Si el proceso muere entre reclamar y enviar, ese aviso se
+    pierde (mejor que duplicarlo).
+  - Transporte intercambiable: API de mensajes de Twilio (o el servidor falso
+    de falsos.py con TWILIO_URL) o en memoria.
+
+Variables: RECORDATORIOS=1 para activarlo, RECORDATORIO_TRANSPORTE=memoria,
+TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM (remitente por defecto,
+obligatorio), TWILIO_URL, RECORDATORIO_ANTELACION, RECORDATORIO_MINIMO.
+"""
+import atexit
+import base64
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from envios import TransporteHTTP
+from fragmentos import texto
+from pedidos import obtener_libro
+
+TWILIO_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+REINTENTOS = 3
+ESPERA_REINTENTO = 60.0
+
+
+class TransporteTwilio(TransporteHTTP):
+    """POST form-urlencoded a la API de mensajes de Twilio, con el pool keep-alive de envios.py."""
+
+    def __init__(self, account_sid: str, auth_token: str, remitente: str, url: str | None = None, **kwargs):
+        super().__init__("", url or TWILIO_URL.format(sid=account_sid), **kwargs)
+        credenciales = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self._cabeceras = {
+            "Authorization": f"Basic {credenciales}",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Connection": "keep-alive",
+        }
+        self.remitente = remitente
+
+    def _codificar(self, payload: dict) -> bytes:
+        return urlencode(payload).encode("utf-8")
+
+    def enviar_mensaje(self, destino: str, cuerpo: str, remitente: str | None = None) -> int:
+        return self.enviar({"From": remitente or self.remitente, "To": destino, "Body": cuerpo})
+
+
+class TransporteMemoriaMensajes:
+    """Guarda los mensajes en una lista (desarrollo sin red)."""
+
+    def __init__(self):
+        self.enviados = []
+
+    def enviar_mensaje(self, destino: str, cuerpo: str, remitente: str | None = None) -> int:
+        self.enviados.append({"From": remitente, "To": destino, "Body": cuerpo})
+        return 201
+
+    def cerrar(self):
+        pass
+
+
+def remitente_tienda(tienda: str, user_id: str) -> str | None:
+    """Número de WhatsApp de la tienda con clave `tienda`; None (TWILIO_FROM) para la tienda por defecto."""
+    if tienda and str(user_id).startswith("whatsapp:"):
+        return f"whatsapp:{tienda}"
+    return None
+
+
+def texto_aviso(nombre: str | None, recogida: datetime) -> str:
+    from utils import formatear_fecha  # utils importa este módulo
+    return texto("aviso_recogida").format(nombre=f" {nombre}" if nombre else "", hora=formatear_fecha(recogida))
+
+
+class Recordatorios:
+    def __init__(self, transporte, libro=None, antelacion: float = 120, minimo: float = 30):
+        self.transporte = transporte
+        self.libro = libro
+        self.antelacion = timedelta(minutes=antelacion)
+        self.minimo = timedelta(minutes=minimo)
+        self._monticulo = []   # (instante, pedido_id)
+        self._datos = {}       # pedido_id -> [instante, user_id, nombre, recogida, remitente, intentos]
+        self._cond = threading.Condition()
+        self._cerrado = False
+        self.enviados = 0
+        self.fallidos = 0
+        self._hilo = threading.Thread(target=self._bucle, name="recordatorios", daemon=True)
+        self._hilo.start()
+
+    def _instante(self, recogida: datetime) -> float | None:
+        ahora = datetime.now()
+        if recogida - ahora < self.minimo:
+            return None
+        aviso = max(recogida - self.antelacion, ahora)
+        return time.time() + (aviso - ahora).total_seconds()
+
+    def programar(self, pedido_id: int, user_id: str, nombre: str | None, recogida: datetime,
+                  remitente: str | None = None) -> bool:
+        """Programa (o reprograma) el aviso del pedido. False si la recogida está demasiado cerca."""
+        instante = self._instante(recogida)
+        if instante is None:
+            return False
+        with self._cond:
+            self._datos[pedido_id] = [instante, user_id, nombre, recogida, remitente, 0]
+            heapq.heappush(self._monticulo, (instante, pedido_id))
+            if self._monticulo[0][1] == pedido_id:
+                self._cond.notify()
+        return True
+
+    def cancelar(self, pedido_id: int):
+        with self._cond:
+            self._datos.pop(pedido_id, None)
+
+    def restaurar(self) -> int:
+        """Carga del libro los avisos pendientes de pedidos con recogida futura."""
+        ahora = datetime.now()
+        entradas = []
+        for p in self.libro.sin_recordar(ahora + self.minimo, datetime.max):
+            recogida = datetime.fromisoformat(p["recogida"])
+            instante = self._instante(recogida)
+            if instante is not None:
+                remitente = remitente_tienda(p["tienda"], p["user_id"])
+                entradas.append((instante, p["id"], [instante, p["user_id"], p["nombre"], recogida, remitente, 0]))
+        with self._cond:
+            for instante, pedido_id, datos in entradas:
+                self._datos.setdefault(pedido_id, datos)
+            self._monticulo.extend((instante, pedido_id) for instante, pedido_id, _ in entradas)
+            heapq.heapify(self._monticulo)
+            self._cond.notify()
+        return len(entradas)
+
+    def pendientes(self) -> int:
+        with self._cond:
+            return len(self._datos)
+
+    def _vencidos(self) -> list:
+        """Espera al primer aviso vencido y devuelve todos los que lo están (con el lock tomado)."""
+        while not self._cerrado:
+            ahora = time.time()
+            vencidos = []
+            while self._monticulo and self._monticulo[0][0] <= ahora:
+                instante, pedido_id = heapq.heappop(self._monticulo)
+                datos = self._datos.get(pedido_id)
+                if datos is not None and datos[0] == instante:   # si no, cancelado o reprogramado
+                    del self._datos[pedido_id]
+                    vencidos.append((pedido_id, datos))
+            if vencidos:
+                return vencidos
+            self._cond.wait(self._monticulo[0][0] - ahora if self._monticulo else None)
+        return []
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                vencidos = self._vencidos()
+                if self._cerrado:
+                    return
+            for pedido_id, datos in vencidos:
+                self._enviar(pedido_id, datos)
+
+    def _enviar(self, pedido_id: int, datos: list):
+        _, user_id, nombre, recogida, remitente, intentos = datos
+        try:
+            if intentos == 0 and self.libro is not None and not self.libro.reclamar_recordatorio(pedido_id):
+                return   # ya lo envió otro worker
+            status = self.transporte.enviar_mensaje(user_id, texto_aviso(nombre, recogida), remitente)
+            if status >= 300:
+                raise RuntimeError(f"Twilio respondió {status}")
+            self.enviados += 1
+        except Exception:
+            if intentos + 1 >= REINTENTOS:
+                self.fallidos += 1
+                logging.exception("No se pudo enviar el recordatorio del pedido %s", pedido_id)
+                return
+            logging.warning("Fallo enviando el recordatorio del pedido %s, reintento en %.0fs",
+                            pedido_id, ESPERA_REINTENTO * (intentos + 1))
+            instante = time.time() + ESPERA_REINTENTO * (intentos + 1)
+            with self._cond:
+                self._datos[pedido_id] = [instante, user_id, nombre, recogida, remitente, intentos + 1]
+                heapq.heappush(self._monticulo, (instante, pedido_id))
+
+    def cerrar(self):
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify()
+        self._hilo.join()
+        self.transporte.cerrar()
+
+
+_RECORDATORIOS = None
+_RECORDATORIOS_LEIDO = False
+_RECORDATORIOS_LOCK = threading.Lock()
+
+
+def obtener_recordatorios() -> Recordatorios | None:
+    """Planificador del worker, o None si RECORDATORIOS no está activado o falta configuración."""
+    global _RECORDATORIOS, _RECORDATORIOS_LEIDO
+    if _RECORDATORIOS_LEIDO:
+        return _RECORDATORIOS
+    with _RECORDATORIOS_LOCK:
+        if not _RECORDATORIOS_LEIDO:
+            _RECORDATORIOS_LEIDO = True
+            if os.getenv("RECORDATORIOS") != "1":
+                return None
+            if os.getenv("RECORDATORIO_TRANSPORTE") == "memoria":
+                transporte = TransporteMemoriaMensajes()
+            else:
+                sid, token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+                if not sid or not token:
+                    logging.error("Faltan TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN: recordatorios desactivados")
+                    return None
+                remitente = os.getenv("TWILIO_FROM")
+                if not remitente:
+                    logging.error("Falta TWILIO_FROM: recordatorios desactivados")
+                    return None
+                transporte = TransporteTwilio(sid, token, remitente, os.getenv("TWILIO_URL"))
+            recordatorios = Recordatorios(
+                transporte,
+                obtener_libro(),
+                antelacion=float(os.getenv("RECORDATORIO_ANTELACION", "120")),
+                minimo=float(os.getenv("RECORDATORIO_MINIMO", "30")),
+            )
+            try:
+                n = recordatorios.restaurar()
+                logging.info("Recordatorios activados: %d pendientes restaurados del libro", n)
+            except Exception:
+                logging.exception("No se pudieron restaurar los recordatorios del libro")
+            atexit.register(recordatorios.cerrar)
+            _RECORDATORIOS = recordatorios
+    return _RECORDATORIOS
+
+
+def programar_recordatorio(pedido_id, user_id, session, remitente=None):
+    """Programa el aviso de un pedido recién confirmado. Nunca rompe la confirmación."""
+    if pedido_id is None:
+        return
+    try:
+        recordatorios = obtener_recordatorios()
+        if recordatorios is not None and isinstance(session.get("hora"), datetime):
+            recordatorios.programar(pedido_id, user_id, session.get("nombre"), session["hora"], remitente)
+    except Exception:
+        logging.exception("Error programando el recordatorio del pedido %s", pedido_id)
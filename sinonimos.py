@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Sinónimos aprendidos de las aclaraciones de los clientes.
+
+Cuando _canonicalizar_producto devuelve varias opciones para un texto
+("chuleton" -> chuletón de ternera / super chuletón...), el cliente elige una
+en el siguiente mensaje. Esa elección se apunta aquí, una vez por cliente:
+lo que cuenta es cuántos clientes distintos eligieron cada opción, no cuántas
+veces (un mismo cliente repitiendo no enseña nada nuevo).
+
+Un texto pasa al nivel de búsqueda exacta (se resuelve sin keywords ni fuzzy
+y sin volver a preguntar) cuando su opción más elegida llega a
+SINONIMOS_UMBRAL clientes (3 por defecto) y supera a todas las demás.
+
+Las elecciones viven en la tabla `sinonimos_elecciones` de SINONIMOS_DB (por
+defecto la base de datos del libro de pedidos, PEDIDOS_DB): cada elección es
+un INSERT OR IGNORE de una fila, atómico entre workers, sin reescribir nada.
+Cada worker vuelve a contar como mucho cada SINONIMOS_RECARGA segundos (5).
+Cada tienda (tiendas.py) aprende por separado (columna `tienda`).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from expresiones import _normalize
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS sinonimos_elecciones (
+    tienda   TEXT NOT NULL,
+    texto    TEXT NOT NULL,
+    producto TEXT NOT NULL,
+    user_id  TEXT NOT NULL,
+    PRIMARY KEY (tienda, texto, producto, user_id)
+);
+"""
+
+
+class SinonimosAprendidos:
+    def __init__(self, ruta: str, tienda: str = "", umbral: int = 3, recarga: float = 5.0):
+        self.ruta = ruta
+        self.tienda = tienda
+        self.umbral = umbral
+        self.recarga = recarga
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conteos = {}      # texto normalizado -> {producto: clientes}
+        self._promovidos = {}   # texto normalizado -> producto
+        self._ultima_carga = 0.0
+        with self._conexion() as conn:
+            conn.executescript(_ESQUEMA)
+        self._cargar()
+
+    # --- persistencia ---
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cargar(self):
+        try:
+            filas = self._conexion().execute(
+                "SELECT texto, producto, COUNT(*) FROM sinonimos_elecciones WHERE tienda = ? "
+                "GROUP BY texto, producto",
+                (self.tienda,),
+            ).fetchall()
+        except sqlite3.Error:
+            logging.exception("No se pudieron leer los sinónimos aprendidos (%s)", self.ruta)
+            return
+        conteos = {}
+        for texto, producto, n in filas:
+            conteos.setdefault(texto, {})[producto] = n
+        self._conteos = conteos
+        self._promovidos = self._calcular_promovidos()
+        self._ultima_carga = time.monotonic()
+
+    # --- consulta y registro ---
+    def _calcular_promovidos(self) -> dict:
+        promovidos = {}
+        for texto, elecciones in self._conteos.items():
+            orden = sorted(elecciones.values(), reverse=True)
+            if orden and orden[0] >= self.umbral and (len(orden) == 1 or orden[0] > orden[1]):
+                promovidos[texto] = max(elecciones, key=elecciones.get)
+        return promovidos
+
+    def promovidos(self) -> dict:
+        """{texto normalizado: producto} ya confirmados por los clientes."""
+        if time.monotonic() - self._ultima_carga >= self.recarga:
+            with self._lock:
+                if time.monotonic() - self._ultima_carga >= self.recarga:
+                    self._cargar()
+        return self._promovidos
+
+    def registrar(self, texto: str, producto: str, user_id: str):
+        """El cliente `user_id` resolvió `texto` eligiendo `producto`."""
+        clave = _normalize(texto)
+        if not clave or not producto or not user_id:
+            return
+        try:
+            conn = self._conexion()
+            with conn:
+                cur = conn.execute("INSERT OR IGNORE INTO sinonimos_elecciones VALUES (?, ?, ?, ?)",
+                                   (self.tienda, clave, producto, str(user_id)))
+        except sqlite3.Error:
+            logging.exception("No se pudieron guardar los sinónimos aprendidos (%s)", self.ruta)
+            return
+        if cur.rowcount == 1:
+            # este worker ve su propia elección sin esperar a la recarga
+            with self._lock:
+                elecciones = self._conteos.setdefault(clave, {})
+                elecciones[producto] = elecciones.get(producto, 0) + 1
+                self._promovidos = self._calcular_promovidos()
+
+
+_APRENDIDOS = {}   # clave de tienda -> SinonimosAprendidos
+_APRENDIDOS_LOCK = threading.Lock()
+
+
+def obtener_sinonimos_aprendidos(tienda: str = "") -> SinonimosAprendidos:
+    aprendidos = _APRENDIDOS.get(tienda)
+    if aprendidos is None:
+        with _APRENDIDOS_LOCK:
+            aprendidos = _APRENDIDOS.get(tienda)
+            if aprendidos is None:
+                aprendidos = SinonimosAprendidos(
+                    os.getenv("SINONIMOS_DB") or os.getenv("PEDIDOS_DB", "pedidos.sqlite3"),
+                    tienda=tienda,
+                    umbral=int(os.getenv("SINONIMOS_UMBRAL", "3")),
+                    recarga=float(os.getenv("SINONIMOS_RECARGA", "5")),
+                )
+                _APRENDIDOS[tienda] = aprendidos
+    return aprendidos
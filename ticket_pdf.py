@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Ticket en PDF (rollo de 80 mm) con reportlab.
+
+Todo lo que no depende del pedido (fuentes TTF, logo, medidas, cabecera de la
+tienda) se prepara una sola vez por worker en _recursos(); cada ticket solo
+dibuja sus líneas sobre un canvas nuevo.
+
+Variables de entorno:
+  TICKET_FUENTE / TICKET_FUENTE_NEGRITA: rutas TTF. Por defecto se usa Helvetica,
+    que no se incrusta en el PDF (tildes y € van en WinAnsi) y mantiene el render
+    en 1-2 ms; una TTF se subsetea en cada documento y cuesta unos 6 ms más.
+  TICKET_LOGO: ruta de una imagen para la cabecera
+"""
+import io
+import os
+from datetime import datetime
+from functools import lru_cache
+
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+ANCHO = 80 * mm
+MARGEN = 4 * mm
+INTERLINEA = 4.2 * mm
+CABECERA = ("CARNICERÍA EL BUEN CORTE", "Lunes a Sábado 9:00-14:00 y 17:00-20:00")
+
+def _registrar_fuente(nombre: str, ruta: str | None, respaldo: str) -> str:
+    if ruta and os.path.exists(ruta):
+        pdfmetrics.registerFont(TTFont(nombre, ruta))
+        return nombre
+    return respaldo
+
+
+@lru_cache(maxsize=1)
+def _recursos() -> dict:
+    """Fuentes, logo y medidas fijas: se construyen en el primer ticket y se reutilizan."""
+    fuente = _registrar_fuente("TicketSans", os.getenv("TICKET_FUENTE"), "Helvetica")
+    negrita = _registrar_fuente("TicketSans-Bold", os.getenv("TICKET_FUENTE_NEGRITA"), "Helvetica-Bold")
+
+    logo, alto_logo = None, 0.0
+    ruta_logo = os.getenv("TICKET_LOGO")
+    if ruta_logo and os.path.exists(ruta_logo):
+        logo = ImageReader(ruta_logo)
+        w, h = logo.getSize()
+        alto_logo = min(25 * mm, (ANCHO - 2 * MARGEN) * h / w)
+
+    return {
+        "fuente": fuente,
+        "negrita": negrita,
+        "logo": logo,
+        "alto_logo": alto_logo,
+        "ancho_util": ANCHO - 2 * MARGEN,
+        "alto_fijo": alto_logo + 8 * INTERLINEA + 2 * MARGEN,
+    }
+
+
+def _recortar(texto: str, fuente: str, tam: float, ancho: float) -> str:
+    if pdfmetrics.stringWidth(texto, fuente, tam) <= ancho:
+        return texto
+    while texto and pdfmetrics.stringWidth(texto + "…", fuente, tam) > ancho:
+        texto = texto[:-1]
+    return texto + "…"
+
+
+def renderizar_ticket_pdf(nombre: str, lineas: list, total: float, hora=None, cabecera=None) -> bytes:
+    """
+    Devuelve el PDF del ticket en bytes.
+    lineas = [(producto, cantidad, unidad, precio, subtotal), ...] como printer.lineas_ticket
+    (precio None: la línea sale "sin precio").
+    cabecera: (nombre de la tienda, otras líneas...); por defecto CABECERA.
+    """
+    cabecera = cabecera or CABECERA
+    r = _recursos()
+    fuente, negrita = r["fuente"], r["negrita"]
+    alto = r["alto_fijo"] + len(cabecera) * INTERLINEA + max(1, len(lineas)) * 2 * INTERLINEA
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=(ANCHO, alto), pageCompression=1)
+    c.setTitle("Ticket de compra")
+    izq, der = MARGEN, ANCHO - MARGEN
+    centro = ANCHO / 2
+    y = alto - MARGEN
+
+    # Cabecera de la tienda
+    if r["logo"] is not None:
+        y -= r["alto_logo"]
+        c.drawImage(r["logo"], izq, y, width=r["ancho_util"], height=r["alto_logo"],
+                    preserveAspectRatio=True, anchor="c", mask="auto")
+    c.setFont(negrita, 10)
+    y -= INTERLINEA
+    c.drawCentredString(centro, y, cabecera[0])
+    c.setFont(fuente, 7)
+    for texto in cabecera[1:]:
+        y -= INTERLINEA
+        c.drawCentredString(centro, y, texto)
+    y -= INTERLINEA / 2
+    c.line(izq, y, der, y)
+
+    # Cliente y recogida
+    if isinstance(hora, datetime):
+        hora_str = hora.strftime("%d/%m/%Y %H:%M")
+    else:
+        hora_str = str(hora) if hora else "No indicada"
+    c.setFont(fuente, 8)
+    y -= INTERLINEA
+    c.drawString(izq, y, f"Cliente: {nombre}")
+    y -= INTERLINEA
+    c.drawString(izq, y, f"Recogida: {hora_str}")
+    y -= INTERLINEA / 2
+    c.line(izq, y, der, y)
+
+    # Productos: nombre en una línea, cantidad x precio = subtotal en la siguiente
+    if not lineas:
+        y -= INTERLINEA
+        c.drawString(izq, y, "(Sin productos)")
+    for producto, cantidad, unidad, precio, subtotal in lineas:
+        y -= INTERLINEA
+        c.setFont(fuente, 8)
+        c.drawString(izq, y, _recortar(producto.capitalize(), fuente, 8, r["ancho_util"]))
+        y -= INTERLINEA
+        c.setFont(fuente, 7)
+        if unidad == "kg":
+            detalle = f"{cantidad:.3f}".rstrip("0").rstrip(".") + " kg"
+        else:
+            detalle = f"{int(cantidad)} u"
+        if precio is None:
+            c.drawString(izq + 3 * mm, y, detalle)
+            c.drawRightString(der, y, "sin precio")
+            continue
+        c.drawString(izq + 3 * mm, y, f"{detalle} x {precio:.2f} €/{unidad}")
+        c.drawRightString(der, y, f"{subtotal:.2f} €")
+
+    y -= INTERLINEA / 2
+    c.line(izq, y, der, y)
+    y -= INTERLINEA
+    c.setFont(negrita, 10)
+    c.drawString(izq, y, "TOTAL")
+    c.drawRightString(der, y, f"{total:.2f} €")
+    y -= INTERLINEA * 1.5
+    c.setFont(fuente, 7)
+    c.drawCentredString(centro, y, "¡Gracias por su compra!")
+
+    c.showPage()
+    c.save()
+    return buf.getvalue()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Varias carnicerías en el mismo despliegue, elegidas por el número de Twilio al
+que escribe el cliente (campo `To` del webhook).
+
+Cada Tienda tiene su catálogo, sus sinónimos y su espacio de sesiones, y su
+clave (el número normalizado; "" para la tienda por defecto) separa todo lo
+demás: pedidos del libro, capacidad de las franjas, hoja de producción,
+frecuencias del autocompletado y sinónimos aprendidos. Opcionalmente también
+tiene su correo de destino, su impresora y la cabecera del ticket.
+
+Lo que es igual entre tiendas se comparte en lugar de copiarse:
+  - los nombres de producto, categorías y sus formas normalizadas se internan
+    (sys.intern), así "pollo entero" es el mismo objeto en todas las tiendas
+  - dos tiendas con el mismo contenido de catálogo comparten el mismo Catalogo
+    (diccionarios, índice normalizado y páginas de fragmentos)
+  - las tiendas con el catálogo por defecto y sin sinónimos propios usan el
+    diccionario SYNONYMS común
+Así la memoria crece con los productos distintos, no con el número de tiendas.
+
+Configuración: TIENDAS apunta a un JSON
+    {
+      "whatsapp:+34911111111": {"nombre": "Carnicería Aranda",
+                                "excel": "productos_aranda.xlsx",
+                                "sinonimos": {"chuleton": "Super chuletón de vaca gallega madurada (1kg aprox)"},
+                                "email": "pedidos@aranda.example",
+                                "impresora": "tcp://192.168.1.60:9100",
+                                "cabecera": ["CARNICERÍA ARANDA", "Lunes a Sábado 9:00-14:00 y 17:00-20:00"]}
+    }
+Sin "email" / "impresora" se usan EMAIL_DESTINO / IMPRESORA_DISPOSITIVO; sin
+"cabecera", el nombre de la tienda en mayúsculas y el horario.
+Los números que no estén en el fichero (o sin TIENDAS) van a la tienda por
+defecto, que usa los globales de data.py / expresiones.py como hasta ahora.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+
+from data import IDS_PRODUCTO, PRECIOS_DB, PRODUCTOS_DB, PRODUCTOS_ID, _leer_excel, _precio
+from expresiones import INDEX_NORMALIZADO, SYNONYMS, _normalize, resolver_sinonimos
+from fragmentos import FRAGMENTOS, construir_fragmentos
+
+HORARIO_TICKET = "Lunes a Sábado 9:00-14:00 y 17:00-20:00"
+
+
+class Catalogo:
+    """Datos de catálogo de solo lectura; compartido por todas las tiendas con el mismo Excel."""
+
+    __slots__ = ("productos_db", "precios_db", "productos_id", "ids_producto",
+                 "index_normalizado", "fragmentos")
+
+    def __init__(self, productos_db, precios_db, productos_id, ids_producto, index_normalizado, fragmentos):
+        self.productos_db = productos_db
+        self.precios_db = precios_db
+        self.productos_id = productos_id
+        self.ids_producto = ids_producto
+        self.index_normalizado = index_normalizado
+        self.fragmentos = fragmentos
+
+
+class Tienda:
+    def __init__(self, clave: str, nombre: str, catalogo: Catalogo, synonyms: dict, sessions: dict | None = None,
+                 email: str | None = None, impresora: str | None = None, cabecera: tuple | None = None):
+        self.clave = clave
+        self.nombre = nombre
+        self.catalogo = catalogo
+        self.synonyms = synonyms
+        self.sessions = {} if sessions is None else sessions
+        self.email = email            # None: EMAIL_DESTINO
+        self.impresora = impresora    # None: IMPRESORA_DISPOSITIVO
+        self.cabecera = cabecera      # None: la cabecera por defecto del ticket
+
+    # accesos directos a lo más usado por el flujo de conversación
+    @property
+    def productos_db(self) -> dict:
+        return self.catalogo.productos_db
+
+    @property
+    def precios_db(self) -> dict:
+        return self.catalogo.precios_db
+
+    @property
+    def fragmentos(self) -> dict:
+        return self.catalogo.fragmentos
+
+    def __repr__(self):
+        return f"Tienda({self.clave!r}, {self.nombre!r}, {len(self.productos_db)} productos)"
+
+
+# --- Internado ---
+# Tablas a nivel de módulo: viven mientras el proceso, igual que los catálogos.
+_NORMALIZADOS = {}   # nombre internado -> forma normalizada internada
+_PRECIOS = {}        # (kg, u) -> dict de precios compartido
+_CATALOGOS = {}      # huella del contenido -> Catalogo
+_LOCK = threading.Lock()
+
+
+def _s(texto: str) -> str:
+    return sys.intern(str(texto).lower().strip())
+
+
+def _normalizado(nombre: str) -> str:
+    norm = _NORMALIZADOS.get(nombre)
+    if norm is None:
+        norm = _NORMALIZADOS[nombre] = sys.intern(_normalize(nombre))
+    return norm
+
+
+def _precios(kg, u) -> dict:
+    clave = (kg, u)
+    precios = _PRECIOS.get(clave)
+    if precios is None:
+        precios = _PRECIOS[clave] = {"kg": kg, "u": u}
+    return precios
+
+
+def _catalogo_compartido(filas: list[tuple]) -> Catalogo:
+    """
+    filas: [(id, nombre, categoria, precio_kg, precio_u)] ya internadas.
+    Devuelve el Catalogo existente si otra tienda tiene exactamente las mismas filas.
+    """
+    huella = tuple(filas)
+    with _LOCK:
+        catalogo = _CATALOGOS.get(huella)
+        if catalogo is not None:
+            return catalogo
+        productos_db = {nombre: categoria for _, nombre, categoria, _, _ in filas}
+        precios_db = {nombre: _precios(kg, u) for _, nombre, _, kg, u in filas}
+        productos_id = {i: nombre for i, nombre, _, _, _ in filas}
+        ids_producto = {nombre: i for i, nombre in productos_id.items()}
+        index_normalizado = {_normalizado(nombre): nombre for nombre in productos_db}
+        catalogo = _CATALOGOS[huella] = Catalogo(
+            productos_db, precios_db, productos_id, ids_producto, index_normalizado,
+            construir_fragmentos(productos_db),
+        )
+        return catalogo
+
+
+def _filas(ruta_excel: str) -> list[tuple]:
+    """Filas internadas de un Excel con el mismo formato que productos_aranda.xlsx (ver data.py)."""
+    df = _leer_excel(ruta_excel)
+    filas = []
+    for _, row in df.iterrows():
+        catalogo = _precio(row.get("Precio normal (ant)"))
+        kg = _precio(row.get("Precio/Kg"))
+        u = _precio(row.get("Precio unit"))
+        filas.append((
+            int(row["ID"]),
+            _s(row["Nombre"]),
+            _s(row["Categorías"]),
+            kg if kg is not None else (catalogo or 0.0),
+            u if u is not None else (catalogo or 0.0),
+        ))
+    return filas
+
+
+def cargar_catalogo(ruta_excel: str) -> Catalogo:
+    return _catalogo_compartido(_filas(ruta_excel))
+
+
+def _sinonimos(propios: dict | None, catalogo: Catalogo) -> dict:
+    """Sinónimos comunes más los de la tienda, con destinos traducidos a claves de su catálogo."""
+    if not propios and catalogo.index_normalizado is INDEX_NORMALIZADO:
+        return SYNONYMS
+    propios = {sys.intern(k.lower().strip()): v for k, v in (propios or {}).items()}
+    return resolver_sinonimos({**SYNONYMS, **propios}, catalogo.index_normalizado)
+
+
+def clave_numero(numero: str | None) -> str:
+    """'whatsapp:+34 911 111 111' -> '+34911111111'."""
+    numero = (numero or "").strip()
+    if numero.lower().startswith("whatsapp:"):
+        numero = numero.split(":", 1)[1]
+    return "".join(numero.split())
+
+
+def _tienda_por_defecto() -> Tienda:
+    """
+    Reutiliza los globales ya cargados (mismos objetos que usa el resto del
+    código) y los registra como catálogo compartido de productos_aranda.xlsx.
+    """
+    for nombre, categoria in PRODUCTOS_DB.items():
+        # internar los objetos existentes: las demás tiendas recibirán estos mismos
+        _NORMALIZADOS[sys.intern(nombre)] = sys.intern(_normalize(nombre))
+        sys.intern(categoria)
+    catalogo = Catalogo(PRODUCTOS_DB, PRECIOS_DB, PRODUCTOS_ID, IDS_PRODUCTO, INDEX_NORMALIZADO, FRAGMENTOS)
+    try:
+        _CATALOGOS[tuple(_filas("productos_aranda.xlsx"))] = catalogo
+    except Exception:
+        logging.exception("No se pudo registrar el catálogo por defecto como compartido")
+    return Tienda("", "Carnicería", catalogo, SYNONYMS)
+
+
+TIENDA_POR_DEFECTO = _tienda_por_defecto()
+
+_TIENDAS = None
+_TIENDAS_LOCK = threading.Lock()
+
+
+def cargar_tiendas(ruta: str) -> dict[str, Tienda]:
+    with open(ruta, encoding="utf-8") as f:
+        config = json.load(f)
+    tiendas = {}
+    for numero, datos in config.items():
+        clave = clave_numero(numero)
+        nombre = datos.get("nombre", clave)
+        catalogo = cargar_catalogo(datos.get("excel", "productos_aranda.xlsx"))
+        tiendas[clave] = Tienda(
+            clave,
+            nombre,
+            catalogo,
+            _sinonimos(datos.get("sinonimos"), catalogo),
+            email=datos.get("email"),
+            impresora=datos.get("impresora"),
+            cabecera=tuple(datos.get("cabecera") or (nombre.upper(), HORARIO_TICKET)),
+        )
+    return tiendas
+
+
+def tiendas() -> dict[str, Tienda]:
+    global _TIENDAS
+    if _TIENDAS is None:
+        with _TIENDAS_LOCK:
+            if _TIENDAS is None:
+                ruta = os.getenv("TIENDAS")
+                cargadas = {}
+                if ruta:
+                    try:
+                        cargadas = cargar_tiendas(ruta)
+                    except Exception:
+                        logging.exception("No se pudo cargar la configuración de tiendas (%s)", ruta)
+                _TIENDAS = cargadas
+    return _TIENDAS
+
+
+def obtener_tienda(numero: str | None = None) -> Tienda:
+    """Tienda a la que pertenece el número de destino (To); la de por defecto si no se conoce."""
+    if not numero:
+        return TIENDA_POR_DEFECTO
+    return tiendas().get(clave_numero(numero), TIENDA_POR_DEFECTO)
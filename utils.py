@@ -1,26 +1,35 @@
 # -*- coding: utf-8 -*-
 import logging
 import re
+import time
 from datetime import datetime, timedelta
-from rapidfuzz import process
+from functools import lru_cache
 
 from printer import send_to_printer
-from data import PRODUCTOS_DB
+from pedidos import registrar_pedido
+from recordatorios import programar_recordatorio, remitente_tienda
+from franjas import obtener_agenda
+from fragmentos import LIMITE_MENSAJE, _paginar, respuesta_catalogo, texto
 
 # >>> NUEVO: utilidades de expresiones (no cambian la lógica, solo amplían la comprensión)
-from expresiones import normalizar_fecha_texto, extraer_productos_desde_texto, _buscar_producto_fuzzy, _canonicalizar_producto
+from expresiones import normalizar_fecha_texto, extraer_productos_desde_texto, _buscar_producto_fuzzy, _canonicalizar_producto, _NUM_TXT, sugerencias_producto
 # <<<
-
-SESSIONS = {}
-
-def formatear_item_simple(prod: str, cantidad: float, unidad: str) -> str:
-    """Formatea una sola línea (p.ej. al añadir): respeta kg vs unidades."""
+from intenciones import detectar_intencion
+from tiendas import TIENDA_POR_DEFECTO, obtener_tienda
+from sinonimos import obtener_sinonimos_aprendidos
+from captura import obtener_captura
+from ejecutor import resolver_productos
+from perfiles import carrito_desde_ids, guardar_perfil, obtener_perfiles
+
+# Sesiones de la tienda por defecto (cada Tienda tiene su propio diccionario)
+SESSIONS = TIENDA_POR_DEFECTO.sessions
+
+def _cantidad_texto(cantidad: float, unidad: str) -> str:
+    """Cantidad en el formato de todas las respuestas: kg con hasta 3 decimales, unidades enteras."""
     if unidad == "kg":
-        cantidad_fmt = f"{cantidad:.2f}".rstrip("0").rstrip(".")
-        return f"{prod.capitalize()}: {cantidad_fmt} kg"
-    else:
-        unidades = int(round(cantidad))
-        return f"{prod.capitalize()}: {unidades} unidad{'es' if unidades != 1 else ''}"
+        return f"{cantidad:.3f}".rstrip("0").rstrip(".") + " kg"
+    unidades = int(round(cantidad))
+    return f"{unidades} unidad{'es' if unidades != 1 else ''}"
 
 
 def formatear_item(prod: str, cantidades: dict) -> str:
@@ -32,10 +41,9 @@ def formatear_item(prod: str, cantidades: dict) -> str:
     kg = float(cantidades.get("kg", 0.0))
     u = int(cantidades.get("u", 0))
     if kg > 0:
-        kg_str = f"{kg:.2f}".rstrip("0").rstrip(".")
-        partes.append(f"{kg_str} kg")
+        partes.append(_cantidad_texto(kg, "kg"))
     if u > 0:
-        partes.append(f"{u} unidad{'es' if u != 1 else ''}")
+        partes.append(_cantidad_texto(u, "u"))
     if not partes:
         partes.append("0")
     return f"{prod.capitalize()}: " + " + ".join(partes)
@@ -53,16 +61,76 @@ def agregar_item_carrito(session, prod: str, cantidad: float, unidad: str):
         entry["u"] = int(entry["u"] + int(round(cantidad)))
 
 
-def mostrar_carrito(session):
-    if not session["carrito"]:
-        return "Carrito vacío."
+@lru_cache(maxsize=4096)
+def _linea_carrito(prod: str, kg: float, u: int) -> str:
+    """Línea ya renderizada: solo se vuelve a formatear la del producto que cambia."""
+    return "• " + formatear_item(prod, {"kg": kg, "u": u})
+
+
+def lineas_carrito(session) -> list[str]:
     lineas = []
-    for prod, cantidades in session["carrito"].items():
+    for prod, cantidades in session.get("carrito", {}).items():
         # Retrocompatibilidad: si fuese un número suelto antiguo, lo tratamos como kg
         if not isinstance(cantidades, dict):
             cantidades = {"kg": float(cantidades), "u": 0}
-        lineas.append("• " + formatear_item(prod, cantidades))
-    return "\n".join(lineas)
+        lineas.append(_linea_carrito(prod, float(cantidades.get("kg", 0.0)), int(cantidades.get("u", 0))))
+    return lineas
+
+
+def mostrar_carrito(session):
+    if not session["carrito"]:
+        return "Carrito vacío."
+    return "\n".join(lineas_carrito(session))
+
+
+def paginas_carrito(session, limite: int = LIMITE_MENSAJE - 250) -> list[str]:
+    """El carrito en mensajes de como mucho `limite` caracteres ('ver carrito 2' para la siguiente)."""
+    return _paginar("Tu carrito", lineas_carrito(session) or ["Carrito vacío."], "ver carrito", limite)
+
+
+def formatear_cambio(signo: str, prod: str, cantidad: float | None, unidad: str, session) -> str:
+    """
+    Línea de diferencia: "+ 2 kg Pollo entero", "− Pollo entero (todo)".
+    Si el producto sigue en el carrito con otra cantidad, se añade el total.
+    """
+    if cantidad is None:
+        return f"{signo} {prod.capitalize()} (todo)"
+    linea = f"{signo} {_cantidad_texto(cantidad, unidad)} {prod.capitalize()}"
+    actual = session.get("carrito", {}).get(prod)
+    if isinstance(actual, dict):
+        otra = "u" if unidad == "kg" else "kg"
+        if actual.get(otra) or abs(float(actual.get(unidad, 0)) - cantidad) > 1e-9:
+            linea += f" (total: {formatear_item(prod, actual).split(': ', 1)[1]})"
+    return linea
+
+
+# Hasta este número de productos se enseña el carrito entero tras cada cambio;
+# con más, solo el cambio y el recuento (los mensajes no crecen con el pedido).
+CARRITO_DETALLE_MAX = 5
+# Opciones numeradas como mucho al preguntar por un producto ambiguo
+OPCIONES_MAX = 8
+
+
+def estado_carrito(session) -> str:
+    n = len(session.get("carrito", {}))
+    if n <= CARRITO_DETALLE_MAX:
+        return f"Carrito actual:\n{mostrar_carrito(session)}"
+    return f"🛒 {n} productos en el carrito. Escribe 'ver carrito' para verlo entero."
+
+
+def _carrito_recortado(session, limite: int) -> str:
+    """El carrito en un solo mensaje: si no cabe, las primeras líneas y cuántas faltan."""
+    lineas = lineas_carrito(session)
+    texto_completo = "\n".join(lineas)
+    if len(texto_completo) <= limite:
+        return texto_completo
+    mostradas, largo = [], 0
+    for linea in lineas:
+        if largo + len(linea) + 1 > limite - 40:
+            break
+        mostradas.append(linea)
+        largo += len(linea) + 1
+    return "\n".join(mostradas) + f"\n… y {len(lineas) - len(mostradas)} productos más."
 
 def formatear_fecha(dt):
     """Devuelve fecha en formato 'martes 13 de agosto - 15:00' (siempre en español)."""
@@ -76,14 +144,25 @@ def formatear_fecha(dt):
     except Exception:
         return f"{dt.day:02d}/{dt.month:02d}/{dt.year} {dt.strftime('%H:%M')}"
 
+def _respuesta_franja_no_disponible(agenda, fecha, alternativas):
+    """Respuesta del paso 2 cuando la hora pedida está fuera de horario o completa."""
+    if agenda.ordinal(fecha) is None:
+        motivo = f"A esa hora ({formatear_fecha(fecha)}) la tienda está cerrada.\n" + texto("horario")
+    else:
+        motivo = f"Lo sentimos, la franja de *{formatear_fecha(fecha)}* ya está completa."
+    opciones = "\n".join(f"{i}. {formatear_fecha(dt)}" for i, dt in enumerate(alternativas, 1))
+    return (f"{motivo}\n"
+            f"Huecos libres más cercanos:\n{opciones}\n"
+            "Responde con el número de la opción o indica otro día y hora.")
+
 # Mapa de tramos del día a hora por defecto
 PERIODOS = {
     "mañana": (9, 0),
     "manana": (9, 0),      # sin tilde
     "mediodia": (13, 0),
     "mediodía": (13, 0),
-    "tarde": (16, 0),
-    "noche": (20, 0),
+    "tarde": (17, 0),      # dentro del horario (franjas.HORARIO: 9-14 y 17-20)
+    "noche": (19, 30),     # última franja del día
 }
 
 def _proxima_semana(dow_target, hora, minuto):
@@ -306,7 +385,421 @@ def extraer_nombre(raw_text: str) -> str:
     nombre = " ".join(p.capitalize() for p in palabras)
     return nombre if nombre else "Cliente"
 
+def _opciones_planas(x, opciones=None) -> list[str]:
+    """Aplana el resultado de _canonicalizar_producto (str / listas anidadas) en una lista de strings."""
+    if opciones is None:
+        opciones = []
+    if x is None:
+        return opciones
+    if isinstance(x, str):
+        opciones.append(x)
+    elif isinstance(x, (list, tuple)):
+        for e in x:
+            _opciones_planas(e, opciones)
+    else:
+        opciones.append(str(x))
+    return opciones
+
+
+def _cantidad_num(cantidad) -> float:
+    try:
+        return float(cantidad)
+    except Exception:
+        return float(_NUM_TXT.get(str(cantidad).strip().lower(), 0))
+
+
+# --- Manejadores: (tienda, user_id, session, raw_message, msg) -> respuesta | None ---
+# Si un manejador devuelve None se usa el manejador por defecto del paso.
+
+def _iniciar_pedido(tienda, user_id, session, raw_message, msg):
+    session.clear()
+    session.update({"modo": "pedido", "paso": 1, "carrito": {}, "msg_count": 0})
+    return texto("inicio_pedido")
+
+
+def _ver_catalogo(tienda, user_id, session, raw_message, msg):
+    # --- CATÁLOGO (cualquier paso): páginas ya renderizadas ---
+    return respuesta_catalogo(msg, tienda.fragmentos)
+
+
+def _volver_atras(tienda, user_id, session, raw_message, msg):
+    if session["paso"] == 2:
+        session.pop("nombre", None)
+        session["paso"] = 1
+        return "Has vuelto atrás ↩️. Vamos de nuevo.\n¿Cuál es tu nombre?"
+    elif session["paso"] == 3:
+        session.pop("hora", None)
+        session["paso"] = 2
+        return "Has vuelto atrás ↩️. " + texto("pedir_fecha")
+    elif session["paso"] == 4:
+        session["paso"] = 3
+        return f"Has vuelto atrás ↩️. {estado_carrito(session)}\nDime si quieres añadir o quitar algo."
+    return "No puedes retroceder más, estamos al inicio del pedido."
+
+
+def _modo_libre(tienda, user_id, session, raw_message, msg):
+    session["msg_count"] += 1
+    if session["msg_count"] == 1:
+        return texto("bienvenida")
+    elif session["msg_count"] % 3 == 0:
+        return texto("recordatorio")
+    return "No entendí tu mensaje 🤔."
+
+
+def _paso1_nombre(tienda, user_id, session, raw_message, msg):
+    session["nombre"] = extraer_nombre(raw_message)
+    if session.get("hora"):
+        # la hora ya llegó por la API estructurada (carrito.py)
+        session["paso"] = 3
+        return (f"Perfecto, {session['nombre']} 😊. Tu pedido es para *{formatear_fecha(session['hora'])}*.\n\n"
+                + texto("instrucciones_productos"))
+    session["paso"] = 2
+    return ("Perfecto, {nombre} 😊. ¿Cuándo pasarás a recoger tu pedido?\n"
+            ).format(nombre=session["nombre"])
+
+
+def _paso2_fecha(tienda, user_id, session, raw_message, msg):
+    try:
+        # Elegir una de las franjas libres ofrecidas ("1", "2", "3")
+        alternativas = session.get("alternativas") or []
+        if msg.isdigit() and 1 <= int(msg) <= len(alternativas):
+            fecha = alternativas[int(msg) - 1]
+        else:
+            fecha = parse_dia_hora(msg)
+
+        agenda = obtener_agenda(tienda.clave)
+        if not agenda.disponible(fecha):
+            session["alternativas"] = agenda.mas_cercanas(fecha)
+            return _respuesta_franja_no_disponible(agenda, fecha, session["alternativas"])
+
+        session.pop("alternativas", None)
+        session["hora"] = fecha  # guardamos datetime completo
+        session["paso"] = 3
+        if session["carrito"]:
+            # carrito repuesto con 'repetir último pedido'
+            return (f"Perfecto. Programado para *{formatear_fecha(session['hora'])}*.\n"
+                    f"{estado_carrito(session)}\n" + texto("repetir_siguiente"))
+        return (
+            f"Perfecto. Programado para *{formatear_fecha(session['hora'])}*.\n\n"
+            + texto("instrucciones_productos")
+        )
+    except ValueError as e:
+        return f"{str(e)}\n" + texto("ayuda_fecha")
+
+
+def _elegir_opcion_pendiente(tienda, user_id, session, raw_message, msg):
+    """Respuesta "2" a una pregunta de ambigüedad: añade esa opción con la cantidad pedida."""
+    pendientes = session.get("pendiente_ambiguo") or []
+    if len(pendientes) != 1 or not msg.isdigit():
+        return None
+    pendiente = pendientes[0]
+    if not 1 <= int(msg) <= len(pendiente["opciones"]):
+        return None
+    session.pop("pendiente_ambiguo")
+    prod_real = pendiente["opciones"][int(msg) - 1]
+    obtener_sinonimos_aprendidos(tienda.clave).registrar(pendiente["texto"], prod_real, user_id)
+    agregar_item_carrito(session, prod_real, pendiente["cantidad"], pendiente["unidad"])
+    return (f"Producto añadido:\n"
+            f"{formatear_cambio('+', prod_real, pendiente['cantidad'], pendiente['unidad'], session)}\n"
+            f"{estado_carrito(session)}")
+
+
+def _paso3_productos(tienda, user_id, session, raw_message, msg):
+    elegida = _elegir_opcion_pendiente(tienda, user_id, session, raw_message, msg)
+    if elegida is not None:
+        return elegida
+    # opciones ofrecidas en el mensaje anterior: si ahora se pide una de ellas, se aprende
+    pendientes = session.pop("pendiente_ambiguo", None) or []
+    aprendidos = obtener_sinonimos_aprendidos(tienda.clave)
+
+    # 🔹 Extraer y canonicalizar productos del mensaje (listas largas: en el pool de ejecutor.py)
+    encontrados = resolver_productos(msg, tienda)  # [(prod_crudo, cantidad, unidad, prod_real), ...]
+
+    # Acumuladores para respuesta compuesta
+    añadidos = []          # [(producto, cantidad, unidad), ...] añadidos
+    ambiguos = []          # [(prod_crudo, opciones_list), ...]
+    no_encontrados = []    # [(prod_crudo, sugerencias_list), ...]
+
+    for prod, cantidad, unidad, prod_real in encontrados:
+        # Caso 1: coincidencia clara
+        if isinstance(prod_real, str):
+            for pendiente in pendientes:
+                if prod_real in pendiente["opciones"]:
+                    aprendidos.registrar(pendiente["texto"], prod_real, user_id)
+            cantidad_num = _cantidad_num(cantidad)
+            agregar_item_carrito(session, prod_real, cantidad_num, unidad)
+            añadidos.append((prod_real, cantidad_num, unidad))
+
+        # Caso 2: ambigüedad -> devolver opciones al final
+        elif isinstance(prod_real, list):
+            opciones = [o for o in _opciones_planas(prod_real) if o]
+            if opciones:
+                ambiguos.append((prod, opciones, cantidad, unidad))
+            else:
+                sugerencias = sugerencias_producto(prod, tienda.productos_db)
+                no_encontrados.append((prod, sugerencias))
+
+        # Caso 3: no encontrado -> sugerencias fuzzy
+        else:
+            sugerencias = sugerencias_producto(prod, tienda.productos_db)
+            no_encontrados.append((prod, sugerencias))
+
+    # Construir respuesta compuesta si hubo actividad de añadir
+    partes = []
+
+    if añadidos:
+        # solo lo que cambia ("+ 2 kg Pollo entero"); el carrito entero si es corto
+        cambios = "\n".join(formatear_cambio("+", *a, session) for a in añadidos)
+        titulo = "Productos añadidos" if len(añadidos) > 1 else "Producto añadido"
+        partes.append(f"{titulo}:\n{cambios}\n{estado_carrito(session)}")
+
+    # Ambigüedades: se guardan para aprender la elección del siguiente mensaje
+    for prod_crudo, opciones, cantidad, unidad in ambiguos:
+        opciones_unicas = list(dict.fromkeys(opciones))  # elimina duplicados
+        if opciones_unicas and not all(o.lower() == "otros" for o in opciones_unicas):
+            # una palabra suelta ("de") puede casar con medio catálogo: se ofrecen las primeras
+            sobran = len(opciones_unicas) - OPCIONES_MAX
+            opciones_unicas = opciones_unicas[:OPCIONES_MAX]
+            session.setdefault("pendiente_ambiguo", []).append({
+                "texto": prod_crudo, "opciones": opciones_unicas,
+                "cantidad": _cantidad_num(cantidad), "unidad": unidad,
+            })
+            sugerencias_formateadas = "\n".join(f"{i}. {s}" for i, s in enumerate(opciones_unicas, 1))
+            if sobran > 0:
+                sugerencias_formateadas += f"\n(y {sobran} más: escribe el nombre más completo)"
+            partes.append(f"No estoy seguro sobre '{prod_crudo}'. ¿Te refieres a alguno de estos?:\n{sugerencias_formateadas}")
+        else:
+            partes.append(f"No he encontrado nada parecido a '{prod_crudo}'.")
+    if len(session.get("pendiente_ambiguo", [])) == 1:
+        partes.append("Responde con el número de la opción o escribe el producto.")
+
+    # Productos no encontrados
+    for prod_crudo, sugest in no_encontrados:
+        sugest_unicas = list(dict.fromkeys(sugest or []))  # eliminar duplicados
+        if sugest_unicas and not all(s.lower() == "otros" for s in sugest_unicas):
+            sugerencias_formateadas = "\n".join(f"· {s}" for s in sugest_unicas)
+            partes.append(f"No encontré en el catálogo '{prod_crudo}'. ¿Quizás quisiste decir:\n{sugerencias_formateadas}\n?")
+        else:
+            partes.append(f"No he encontrado nada parecido a '{prod_crudo}'.")
+
+    if partes:
+        return "\n".join(partes)
+
+    return "Formato no válido, indica una cantidad. Ejemplo: '2 kilos de pollo entero' o '2 hamburguesas de pollo'."
+
+
+def _paso3_eliminar(tienda, user_id, session, raw_message, msg):
+    # >>> Manejar eliminar productos (soporta varios items en la misma frase)
+    texto_eliminar = re.sub(r"^(eliminar|elimina|quitar|quita|borrar|borra)\s*", "", msg).strip()
+    items_a_eliminar = extraer_productos_desde_texto(texto_eliminar, tienda.productos_db)
+    if not items_a_eliminar:
+        # "eliminar pollo entero" sin cantidad -> quitar el producto entero
+        items_a_eliminar = [(seg, 0, "kg") for seg in re.split(r"\s*(?:,|;|\by\b)\s*", texto_eliminar) if seg]
+
+    if not items_a_eliminar:
+        return "No entendí qué producto quieres eliminar."
+
+    eliminados_ok = []        # productos eliminados
+    not_in_cart = []          # productos que no estaban en carrito
+    ambiguos_elim = []        # productos ambiguos
+    no_encontrados_elim = []  # productos no encontrados
+
+    for prod, cantidad, unidad in items_a_eliminar:
+        if isinstance(prod, (list, tuple)):
+            prod = " ".join(str(x) for x in prod)
+
+        prod_real = _canonicalizar_producto(prod, tienda.productos_db, synonyms=tienda.synonyms,
+                                            aprendidos=obtener_sinonimos_aprendidos(tienda.clave).promovidos())
+
+        # Ambigüedad -> sugerir
+        if isinstance(prod_real, list):
+            ambiguos_elim.append((prod, [o for o in _opciones_planas(prod_real) if o]))
+            continue
+
+        # No encontrado
+        if not prod_real:
+            sugerencias = sugerencias_producto(prod, tienda.productos_db)
+            no_encontrados_elim.append((prod, sugerencias))
+            continue
+
+        if prod_real not in session.get("carrito", {}):
+            not_in_cart.append(prod_real)
+            continue
+
+        cantidad_num = _cantidad_num(cantidad)
+        entry = session["carrito"][prod_real]
+        # Retrocompatibilidad: si fuese un número suelto antiguo, lo tratamos como kg
+        if not isinstance(entry, dict):
+            entry = session["carrito"][prod_real] = {"kg": float(entry), "u": 0}
+        actual = entry.get(unidad, 0)
+
+        if cantidad_num <= 0 or actual <= 0:
+            # sin cantidad o en otra unidad -> fuera el producto entero
+            session["carrito"].pop(prod_real, None)
+            eliminados_ok.append((prod_real, None, unidad))
+        elif cantidad_num >= actual:
+            entry[unidad] = 0.0 if unidad == "kg" else 0
+            if not entry.get("kg") and not entry.get("u"):
+                session["carrito"].pop(prod_real, None)
+                eliminados_ok.append((prod_real, None, unidad))
+            else:
+                eliminados_ok.append((prod_real, actual, unidad))
+        else:
+            if unidad == "kg":
+                entry["kg"] = round(actual - cantidad_num, 3)
+            else:
+                entry["u"] = int(actual - int(round(cantidad_num)))
+            eliminados_ok.append((prod_real, cantidad_num, unidad))
+
+    partes_del = []
+    if eliminados_ok:
+        cambios = "\n".join(formatear_cambio("−", *e, session) for e in eliminados_ok)
+        titulo = "Productos eliminados" if len(eliminados_ok) > 1 else "Producto eliminado"
+        partes_del.append(f"{titulo}:\n{cambios}\n{estado_carrito(session)}")
+    if not_in_cart:
+        partes_del.append(f"No tenías en el carrito: {', '.join(not_in_cart)}")
+    for prod, opciones in ambiguos_elim:
+        partes_del.append(f"No estoy seguro sobre '{prod}' al eliminar. ¿Te refieres a alguno de estos?: {', '.join(opciones)}")
+    for prod, sugest in no_encontrados_elim:
+        if sugest:
+            partes_del.append(f"No encontré '{prod}'. ¿Quizás quisiste decir: {', '.join(sugest)}?")
+        else:
+            partes_del.append(f"No he encontrado nada parecido a '{prod}'.")
+
+    return "\n".join(partes_del)
+
+
+def _paso3_listo(tienda, user_id, session, raw_message, msg):
+    if not session["carrito"]:
+        return "No has añadido ningún producto. Añade al menos uno antes de decir 'listo'."
+    # carrito empezado por la API (carrito.py): faltan datos que el chat pide en los pasos 1 y 2
+    if not session.get("nombre"):
+        session["paso"] = 1
+        return "Antes de terminar, ¿cuál es tu nombre?"
+    if not session.get("hora"):
+        session["paso"] = 2
+        return "Antes de terminar, ¿cuándo pasarás a recoger tu pedido?\n" + texto("pedir_fecha")
+    session["paso"] = 4
+    paginas = paginas_carrito(session)
+    if len(paginas) == 1:
+        carrito_formateado = mostrar_carrito(session)
+    else:
+        # pedido largo: primera página; 'ver carrito 2'... para el resto
+        carrito_formateado = f"({len(session['carrito'])} productos)\n{paginas[0]}"
+    return (f"Este es tu pedido para *{formatear_fecha(session['hora'])}*:\n"
+            f"{carrito_formateado}\n"
+            "Escribe 'confirmar' para finalizar o 'cancelar' para anular.")
+
+
+def _ver_carrito(tienda, user_id, session, raw_message, msg):
+    if session.get("modo") != "pedido":
+        return "No tienes ningún pedido en curso. " + texto("recordatorio")
+    m = re.search(r"(\d+)\s*$", msg)
+    paginas = paginas_carrito(session)
+    pagina = paginas[min(max(int(m.group(1)) if m else 1, 1), len(paginas)) - 1]
+    if session["paso"] == 4:
+        return pagina + "\nEscribe 'confirmar' para finalizar o 'cancelar' para anular."
+    return pagina
+
+
+def _repetir_pedido(tienda, user_id, session, raw_message, msg):
+    """Repone el carrito de un pedido anterior desde el perfil ('repetir último pedido', '... 2')."""
+    perfil = obtener_perfiles().perfil(user_id, tienda.clave)
+    if not perfil or not perfil["carritos"]:
+        return texto("repetir_sin_pedidos")
+    m = re.search(r"(\d+)\s*$", msg)
+    anterior = perfil["carritos"][min(max(int(m.group(1)) if m else 1, 1), len(perfil["carritos"])) - 1]
+    # IDs del catálogo -> nombres: sin extracción ni fuzzy
+    carrito, retirados = carrito_desde_ids(anterior["lineas"], tienda.catalogo.productos_id)
+    if not carrito:
+        return texto("repetir_retirados")
+    hora = session.get("hora") if session.get("modo") == "pedido" else None
+    session.clear()
+    session.update({"modo": "pedido", "carrito": carrito, "msg_count": 0})
+    session["nombre"] = perfil["nombre"] or "cliente"
+    aviso = f"\n⚠️ {retirados} producto(s) ya no están en el catálogo." if retirados else ""
+    if hora:
+        session["hora"] = hora
+        session["paso"] = 3
+        return (f"🔁 He repuesto tu pedido anterior:\n{estado_carrito(session)}{aviso}\n"
+                + texto("repetir_siguiente"))
+    session["paso"] = 2
+    return (f"🔁 ¡Hola de nuevo, {session['nombre']}! He preparado tu pedido anterior:\n"
+            f"{estado_carrito(session)}{aviso}\n¿Cuándo pasarás a recogerlo?")
+
+
+def _paso4_confirmar(tienda, user_id, session, raw_message, msg):
+    agenda = obtener_agenda(tienda.clave)
+    if not agenda.reservar(session["hora"]):
+        # la franja se ha llenado mientras se hacía el pedido
+        session["paso"] = 2
+        session["alternativas"] = agenda.mas_cercanas(session["hora"])
+        return _respuesta_franja_no_disponible(agenda, session["hora"], session["alternativas"])
+    resumen = (
+        f"✅ *Pedido confirmado*\n"
+        f"👤 Cliente: {session['nombre']}\n"
+        f"🕒 Hora: {formatear_fecha(session['hora'])}\n"
+        f"🛒 Carrito:\n{_carrito_recortado(session, LIMITE_MENSAJE - 250)}\n"
+    )
+    pedido_id = registrar_pedido(user_id, session, tienda.productos_db, tienda.clave)
+    # el aviso sale del número de la tienda por la que escribió el cliente
+    programar_recordatorio(pedido_id, user_id, session, remitente_tienda(tienda.clave, user_id))
+    guardar_perfil(user_id, tienda, session)
+    send_to_printer(user_id, session, tienda.precios_db, tienda)
+    tienda.sessions.pop(user_id, None)
+    return resumen
+
+
+def _cancelar(tienda, user_id, session, raw_message, msg):
+    tienda.sessions.pop(user_id, None)
+    return "Pedido cancelado ❌."
+
+
+def _paso4_otro(tienda, user_id, session, raw_message, msg):
+    return "Responde con 'confirmar' o 'cancelar'."
+
+
+# Tabla de despacho: (paso, intención) -> manejador.
+# paso 0 = modo libre; "*" = cualquier paso; intención None = mensaje sin comando.
+_DESPACHO = {
+    ("*", "iniciar"): _iniciar_pedido,
+    ("*", "ver"): _ver_catalogo,
+    ("*", "carrito"): _ver_carrito,
+    ("*", "repetir"): _repetir_pedido,
+    (0, None): _modo_libre,
+    (1, None): _paso1_nombre,
+    (2, None): _paso2_fecha,
+    (3, None): _paso3_productos,
+    (3, "eliminar"): _paso3_eliminar,
+    (3, "listo"): _paso3_listo,
+    (3, "confirmar"): _paso3_listo,
+    (4, "confirmar"): _paso4_confirmar,
+    (4, None): _paso4_otro,
+}
+for _paso in (1, 2, 3, 4):
+    _DESPACHO[(_paso, "volver")] = _volver_atras
+    _DESPACHO[(_paso, "cancelar")] = _cancelar
+
+
+def _manejador(paso, intencion):
+    return _DESPACHO.get((paso, intencion)) or _DESPACHO.get(("*", intencion))
+
+
 def process_message(data):
+    captura = obtener_captura()
+    if captura is None:
+        return _procesar(data)
+    # CAPTURA_DIR activo: se apunta cada mensaje para poder reproducirlo (benchmarks/replay.py)
+    info = {}
+    t0 = time.perf_counter()
+    respuesta = _procesar(data, info)
+    nombre = (info.get("session") or {}).get("nombre")
+    captura.registrar(data.get("user_id"), data.get("tienda"), data.get("message", ""), respuesta,
+                      info.get("paso"), info.get("intencion"), time.perf_counter() - t0, nombre)
+    return respuesta
+
+
+def _procesar(data, info=None):
     try:
         user_id = data.get("user_id")
         raw_message = data.get("message", "").strip()
@@ -315,299 +808,37 @@ def process_message(data):
         if not user_id:
             return "Error: usuario no identificado."
 
+        # Cada tienda (número de Twilio de destino) tiene su propio espacio de sesiones
+        tienda = obtener_tienda(data.get("tienda"))
+        sessions = tienda.sessions
+
         # Crear sesión si no existe
-        if user_id not in SESSIONS:
-            SESSIONS[user_id] = {
+        if user_id not in sessions:
+            sessions[user_id] = {
                 "modo": None,
                 "paso": 0,
                 "carrito": {},
                 "msg_count": 0
             }
 
-        session = SESSIONS[user_id]
-
-        # --- VOLVER ATRÁS ---
-        if "volver atras" in msg and session["modo"] == "pedido":
-            if session["paso"] > 1:
-                if session["paso"] == 2:
-                    session.pop("nombre", None)
-                    session["paso"] = 1
-                    return "Has vuelto atrás ↩️. Vamos de nuevo.\n¿Cuál es tu nombre?"
-                elif session["paso"] == 3:
-                    session.pop("hora", None)
-                    session["paso"] = 2
-                    return ("Has vuelto atrás ↩️. Por favor, indícanos el *día* y la *hora*.\n"
-                            "Ejemplos: 'martes a las 15:00', '13/08 15:00', 'mañana a las 12:30', 'este viernes a las 14', 'el 20 por la tarde', 'pasado mañana 10:00'.")
-                elif session["paso"] == 4:
-                    session["paso"] = 3
-                    return f"Has vuelto atrás ↩️. Lista actual:\n{mostrar_carrito(session)}\nDime si quieres añadir o quitar algo."
-            else:
-                return "No puedes retroceder más, estamos al inicio del pedido."
-            
-
-        # --- INICIAR PEDIDO ---
-        if "iniciar pedido" in msg:
-            session.clear()
-            session.update({"modo": "pedido", "paso": 1, "carrito": {}, "msg_count": 0})
-            return "Genial 👍. Vamos a empezar tu pedido.\n¿Cuál es tu nombre?"
-
-        # --- MODO LIBRE ---
-        if session["modo"] is None:
-            session["msg_count"] += 1
-            if session["msg_count"] == 1:
-                return (
-                    "Hola 😊. Bienvenido a la carnicería.\n"
-                    "⏰ *Horario*: Lunes a Sábado de 9:00 a 14:00 y de 17:00 a 20:00.\n"
-                    "Puedes escribirme lo que quieras y te atenderemos lo antes posible.\n"
-                    "Cuando quieras encargar algo, simplemente escribe *'iniciar pedido'*."
-                )
-            elif session["msg_count"] % 3 == 0:
-                return "Recuerda que para encargar algo debes escribir *'iniciar pedido'*."
-            
-
-        # --- MODO PEDIDO ---
-        if session["modo"] == "pedido":
-
-            # Paso 1: Nombre
-            if session["paso"] == 1:
-                session["nombre"] = extraer_nombre(raw_message)
-                session["paso"] = 2
-                return ("Perfecto, {nombre} 😊. ¿Cuándo pasarás a recoger tu pedido?\n"
-                        ).format(nombre=session["nombre"])
-
-            # Paso 2: Día y hora
-            if session["paso"] == 2:
-                try:
-                    fecha = parse_dia_hora(msg)
-                    session["hora"] = fecha  # guardamos datetime completo
-                    session["paso"] = 3
-
-                    # ✅ PRODUCTOS_DB es lista, no dict
-                    catalogo = "\n".join([f"- {prod}" for prod in PRODUCTOS_DB])
-                    return (
-                        f"Perfecto. Programado para *{formatear_fecha(session['hora'])}*.\n\n"
-                        "Dime qué quieres y la cantidad.\n"
-                        "Para eliminar un producto: 'eliminar pollo'.\n"
-                        "Cuando termines, escribe 'listo'."
-                    )
-                except ValueError as e:
-                    return (f"{str(e)}\n"
-                            "Por favor, indica *día y hora* con uno de estos formatos:\n"
-                            "• martes a las 15:00\n"
-                            "• 13/08 15:00\n"
-                            "• mañana a las 12:30\n"
-                            "• este viernes por la tarde\n")
-
-            # utils.py (ejemplo de flujo de añadir/eliminar productos al carrito)
-            if session["paso"] == 3:
-                # 🔹 Extraer productos del mensaje
-                encontrados = extraer_productos_desde_texto(msg, PRODUCTOS_DB)  # [(prod_crudo, cantidad, unidad), ...]
-
-                # Acumuladores para respuesta compuesta
-                añadidos = []          # strings formateados para confirmar adición
-                ambiguos = []          # [(prod_crudo, opciones_list), ...]
-                no_encontrados = []    # [(prod_crudo, sugerencias_list), ...]
-
-                if encontrados:
-                    for prod, cantidad, unidad in encontrados:
-                        if isinstance(prod, (list, tuple)):
-                            prod = " ".join(str(x) for x in prod)
-
-                        # 🔹 Canonicalización + normalización
-                        prod_real = _canonicalizar_producto(prod, PRODUCTOS_DB)
-
-                        # Caso 1: coincidencia clara
-                        if isinstance(prod_real, str):
-                            try:
-                                cantidad_num = float(cantidad)
-                            except Exception:
-                                cantidad_num = float(_NUM_TXT.get(str(cantidad).strip().lower(), 0))
-
-                            agregar_item_carrito(session, prod_real, cantidad_num, unidad)
-                            añadidos.append(formatear_item_simple(prod_real, cantidad_num, unidad))
-
-                        # Caso 2: ambigüedad -> devolver opciones al final
-                        elif isinstance(prod_real, list):
-                            opciones = []
-                            def _flatten(x):
-                                if x is None:
-                                    return
-                                if isinstance(x, str):
-                                    opciones.append(x)
-                                elif isinstance(x, (list, tuple)):
-                                    for e in x:
-                                        _flatten(e)
-                                else:
-                                    opciones.append(str(x))
-                            _flatten(prod_real)
-                            opciones = [o for o in opciones if o]
-                            if opciones:
-                                ambiguos.append((prod, opciones))
-                            else:
-                                sugerencias = [x[0] for x in process.extract(prod, PRODUCTOS_DB, limit=3)]
-                                no_encontrados.append((prod, sugerencias))
-
-                        # Caso 3: no encontrado -> sugerencias fuzzy
-                        else:
-                            sugerencias = [x[0] for x in process.extract(prod, PRODUCTOS_DB, limit=3)]
-                            no_encontrados.append((prod, sugerencias))
-
-                # Construir respuesta compuesta si hubo actividad de añadir
-                partes = []
-
-                if añadidos:
-                    partes.append(f"{', '.join(añadidos)} añadido(s).\nCarrito actual:\n{mostrar_carrito(session)}")
-
-                # Ambigüedades
-                for prod_crudo, opciones in ambiguos:
-                    opciones_unicas = list(dict.fromkeys(opciones))  # elimina duplicados
-                    if opciones_unicas and not all(o.lower() == "otros" for o in opciones_unicas):
-                        sugerencias_formateadas = "\n".join(f"· {s}" for s in opciones_unicas)
-                        partes.append(f"No estoy seguro sobre '{prod_crudo}'. ¿Te refieres a alguno de estos?:\n{sugerencias_formateadas}")
-                    else:
-                        partes.append(f"No he encontrado nada parecido a '{prod_crudo}'.")
-
-                # Productos no encontrados
-                for prod_crudo, sugest in no_encontrados:
-                    sugest_unicas = list(dict.fromkeys(sugest or []))  # eliminar duplicados
-                    if sugest_unicas and not all(s.lower() == "otros" for s in sugest_unicas):
-                        sugerencias_formateadas = "\n".join(f"· {s}" for s in sugest_unicas)
-                        partes.append(f"No encontré en el catálogo '{prod_crudo}'. ¿Quizás quisiste decir:\n{sugerencias_formateadas}\n?")
-                    else:
-                        partes.append(f"No he encontrado nada parecido a '{prod_crudo}'.")
-
-                if partes:
-                    return "\n".join(partes)
-
-
-                # >>> Manejar eliminar productos (soporta varios items en la misma frase)
-                if re.match(r"^(eliminar|elimina|quita|borra)\b", msg):
-                    texto_eliminar = re.sub(r"^(eliminar|elimina|quita|borra)\s+", "", msg).strip()
-                    items_a_eliminar = extraer_productos_desde_texto(texto_eliminar, PRODUCTOS_DB)
-
-                    if not items_a_eliminar:
-                        return "No entendí qué producto quieres eliminar."
-
-                    eliminados_ok = []        # productos eliminados
-                    not_in_cart = []          # productos que no estaban en carrito
-                    ambiguos_elim = []        # productos ambiguos
-                    no_encontrados_elim = []  # productos no encontrados
-
-                    for prod, cantidad, unidad in items_a_eliminar:
-                        if isinstance(prod, (list, tuple)):
-                            prod = " ".join(str(x) for x in prod)
-
-                        prod_real = _canonicalizar_producto(prod, PRODUCTOS_DB)
-
-                        # Ambigüedad -> sugerir
-                        if isinstance(prod_real, list):
-                            opciones = []
-                            def _flatten2(x):
-                                if x is None:
-                                    return
-                                if isinstance(x, str):
-                                    opciones.append(x)
-                                elif isinstance(x, (list, tuple)):
-                                    for e in x:
-                                        _flatten2(e)
-                                else:
-                                    opciones.append(str(x))
-                            _flatten2(prod_real)
-                            opciones = [o for o in opciones if o]
-                            ambiguos_elim.append((prod, opciones))
-                            continue
-
-                        # No encontrado
-                        if not prod_real:
-                            sugerencias = [x[0] for x in process.extract(prod, PRODUCTOS_DB, limit=3)]
-                            no_encontrados_elim.append((prod, sugerencias))
-                            continue
-
-                        if prod_real not in session.get("carrito", {}):
-                            not_in_cart.append(prod_real)
-                            continue
-
-                        try:
-                            cantidad_num = float(cantidad)
-                        except Exception:
-                            cantidad_num = float(_NUM_TXT.get(str(cantidad).strip().lower(), 0))
-
-                        current_qty, current_unit = session["carrito"][prod_real]
-
-                        try:
-                            current_qty = float(current_qty)
-                        except Exception:
-                            try:
-                                current_qty = float(str(current_qty).replace(",", "."))
-                            except Exception:
-                                current_qty = 0.0
-
-                        if current_unit != unidad:
-                            session["carrito"].pop(prod_real, None)
-                            eliminados_ok.append(f"{prod_real} (todo)")
-                        else:
-                            if cantidad_num <= 0 or cantidad_num >= current_qty:
-                                session["carrito"].pop(prod_real, None)
-                                eliminados_ok.append(f"{prod_real} (todo)")
-                            else:
-                                nueva = round(current_qty - cantidad_num, 3)
-                                session["carrito"][prod_real] = (nueva, current_unit)
-                                eliminados_ok.append(f"{prod_real} ({cantidad_num}{current_unit})")
-
-                    partes_del = []
-                    if eliminados_ok:
-                        partes_del.append(f"{', '.join(eliminados_ok)} eliminado(s) del carrito.\nCarrito actual:\n{mostrar_carrito(session)}")
-                    if not_in_cart:
-                        partes_del.append(f"No tenías en el carrito: {', '.join(not_in_cart)}")
-                    for prod, opciones in ambiguos_elim:
-                        partes_del.append(f"No estoy seguro sobre '{prod}' al eliminar. ¿Te refieres a alguno de estos?: {', '.join(opciones)}")
-                    for prod, sugest in no_encontrados_elim:
-                        if sugest:
-                            partes_del.append(f"No encontré '{prod}'. ¿Quizás quisiste decir: {', '.join(sugest)}?")
-                        else:
-                            partes_del.append(f"No he encontrado nada parecido a '{prod}'.")
-
-                    return "\n".join(partes_del)
-
-                # >>> Manejar "listo"
-                if msg == "listo" or "si" "ya esta" or "confirmar" or "ya está" or "ya":
-                    if not session["carrito"]:
-                        return "No te he entendido o no has añadido ningún producto. Añade al menos uno antes de decir 'listo'."
-                    session["paso"] = 4
-                    carrito_formateado = mostrar_carrito(session)
-                    return (f"Este es tu pedido para *{formatear_fecha(session['hora'])}*:\n"
-                            f"{carrito_formateado}\n"
-                            "Escribe 'confirmar' para finalizar o 'cancelar' para anular.")
-
-                return "Formato no válido, indica una cantidad. Ejemplo: '2 kilos de pollo entero' o '2 hamburguesas de pollo'."
-
-
-
-
-
-
-
-
-            # Paso 4: Confirmación
-            if session["paso"] == 4:
-                if "confirmar" in msg:
-                    resumen = (
-                        f"✅ *Pedido confirmado*\n"
-                        f"👤 Cliente: {session['nombre']}\n"
-                        f"🕒 Hora: {formatear_fecha(session['hora'])}\n"
-                        f"🛒 Carrito:\n{mostrar_carrito(session)}\n"
-                    )
-                    send_to_printer(user_id, session)
-                    SESSIONS.pop(user_id, None)
-                    return resumen
-                elif "cancelar" in msg:
-                    SESSIONS.pop(user_id, None)
-                    return "Pedido cancelado ❌."
-                else:
-                    return "Responde con 'confirmar' o 'cancelar'."
+        session = sessions[user_id]
+        paso = session["paso"] if session["modo"] == "pedido" else 0
+
+        intencion = detectar_intencion(msg)
+        if info is not None:
+            info["paso"], info["intencion"], info["session"] = paso, intencion, session
+        manejador = _manejador(paso, intencion)
+        if manejador is not None:
+            respuesta = manejador(tienda, user_id, session, raw_message, msg)
+            if respuesta is not None:
+                return respuesta
+
+        por_defecto = _DESPACHO.get((paso, None))
+        if por_defecto is not None and por_defecto is not manejador:
+            return por_defecto(tienda, user_id, session, raw_message, msg)
 
         return "No entendí tu mensaje 🤔."
 
     except Exception:
         logging.exception("Error en process_message")
-        return "Hubo un error interno procesando tu mensaje."
\ No newline at end of file
+        return "Hubo un error interno procesando tu mensaje."